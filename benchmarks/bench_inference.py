@@ -0,0 +1,99 @@
+"""
+bench_inference.py
+
+Check that the compiled inference path (flask_app/inference.py) reproduces
+each trained pipeline exactly, and compare single-row latency against
+`pipeline.predict` on a one-row DataFrame.
+
+Input:  models/<name>.pkl (written by evaluate_models.py), script/data/loyers_clean.*
+Usage:  python benchmarks/bench_inference.py [--rows 500] [--repeat 200]
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "flask_app"))
+
+from inference import CompiledModel  # noqa: E402
+from script.loyers_store import load_dataset  # noqa: E402
+
+# === Configuration ===
+DATA_FILE = os.path.join(ROOT, "script/data/loyers_clean")
+MODEL_DIR = os.path.join(ROOT, "models")
+MODEL_NAMES = ["linear_regression", "lasso", "random_forest", "xgboost"]
+
+NUMERIC_FEATURES = ["surface", "nombre_observations", "nombre_logements"]
+CATEGORICAL_FEATURES = [
+    "nombre_pieces",
+    "agglomeration",
+    "zone_complementaire",
+    "type_habitat",
+    "epoque_construction_homogene"
+]
+
+def load_sample(path, rows):
+    df = load_dataset(path, columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES).head(rows).copy()
+    df["nombre_pieces"] = df["nombre_pieces"].astype(str).where(df["nombre_pieces"].notna())
+    return df
+
+def median_latency(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+def bench_model(name, X, repeat):
+    pipeline = joblib.load(os.path.join(MODEL_DIR, f"{name}.pkl"))
+    compiled = CompiledModel(pipeline.named_steps["preprocessor"], pipeline.named_steps["regressor"])
+    records = X.to_dict(orient="records")
+
+    # Exactness: compare against the pipeline scoring the same single row.
+    expected = np.array([pipeline.predict(X.iloc[[i]])[0] for i in range(len(X))])
+    actual = np.array([compiled.predict_one(record) for record in records])
+    mismatches = int(np.sum(expected != actual))
+
+    one_row, record = X.iloc[[0]], records[0]
+    pipeline_s = median_latency(lambda: pipeline.predict(one_row), repeat)
+    compiled_s = median_latency(lambda: compiled.predict_one(record), repeat)
+    return {
+        "model": name,
+        "rows_checked": len(X),
+        "mismatches": mismatches,
+        "pipeline_ms": pipeline_s * 1e3,
+        "compiled_ms": compiled_s * 1e3,
+        "speedup": pipeline_s / compiled_s
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500, help="rows checked for exactness")
+    parser.add_argument("--repeat", type=int, default=200, help="timing repetitions per path")
+    args = parser.parse_args()
+
+    X = load_sample(DATA_FILE, args.rows)
+    results = []
+    for name in MODEL_NAMES:
+        if not os.path.exists(os.path.join(MODEL_DIR, f"{name}.pkl")):
+            print(f"[SKIP] {name}: no trained model in {MODEL_DIR}")
+            continue
+        print(f"[INFO] Benchmarking {name}...")
+        results.append(bench_model(name, X, args.repeat))
+
+    report = pd.DataFrame(results)
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if (report["mismatches"] > 0).any():
+        print("[✗] Compiled predictions differ from pipeline.predict")
+        sys.exit(1)
+    print("[✓] Compiled predictions match pipeline.predict exactly")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+bench_serving.py
+
+Measure memory per worker and throughput of the production server
+(gunicorn -c flask_app/gunicorn.conf.py) as the number of workers grows,
+with the model preloaded in the master (shared copy-on-write) and, for
+comparison, loaded separately by every worker.
+
+For each worker the report gives RSS, PSS (RSS with shared pages split
+between the processes sharing them) and private memory (pages no other
+process shares). Throughput is form predictions per second from concurrent
+clients running on the same machine, with the prediction cache disabled.
+
+Input:  models/best_model.pkl (written by evaluate_models.py)
+Usage:  python benchmarks/bench_serving.py [--workers 1 2 4 8] [--seconds 10]
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import joblib
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# === Configuration ===
+CONFIG_FILE = os.path.join(ROOT, "flask_app", "gunicorn.conf.py")
+MODEL_FILE = os.path.join(ROOT, "models", "best_model.pkl")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def child_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+def memory_mb(pid):
+    """RSS, PSS and private memory of one process, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": fields["Rss"],
+        "pss_mb": fields["Pss"],
+        "private_mb": fields["Private_Clean"] + fields["Private_Dirty"]
+    }
+
+def start_server(workers, preload, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD="1" if preload else "0",
+               GUNICORN_BIND=f"127.0.0.1:{port}", PREDICTION_CACHE_SIZE="0")
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", CONFIG_FILE], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/cache/stats", timeout=1).ok and len(child_pids(server.pid)) == workers:
+                return server, url
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"gunicorn with {workers} workers did not start")
+
+def sample_forms(n):
+    """Random form submissions built from the dropdown values stored in the artifact."""
+    options = joblib.load(MODEL_FILE)["categorical_options"]
+    rng = np.random.default_rng(0)
+    forms = []
+    for _ in range(n):
+        form = {col: str(rng.choice(values)) for col, values in options.items()}
+        form.update(surface=f"{rng.uniform(15, 120):.1f}",
+                    nombre_observations=str(rng.integers(10, 500)),
+                    nombre_logements=str(rng.integers(50, 5000)))
+        forms.append(form)
+    return forms
+
+def load_test(url, forms, clients, seconds):
+    def client(offset):
+        session = requests.Session()
+        latencies, i = [], offset
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            session.post(url, data=forms[i % len(forms)]).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            i += clients
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [lat for result in pool.map(client, range(clients)) for lat in result]
+    return {
+        "requests_per_s": len(latencies) / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1e3,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1e3
+    }
+
+def bench(workers, preload, forms, clients, seconds):
+    server, url = start_server(workers, preload, free_port())
+    try:
+        load_test(url, forms, clients, 1.0)  # warm-up: first requests touch lazily loaded pages
+        throughput = load_test(url, forms, clients, seconds)
+        memory = pd.DataFrame([memory_mb(pid) for pid in child_pids(server.pid)])
+        master = memory_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "workers": workers,
+        "preload": preload,
+        **{f"worker_{col}": memory[col].mean() for col in memory.columns},
+        "total_pss_mb": memory["pss_mb"].sum() + master["pss_mb"],
+        **throughput
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=None, help="concurrent clients (default: 2 per worker)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of each load test")
+    args = parser.parse_args()
+
+    if not os.path.exists(MODEL_FILE):
+        print(f"[✗] No trained model at {MODEL_FILE}; run evaluate_models.py first")
+        sys.exit(1)
+
+    forms = sample_forms(1000)
+    results = []
+    for workers in args.workers:
+        for preload in (True, False):
+            print(f"[INFO] {workers} workers, preload={preload}...")
+            results.append(bench(workers, preload, forms, args.clients or 2 * workers, args.seconds))
+
+    print(f"[INFO] {os.cpu_count()} CPUs, model: {joblib.load(MODEL_FILE)['model_name']}")
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+bench_storage.py
+
+Compare load time and memory of the cleaned dataset stored as Latin-1 CSV
+(the legacy format), Parquet and Feather, for a full read and for the
+column projection used by the training scripts.
+
+Input:  script/data/loyers_clean.* (any supported format)
+Usage:  python benchmarks/bench_storage.py [--repeat 5]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from script.loyers_store import CSV_ENCODING, HAS_PYARROW, load_dataset, write_dataset  # noqa: E402
+
+# === Configuration ===
+DATA_FILE = os.path.join(ROOT, "script/data/loyers_clean")
+TRAINING_COLUMNS = [
+    "surface", "nombre_observations", "nombre_logements", "nombre_pieces", "agglomeration",
+    "zone_complementaire", "type_habitat", "epoque_construction_homogene", "loyer_m2"
+]
+
+def legacy_csv_load(path, columns=None):
+    # What every script did before: parse the whole file, infer dtypes.
+    df = pd.read_csv(path, encoding=CSV_ENCODING)
+    df.columns = df.columns.str.strip().str.lower()
+    return df[columns] if columns is not None else df
+
+def measure(loader, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = loader()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    df = loader()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "load_ms": float(np.median(timings)) * 1e3,
+        "peak_mb": peak / 1024 ** 2,
+        "frame_mb": df.memory_usage(deep=True).sum() / 1024 ** 2
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = load_dataset(DATA_FILE)
+    print(f"[INFO] {len(df)} rows, {df.shape[1]} columns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {"csv": write_dataset(df, os.path.join(tmp, "loyers_clean.csv"))}
+        if HAS_PYARROW:
+            paths["parquet"] = write_dataset(df, os.path.join(tmp, "loyers_clean.parquet"))
+            paths["feather"] = write_dataset(df, os.path.join(tmp, "loyers_clean.feather"))
+        else:
+            print("[WARN] pyarrow is not installed; only the CSV path is measured")
+
+        cases = [("csv (legacy)", "all", lambda: legacy_csv_load(paths["csv"])),
+                 ("csv (legacy)", "training", lambda: legacy_csv_load(paths["csv"], TRAINING_COLUMNS))]
+        for fmt, path in paths.items():
+            cases.append((fmt, "all", lambda path=path: load_dataset(path)))
+            cases.append((fmt, "training", lambda path=path: load_dataset(path, TRAINING_COLUMNS)))
+
+        results = []
+        for fmt, columns, loader in cases:
+            size_mb = os.path.getsize(paths["csv" if fmt.startswith("csv") else fmt]) / 1024 ** 2
+            results.append({"format": fmt, "columns": columns, "file_mb": size_mb, **measure(loader, args.repeat)})
+
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+if __name__ == "__main__":
+    main()
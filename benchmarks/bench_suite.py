@@ -0,0 +1,263 @@
+"""
+bench_suite.py
+
+Reproducible timings and peak memory for the hot paths of the project, saved
+as JSON so that runs can be compared:
+
+- scrub:   loyers_scrub.scrub_file on N raw rows
+- fit:     fitting the preprocessor, then each of the four regressors
+- predict: single-row (pipeline and compiled path) and batch prediction
+           through models/best_model.pkl
+- flask:   end-to-end form and /predict/batch requests through the Flask
+           test client (prediction cache and micro-batching disabled)
+
+Every case runs once untimed to warm up, then `--repeat` timed runs (median,
+min and p95 are reported), then once more under tracemalloc for the peak of
+Python and NumPy allocations (memory allocated inside XGBoost's native code
+is not traced). Inputs are fixed samples of the project data, so two runs on
+the same data and machine measure the same work.
+
+With --compare, every case is checked against a baseline result file. The
+run fails (exit status 1) when a median time grows by more than --threshold
+or a peak memory by more than --memory-threshold.
+
+Input:  script/data/loyers_raw.csv, script/data/loyers_clean.*, models/best_model.pkl
+Output: benchmarks/results/<timestamp>.json (or --output)
+Usage:  python benchmarks/bench_suite.py [--only scrub fit predict flask] [--repeat 5]
+        python benchmarks/bench_suite.py --compare benchmarks/results/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from importlib.metadata import version, PackageNotFoundError
+import numpy as np
+import pandas as pd
+import joblib
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "script"))
+sys.path.insert(0, os.path.join(ROOT, "flask_app"))
+
+from evaluate_models import build_regressors, load_data  # noqa: E402
+from featurize import NUMERICAL_FEATURES, CATEGORICAL_FEATURES, build_preprocessor  # noqa: E402
+from inference import compile_model  # noqa: E402
+from loyers_scrub import scrub_file  # noqa: E402
+
+# === Configuration ===
+RAW_FILE = os.path.join(ROOT, "script/data/loyers_raw.csv")
+DATA_FILE = os.path.join(ROOT, "script/data/loyers_clean")
+MODEL_FILE = os.path.join(ROOT, "models", "best_model.pkl")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+GROUPS = ["scrub", "fit", "predict", "flask"]
+# Peaks below this are allocator noise and never count as a memory regression.
+MEMORY_FLOOR_MB = 1.0
+PACKAGES = ["numpy", "pandas", "scikit-learn", "xgboost", "pyarrow", "flask"]
+
+def measure(func, repeat):
+    """Warm-up run, `repeat` timed runs, then one traced run for peak memory."""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_s": float(np.median(timings)),
+        "min_s": float(np.min(timings)),
+        "p95_s": float(np.percentile(timings, 95)),
+        "repeat": repeat,
+        "peak_mb": peak / 1024 ** 2
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    packages = {}
+    for name in PACKAGES:
+        try:
+            packages[name] = version(name)
+        except PackageNotFoundError:
+            packages[name] = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "packages": packages}
+
+# === Cases ===
+def bench_scrub(args, tmp):
+    if not os.path.exists(RAW_FILE):
+        print(f"[SKIP] scrub: {RAW_FILE} not found; run script/loyers_obtain.py")
+        return {}
+    raw = pd.read_csv(RAW_FILE, encoding="ISO-8859-1", dtype=str, nrows=args.scrub_rows)
+    # Repeat a small file up to the requested size.
+    raw = pd.concat([raw] * -(-args.scrub_rows // len(raw)), ignore_index=True).head(args.scrub_rows)
+    raw_file = os.path.join(tmp, "loyers_raw.csv")
+    raw.to_csv(raw_file, index=False, encoding="ISO-8859-1")
+    clean_file = os.path.join(tmp, "loyers_clean.parquet")
+
+    cases = {f"scrub/{len(raw)}_rows": lambda: scrub_file(raw_file, clean_file)}
+    if args.scrub_chunksize:
+        cases[f"scrub/{len(raw)}_rows_chunked"] = lambda: scrub_file(raw_file, clean_file, args.scrub_chunksize)
+    return {name: measure(func, args.repeat) for name, func in cases.items()}
+
+def bench_fit(args, df):
+    sample = df.sample(n=min(args.fit_rows, len(df)), random_state=42)
+    X, y = sample[NUMERICAL_FEATURES + CATEGORICAL_FEATURES], sample["loyer_m2"]
+    results = {f"fit/preprocessor/{len(X)}_rows": measure(lambda: build_preprocessor().fit_transform(X), args.repeat)}
+    Xt = build_preprocessor().fit_transform(X)
+    for name, regressor in build_regressors().items():
+        # Single-threaded, so timings do not depend on how busy the machine is.
+        if "n_jobs" in regressor.get_params():
+            regressor.set_params(n_jobs=1)
+        results[f"fit/{name}/{len(X)}_rows"] = measure(lambda: regressor.fit(Xt, y), args.repeat)
+    return results
+
+def bench_predict(args, df, artifact):
+    model, preprocessor = artifact["model"], artifact["preprocessor"]
+    compiled = compile_model(preprocessor, model)
+    X = df[NUMERICAL_FEATURES + CATEGORICAL_FEATURES]
+    batch = X.sample(n=args.batch_rows, replace=len(X) < args.batch_rows, random_state=42)
+
+    # Single-row latency is too short to time alone: each run scores 100 rows one by one.
+    rows = [X.iloc[[i % len(X)]] for i in range(100)]
+    records = [row.iloc[0].to_dict() for row in rows]
+    results = {
+        "predict/single_row_x100/pipeline": measure(
+            lambda: [model.predict(preprocessor.transform(row)) for row in rows], args.repeat),
+        f"predict/batch_{len(batch)}_rows": measure(
+            lambda: model.predict(preprocessor.transform(batch)), args.repeat)
+    }
+    if compiled is not None:
+        results["predict/single_row_x100/compiled"] = measure(
+            lambda: [compiled.predict_one(record) for record in records], args.repeat)
+    return results
+
+def bench_flask(args, df):
+    os.environ.update(PREDICTION_CACHE_SIZE="0", MICROBATCH_MAX_SIZE="1", MODEL_WATCH_INTERVAL="0")
+    import app as flask_app
+    client = flask_app.app.test_client()
+
+    X = df[NUMERICAL_FEATURES + CATEGORICAL_FEATURES]
+    forms = [{col: str(value) for col, value in record.items()}
+             for record in X.head(100).to_dict(orient="records")]
+    batch = X.sample(n=args.batch_rows, replace=len(X) < args.batch_rows, random_state=42)
+    batch_csv = batch.to_csv(index=False).encode("ISO-8859-1")
+
+    def post_forms():
+        for form in forms:
+            client.post("/", data=form).close()
+
+    def post_batch():
+        response = client.post("/predict/batch", data=batch_csv, content_type="text/csv")
+        response.get_data()
+
+    return {
+        "flask/form_request_x100": measure(post_forms, args.repeat),
+        f"flask/batch_csv_{len(batch)}_rows": measure(post_batch, args.repeat)
+    }
+
+# === Regression check ===
+def compare(results, baseline, threshold, memory_threshold):
+    """Print the change of every case present in both runs; return the regressed case names."""
+    rows, regressions = [], []
+    for name, current in results["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            continue
+        time_ratio = current["median_s"] / before["median_s"]
+        memory_ratio = current["peak_mb"] / before["peak_mb"] if before["peak_mb"] else 1.0
+        memory_regressed = memory_ratio > 1 + memory_threshold and current["peak_mb"] > MEMORY_FLOOR_MB
+        regressed = time_ratio > 1 + threshold or memory_regressed
+        rows.append({"case": name, "median_ms": current["median_s"] * 1e3,
+                     "baseline_ms": before["median_s"] * 1e3, "time_change": f"{time_ratio - 1:+.1%}",
+                     "peak_mb": current["peak_mb"], "memory_change": f"{memory_ratio - 1:+.1%}",
+                     "status": "REGRESSION" if regressed else "ok"})
+        if regressed:
+            regressions.append(name)
+    if rows:
+        print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=GROUPS, help="benchmark groups to run")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--scrub-rows", type=int, default=100_000, help="raw rows scrubbed")
+    parser.add_argument("--scrub-chunksize", type=int, default=20_000,
+                        help="also time a chunked scrub with this chunk size (0 to skip)")
+    parser.add_argument("--fit-rows", type=int, default=20_000, help="training rows for the fit cases")
+    parser.add_argument("--batch-rows", type=int, default=10_000, help="rows of the batch predict cases")
+    parser.add_argument("--data", default=DATA_FILE,
+                        help="clean dataset for the fit/predict/flask cases (e.g. from script/loyers_synth.py)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="result file to check this run against")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="allowed relative growth of a median time (default: 0.20)")
+    parser.add_argument("--memory-threshold", type=float, default=0.20,
+                        help="allowed relative growth of a peak memory (default: 0.20)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "cases": {}
+    }
+
+    needs_data = {"fit", "predict", "flask"} & set(args.only)
+    df = load_data(args.data) if needs_data else None
+    needs_model = {"predict", "flask"} & set(args.only)
+    if needs_model and not os.path.exists(MODEL_FILE):
+        print(f"[SKIP] predict, flask: no trained model at {MODEL_FILE}; run evaluate_models.py first")
+        args.only = [group for group in args.only if group not in needs_model]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for group in args.only:
+            print(f"[INFO] Running {group} benchmarks...")
+            if group == "scrub":
+                cases = bench_scrub(args, tmp)
+            elif group == "fit":
+                cases = bench_fit(args, df)
+            elif group == "predict":
+                cases = bench_predict(args, df, joblib.load(MODEL_FILE))
+            else:
+                cases = bench_flask(args, df)
+            results["cases"].update(cases)
+
+    table = pd.DataFrame([{"case": name, "median_ms": r["median_s"] * 1e3, "p95_ms": r["p95_s"] * 1e3,
+                           "peak_mb": r["peak_mb"]} for name, r in results["cases"].items()])
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[✓] Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n[INFO] Compared with {args.compare} (commit {baseline['environment'].get('commit')})")
+        regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+        if regressions:
+            print(f"[✗] {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("[✓] No regression")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+compaction.py
+
+Smaller stand-ins for a trained Random Forest, and what they cost.
+
+A forest of 100 fully grown trees makes a large artifact that is slow to
+unpickle, and every single-row prediction walks down to the deepest leaf of
+every tree. Four ways to shrink it, all starting from the trained forest:
+
+- depth capping: every node at a given depth becomes a leaf. Internal nodes
+  already hold the mean target of their samples, so no refit is needed.
+- tree subset selection: greedy forward selection of the trees whose
+  average best predicts a validation set.
+- leaf merging: sibling leaves whose values differ by less than a
+  tolerance are merged into their parent, bottom-up.
+- distillation: a shallow XGBoost model trained on the forest's predictions.
+
+Every candidate is measured on artifact size, load time, compiled
+single-row latency (the app's fast path), batch latency and holdout RMSE.
+"""
+
+import os
+import copy
+import time
+import functools
+import importlib.util
+import tempfile
+
+import numpy as np
+import pandas as pd
+import joblib
+import sklearn
+from sklearn.metrics import mean_squared_error
+from sklearn.pipeline import Pipeline
+from sklearn.tree._tree import Tree
+
+try:
+    from xgboost import XGBRegressor
+except ImportError:
+    XGBRegressor = None
+
+
+# Candidates built by compaction_candidates()
+DEPTHS = [8, 12, 16]
+TREE_COUNTS = [10, 25, 50]
+MERGE_TOLERANCES = [0.25, 0.5, 1.0]  # €/m²
+DISTILL_PARAMS = {"n_estimators": 300, "max_depth": 6, "learning_rate": 0.1}
+
+# === Tree surgery ===
+# Pruning rebuilds sklearn's Cython Tree from its pickled state (a private
+# format whose node layout changes between releases), so it is restricted to
+# the release it was written against.
+TREE_STATE_SKLEARN = (1, 1)
+
+def tree_state_supported():
+    return tuple(int(part) for part in sklearn.__version__.split(".")[:2]) == TREE_STATE_SKLEARN
+
+def check_tree_state_support():
+    if not tree_state_supported():
+        raise RuntimeError(f"Tree surgery supports scikit-learn {'.'.join(map(str, TREE_STATE_SKLEARN))}.x only, "
+                           f"found {sklearn.__version__}")
+
+def _node_depths(tree):
+    depths = np.zeros(tree.node_count, dtype=np.int64)
+    frontier, depth = np.array([0]), 0
+    while len(frontier):
+        depths[frontier] = depth
+        children = np.concatenate([tree.children_left[frontier], tree.children_right[frontier]])
+        frontier, depth = children[children != -1], depth + 1
+    return depths
+
+def _pruned_estimator(estimator, make_leaf):
+    """Copy of a fitted DecisionTreeRegressor in which the nodes flagged by `make_leaf` become leaves."""
+    check_tree_state_support()
+    tree = estimator.tree_
+    state = tree.__getstate__()
+    left, right = tree.children_left, tree.children_right
+
+    # Reachable nodes in depth-first order, with their depth.
+    keep, depths, stack = [], [], [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        keep.append(node)
+        depths.append(depth)
+        if left[node] != -1 and not make_leaf[node]:
+            stack.extend([(right[node], depth + 1), (left[node], depth + 1)])
+    keep = np.asarray(keep)
+    new_index = np.full(tree.node_count, -1, dtype=np.int64)
+    new_index[keep] = np.arange(len(keep))
+
+    nodes = state["nodes"][keep].copy()
+    is_leaf = make_leaf[keep] | (left[keep] == -1)
+    nodes["left_child"] = np.where(is_leaf, -1, new_index[left[keep]])
+    nodes["right_child"] = np.where(is_leaf, -1, new_index[right[keep]])
+    nodes["feature"] = np.where(is_leaf, -2, nodes["feature"])
+    nodes["threshold"] = np.where(is_leaf, -2.0, nodes["threshold"])
+
+    pruned = Tree(tree.n_features, tree.n_classes, tree.n_outputs)
+    pruned.__setstate__({"max_depth": int(max(depths)), "node_count": len(keep), "nodes": nodes,
+                         "values": np.ascontiguousarray(state["values"][keep])})
+    estimator = copy.copy(estimator)
+    estimator.tree_ = pruned
+    return estimator
+
+def _with_estimators(forest, estimators):
+    forest = copy.copy(forest)
+    forest.estimators_ = estimators
+    forest.n_estimators = len(estimators)
+    return forest
+
+def cap_depth(forest, max_depth):
+    return _with_estimators(forest, [_pruned_estimator(e, _node_depths(e.tree_) >= max_depth)
+                                     for e in forest.estimators_])
+
+def merge_leaves(forest, tolerance):
+    estimators = []
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        left, right, value = tree.children_left, tree.children_right, tree.value[:, 0, 0]
+        internal = np.flatnonzero(left != -1)
+        leaf = left == -1
+        # One pass per level, from the bottom up: a parent becomes mergeable
+        # once both its children are leaves.
+        while True:
+            merge = internal[leaf[left[internal]] & leaf[right[internal]] & ~leaf[internal]
+                             & (np.abs(value[left[internal]] - value[right[internal]]) <= tolerance)]
+            if not len(merge):
+                break
+            leaf[merge] = True
+        estimators.append(_pruned_estimator(estimator, leaf))
+    return _with_estimators(forest, estimators)
+
+def select_trees(forest, X_val, y_val, n_trees):
+    """Greedy forward selection: add, one at a time, the tree that most lowers the validation RMSE."""
+    predictions = np.column_stack([e.predict(X_val) for e in forest.estimators_])
+    y_val = np.asarray(y_val)
+    chosen, total = [], np.zeros(len(y_val))
+    remaining = list(range(predictions.shape[1]))
+    for size in range(1, min(n_trees, len(remaining)) + 1):
+        errors = np.mean(((total[:, None] + predictions[:, remaining]) / size - y_val[:, None]) ** 2, axis=0)
+        best = remaining[int(np.argmin(errors))]
+        chosen.append(best)
+        remaining.remove(best)
+        total += predictions[:, best]
+    return _with_estimators(forest, [forest.estimators_[i] for i in chosen])
+
+def distill(forest, X_train, params=DISTILL_PARAMS):
+    """Shallow XGBoost model fitted to the forest's predictions on the training rows."""
+    if XGBRegressor is None:
+        raise ImportError("XGBoost is required for distillation")
+    student = XGBRegressor(random_state=42, verbosity=0, **params)
+    return student.fit(X_train, forest.predict(X_train))
+
+def compaction_candidates(forest, X_train, X_val, y_val):
+    """{name: regressor} for every compaction of `forest`, the forest itself first as `full`."""
+    candidates = {"full": forest}
+    # Depth capping and leaf merging need tree surgery: without it they are skipped.
+    surgery = tree_state_supported()
+    if surgery:
+        for depth in DEPTHS:
+            candidates[f"depth_{depth}"] = cap_depth(forest, depth)
+    else:
+        print(f"[WARN] scikit-learn {sklearn.__version__}: skipping the depth-capped and merged candidates")
+    for n_trees in TREE_COUNTS:
+        candidates[f"trees_{n_trees}"] = select_trees(forest, X_val, y_val, n_trees)
+    if surgery:
+        # Both at once: the best 25 of the depth-12 trees.
+        candidates["depth_12_trees_25"] = select_trees(candidates["depth_12"], X_val, y_val, 25)
+        for tolerance in MERGE_TOLERANCES:
+            candidates[f"merged_{tolerance:g}"] = merge_leaves(forest, tolerance)
+    if XGBRegressor is not None:
+        candidates["distilled_xgb"] = distill(forest, X_train)
+    return candidates
+
+# === Measurement ===
+def _median_seconds(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+@functools.lru_cache(maxsize=None)
+def _serving_inference():
+    """
+    flask_app/inference.py, the serving fast path. flask_app/ is not a package
+    (the Docker image ships that directory alone and its modules import each
+    other flat), so the file is loaded by path, on first use, rather than by
+    putting flask_app/ on sys.path for every importer of this module.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flask_app", "inference.py")
+    spec = importlib.util.spec_from_file_location("flask_app_inference", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def measure_candidate(pipeline, X_eval, y_eval, n_single=200, batch_rows=1000, repeat=5):
+    """Artifact size and load time, compiled single-row and batch latency, and holdout RMSE of a pipeline."""
+    preprocessor, regressor = pipeline.steps[0][1], pipeline.steps[-1][1]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "candidate.pkl")
+        joblib.dump(pipeline, path)
+        size_mb = os.path.getsize(path) / 1024 ** 2
+        start = time.perf_counter()
+        joblib.load(path)
+        load_seconds = time.perf_counter() - start
+
+    compiled = _serving_inference().compile_model(preprocessor, regressor)
+    rows = X_eval.head(n_single).to_dict(orient="records")
+    if compiled is not None:
+        single = lambda: [compiled.predict_one(row) for row in rows]
+    else:
+        single = lambda: [pipeline.predict(X_eval.iloc[i:i + 1]) for i in range(len(rows))]
+    batch = X_eval.head(batch_rows)
+
+    nodes = sum(e.tree_.node_count for e in getattr(regressor, "estimators_", []))
+    return {
+        "size_mb": size_mb,
+        "load_seconds": load_seconds,
+        "single_ms": _median_seconds(single, repeat) / len(rows) * 1000,
+        "batch_ms": _median_seconds(lambda: pipeline.predict(batch), repeat) * 1000,
+        "batch_rows": len(batch),
+        "RMSE": mean_squared_error(y_eval, pipeline.predict(X_eval), squared=False),
+        "trees": len(getattr(regressor, "estimators_", [])) or regressor.get_params().get("n_estimators"),
+        "nodes": nodes or None
+    }
+
+def _split_half(X, y, random_state):
+    order = np.random.default_rng(random_state).permutation(len(X))
+    half = len(X) // 2
+    return X.iloc[order[:half]], X.iloc[order[half:]], y.iloc[order[:half]], y.iloc[order[half:]]
+
+def compact_forest(pipeline, X_train, X_holdout, y_holdout, random_state=42):
+    """
+    Build every candidate from the fitted forest of `pipeline` and measure it.
+    The holdout rows are halved: one half selects trees, the other is the
+    evaluation set. Returns (results DataFrame, {name: Pipeline}).
+    """
+    (preprocessor_name, preprocessor), (regressor_name, forest) = pipeline.steps
+    X_val, X_eval, y_val, y_eval = _split_half(X_holdout, y_holdout, random_state)
+    candidates = compaction_candidates(forest, preprocessor.transform(X_train),
+                                       preprocessor.transform(X_val), y_val)
+
+    rows, pipelines = [], {}
+    for name, regressor in candidates.items():
+        pipelines[name] = Pipeline([(preprocessor_name, preprocessor), (regressor_name, regressor)])
+        rows.append({"candidate": name, **measure_candidate(pipelines[name], X_eval, y_eval)})
+        print(f"[✓] {name}: {rows[-1]['size_mb']:.1f} MB, RMSE {rows[-1]['RMSE']:.4f}, "
+              f"{rows[-1]['single_ms']:.3f} ms/row")
+    results = pd.DataFrame(rows)
+    full = results.iloc[0]
+    results["rmse_change"] = results["RMSE"] / full["RMSE"] - 1
+    results["size_ratio"] = results["size_mb"] / full["size_mb"]
+    return results, pipelines
+
+def choose_candidate(results, rmse_tolerance=0.01):
+    """Smallest candidate whose holdout RMSE is within `rmse_tolerance` of the full forest."""
+    eligible = results[results["rmse_change"] <= rmse_tolerance]
+    return eligible.sort_values(["size_mb", "RMSE"]).iloc[0]["candidate"]
@@ -1,19 +1,29 @@
-    """
+"""
 evaluate_models.py
 
 Train and evaluate regression models on rent prediction data using a full
-preprocessing pipeline (numerical + categorical handling).
+preprocessing pipeline (numerical + categorical handling). The preprocessor
+is fitted once per split (see featurize.py) and shared by every regressor.
 """
 
 import os
+import sys
+import json
+import math
+import time
+import shutil
+import threading
+import resource
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import joblib
-from sklearn.model_selection import train_test_split
+import scipy.sparse as sp
+from sklearn.model_selection import KFold, ParameterGrid, train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.impute import SimpleImputer
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.linear_model import LinearRegression, Lasso
 
@@ -23,115 +33,779 @@ except ImportError:
     print("XGBoost is not installed. Please install it via 'pip install xgboost'")
     exit()
 
+from featurize import NUMERICAL_FEATURES, CATEGORICAL_FEATURES, featurize, matrix_mb
+from compaction import choose_candidate, compact_forest, measure_candidate
+from incremental import update_and_compare
+from intervals import build_intervals, intervals_from_residuals
+from prediction_grid import build_grid, imputed_values
+from streaming import CHUNKSIZE, train_streaming
+from script.loyers_store import load_dataset
+
 # Configuration
-DATA_PATH = "script/data/loyers_clean.csv"
+DATA_PATH = "script/data/loyers_clean"  # .parquet, .feather or .csv
 MODEL_DIR = "models"
 RESULTS_PATH = os.path.join(MODEL_DIR, "evaluation_results.csv")
 BEST_MODEL_PATH = os.path.join(MODEL_DIR, "best_model.pkl")
-
-# Features
-NUMERICAL_FEATURES = ["surface", "nombre_observations", "nombre_logements"]
-CATEGORICAL_FEATURES = [
-    "nombre_pieces", "agglomeration", "zone_complementaire",
-    "type_habitat", "epoque_construction_homogene"
-]
+VERSIONS_DIR = os.path.join(MODEL_DIR, "versions")
+SEARCH_RESULTS_PATH = os.path.join(MODEL_DIR, "search_results.csv")
+COMPACTION_RESULTS_PATH = os.path.join(MODEL_DIR, "compaction_results.csv")
+LAYOUT_RESULTS_PATH = os.path.join(MODEL_DIR, "layout_results.csv")
+INCREMENTAL_RESULTS_PATH = os.path.join(MODEL_DIR, "incremental_results.csv")
+STREAMING_RESULTS_PATH = os.path.join(MODEL_DIR, "streaming_results.csv")
 
 def load_data(path):
-    df = pd.read_csv(path, encoding="ISO-8859-1")
-    df.columns = df.columns.str.strip().str.lower()
+    df = load_dataset(path, columns=NUMERICAL_FEATURES + CATEGORICAL_FEATURES + ["loyer_m2"])
     df = df.dropna(subset=["loyer_m2"])
-    df["nombre_pieces"] = df["nombre_pieces"].astype(str)
+    df["nombre_pieces"] = df["nombre_pieces"].astype(str).where(df["nombre_pieces"].notna())
     return df
 
-def build_preprocessor():
-    numeric_pipeline = Pipeline([
-        ("imputer", SimpleImputer(strategy="mean")),
-        ("scaler", StandardScaler())
-    ])
-    categorical_pipeline = Pipeline([
-        ("imputer", SimpleImputer(strategy="most_frequent")),
-        ("encoder", OneHotEncoder(handle_unknown="ignore", sparse=False))
-    ])
-    return ColumnTransformer([
-        ("num", numeric_pipeline, NUMERICAL_FEATURES),
-        ("cat", categorical_pipeline, CATEGORICAL_FEATURES)
-    ])
-
-def build_models(preprocessor):
+def build_regressors():
     return {
-        "linear_regression": Pipeline([
-            ("preprocessor", preprocessor),
-            ("regressor", LinearRegression())
-        ]),
-        "lasso": Pipeline([
-            ("preprocessor", preprocessor),
-            ("regressor", Lasso(alpha=0.01))
-        ]),
-        "random_forest": Pipeline([
-            ("preprocessor", preprocessor),
-            ("regressor", RandomForestRegressor(n_estimators=100, random_state=42))
-        ]),
-        "xgboost": Pipeline([
-            ("preprocessor", preprocessor),
-            ("regressor", XGBRegressor(n_estimators=100, learning_rate=0.1, random_state=42, verbosity=0))
-        ])
+        "linear_regression": LinearRegression(),
+        "lasso": Lasso(alpha=0.01),
+        "random_forest": RandomForestRegressor(n_estimators=100, random_state=42),
+        "xgboost": XGBRegressor(n_estimators=100, learning_rate=0.1, random_state=42, verbosity=0)
     }
 
+def assemble_pipeline(preprocessor, regressor):
+    """Wrap an already-fitted preprocessor and regressor into a servable Pipeline."""
+    return Pipeline([
+        ("preprocessor", preprocessor),
+        ("regressor", regressor)
+    ])
+
+# Regressors that train and predict on CSR input directly. Anything else gets
+# a dense copy of sparse features, and only at that point.
+SPARSE_CAPABLE = (LinearRegression, Lasso, RandomForestRegressor, XGBRegressor)
+
+def densify_if_needed(model, X):
+    if sp.issparse(X) and not isinstance(model, SPARSE_CAPABLE):
+        return X.toarray()
+    return X
+
 def evaluate_model(model, X_train, X_test, y_train, y_test):
-    model.fit(X_train, y_train)
-    y_pred = model.predict(X_test)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    with MemorySampler() as memory:
+        model.fit(densify_if_needed(model, X_train), y_train)
+    fit_seconds = time.perf_counter() - start
+    fit_cpu_seconds = time.process_time() - cpu_start
+    y_pred = model.predict(densify_if_needed(model, X_test))
     return {
         "MAE": mean_absolute_error(y_test, y_pred),
         "RMSE": mean_squared_error(y_test, y_pred, squared=False),
-        "R2": r2_score(y_test, y_pred)
+        "R2": r2_score(y_test, y_pred),
+        "fit_seconds": fit_seconds,
+        "fit_cpu_seconds": fit_cpu_seconds,
+        "fit_peak_mb": memory.peak_mb
+    }
+
+# === Resource accounting ===
+def current_rss_mb():
+    """Resident set size of the current process in MB, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        return None
+
+class MemorySampler:
+    """
+    Peak growth of the resident set size over a `with` block, sampled from a
+    background thread so that memory allocated by native code (XGBoost,
+    sklearn trees) counts too. Where /proc is unavailable, peak_mb is the
+    growth of the process-wide peak instead, which stays at 0 once an
+    earlier block went higher.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_mb = None
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, current_rss_mb())
+
+    def __enter__(self):
+        self._baseline = current_rss_mb()
+        if self._baseline is None:
+            self._baseline = peak_rss_mb()
+            return self
+        self._peak = self._baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is None:
+            self.peak_mb = peak_rss_mb() - self._baseline
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak_mb = max(self._peak, current_rss_mb()) - self._baseline
+        return False
+
+def measure_serving(pipeline, X_test, y_test, rows=1000):
+    """
+    What a fitted pipeline costs to serve (see compaction.measure_candidate):
+    artifact size and load time, single-row latency on the app's compiled
+    path and per-row latency of a batch, on the first `rows` test rows.
+    """
+    costs = measure_candidate(pipeline, X_test.head(rows), y_test.head(rows), batch_rows=rows)
+    return {
+        "single_ms": costs["single_ms"],
+        "batch_row_ms": costs["batch_ms"] / costs["batch_rows"],
+        "size_mb": costs["size_mb"],
+        "load_seconds": costs["load_seconds"]
     }
 
-def save_model(model, name, directory=MODEL_DIR):
+def select_best(results, max_latency_ms=None, max_size_mb=None):
+    """
+    Model with the highest R2 among the rows of `results` whose single-row
+    latency and artifact size fit the given budgets; None if none fits.
+    """
+    eligible = results
+    if max_latency_ms is not None:
+        eligible = eligible[eligible["single_ms"] <= max_latency_ms]
+    if max_size_mb is not None:
+        eligible = eligible[eligible["size_mb"] <= max_size_mb]
+    if eligible.empty:
+        print("[WARN] No model fits the latency/size budget; best_model.pkl is left unchanged.")
+        return None
+    best_name = eligible.loc[eligible["R2"].idxmax(), "model"]
+    top_name = results.loc[results["R2"].idxmax(), "model"]
+    if best_name != top_name:
+        print(f"[INFO] {top_name} has the best R² but exceeds the budget; selecting {best_name}.")
+    return best_name
+
+def training_record_path(name, directory=MODEL_DIR):
+    return os.path.join(directory, f"{name}.training.json")
+
+def holdout_training(X, test_size=0.2, random_state=42):
+    """Training record of a model fitted on the train side of train_test_split(X, ...)."""
+    return {"fitted_on": "holdout_train", "rows": len(X), "test_size": test_size, "random_state": random_state}
+
+def read_training_record(name, directory=MODEL_DIR):
+    path = training_record_path(name, directory)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_model(model, name, directory=MODEL_DIR, training=None):
+    """
+    Write models/<name>.pkl. `training` records which rows the model was
+    fitted on (e.g. holdout_training(X)), in models/<name>.training.json, so
+    a later stage can tell which rows it has never seen.
+    """
     os.makedirs(directory, exist_ok=True)
     path = os.path.join(directory, f"{name}.pkl")
     joblib.dump(model, path)
+    record_path = training_record_path(name, directory)
+    if training is not None:
+        with open(record_path, "w") as f:
+            json.dump(training, f)
+    elif os.path.exists(record_path):
+        os.remove(record_path)
     print(f"[✓] Saved model to: {path}")
 
-def save_best_model(best_name, best_model):
+def compute_serving_metadata(model, X, y, intervals=None, categorical_options=None):
+    """
+    Everything the web app needs besides the fitted pipeline: the feature
+    schema, the dropdown values, and the per-segment interval table with
+    the residual statistics behind it (see intervals.py). Computed once here
+    so the app never has to read the training CSV. A given `intervals`
+    table is reused instead of being rebuilt; given `categorical_options`
+    replace the dropdown values seen in X.
+    """
+    complete = X.notna().all(axis=1)
+    if intervals is None:
+        print("[INFO] Building prediction intervals from out-of-fold residuals...")
+        intervals, residuals = build_intervals(model, X[complete], y[complete])
+        evaluation = intervals["evaluation"]
+        print(f"[✓] Segment intervals: {evaluation['segment_coverage']:.1%} coverage, "
+              f"mean width {evaluation['segment_width']:.2f} "
+              f"(global ±1.96σ: {evaluation['global_coverage']:.1%}, width {evaluation['global_width']:.2f}) "
+              f"in {intervals['seconds']:.1f}s")
+    else:
+        residuals = y[complete] - model.predict(X[complete])
+    return {
+        "features": {
+            "numerical": list(NUMERICAL_FEATURES),
+            "categorical": list(CATEGORICAL_FEATURES)
+        },
+        "categorical_options": categorical_options or {
+            col: sorted(X[col].dropna().unique().tolist())
+            for col in CATEGORICAL_FEATURES
+        },
+        "residuals": {
+            "mean": float(np.mean(residuals)),
+            "std": float(np.std(residuals)),
+            "count": int(len(residuals))
+        },
+        "intervals": intervals
+    }
+
+def new_version(name):
+    """Unique, sortable version name: <timestamp>-<model name>."""
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}"
+    candidate, n = version, 1
+    while os.path.exists(os.path.join(VERSIONS_DIR, f"{candidate}.pkl")):
+        n += 1
+        candidate = f"{version}-{n}"
+    return candidate
+
+def save_best_model(best_name, best_model, X, y, intervals=None, categorical_options=None, grid=False):
+    """
+    Write the artifact to models/versions/<version>.pkl and, with grid=True,
+    its prediction grid to models/grids/ (see prediction_grid.py), then
+    atomically point best_model.pkl at it. A running Flask app never sees a
+    half-written file and picks up the new version, grid included, on its
+    next check (see flask_app/registry.py).
+    """
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    version = new_version(best_name)
+    version_path = os.path.join(VERSIONS_DIR, f"{version}.pkl")
+    tmp_path = f"{version_path}.tmp"
     joblib.dump({
+        "version": version,
+        "model_name": best_name,
         "model": best_model.named_steps["regressor"],
-        "preprocessor": best_model.named_steps["preprocessor"]
-    }, BEST_MODEL_PATH)
-    print(f"[🏆] Best model saved to: {BEST_MODEL_PATH}")
+        "preprocessor": best_model.named_steps["preprocessor"],
+        **compute_serving_metadata(best_model, X, y, intervals, categorical_options)
+    }, tmp_path)
+    os.replace(tmp_path, version_path)
+    if grid:
+        build_grid(best_model.predict, X, version, imputed_values(best_model.named_steps["preprocessor"]), best_name)
 
-def main():
-    df = load_data(DATA_PATH)
-    X = df[NUMERICAL_FEATURES + CATEGORICAL_FEATURES]
-    y = df["loyer_m2"]
+    # Hard link (a copy where links are unsupported) renamed over the old file.
+    tmp_path = f"{BEST_MODEL_PATH}.tmp"
+    try:
+        os.link(version_path, tmp_path)
+    except OSError:
+        shutil.copyfile(version_path, tmp_path)
+    os.replace(tmp_path, BEST_MODEL_PATH)
+    print(f"[🏆] Best model saved to: {BEST_MODEL_PATH} (version {version})")
+
+# === Cross-validation ===
+# Featurized folds handed to each worker process once, at pool start-up. With
+# the "fork" start method they are inherited copy-on-write and never pickled;
+# jobs only carry the model name and fold number.
+_WORKER_DATA = {}
+
+def _init_cv_worker(folds):
+    _WORKER_DATA["folds"] = folds
+
+def _run_cv_job(name, fold):
+    features, y_train, y_test = _WORKER_DATA["folds"][fold]
+    regressor = build_regressors()[name]
+    # One process per job already uses every core; keep estimators single-threaded.
+    if "n_jobs" in regressor.get_params():
+        regressor.set_params(n_jobs=1)
+
+    start = time.perf_counter()
+    metrics = evaluate_model(regressor, features.X_train, features.X_test, y_train, y_test)
+    residuals = y_test.to_numpy() - regressor.predict(densify_if_needed(regressor, features.X_test))
+    return {"model": name, "fold": fold, **metrics, "seconds": time.perf_counter() - start}, residuals
+
+def cross_validate_models(X, y, n_splits=5, workers=None, sparse=False):
+    """
+    Run every (model, fold) pair as an independent job in a process pool.
+    Returns (results, residuals): per-fold rows followed by mean/std rows for
+    each model, and {model: out-of-fold residual of every row of X}.
+    """
+    splits = list(KFold(n_splits=n_splits, shuffle=True, random_state=42).split(X))
+    names = list(build_regressors())
+    context = (multiprocessing.get_context("fork")
+               if "fork" in multiprocessing.get_all_start_methods() else None)
+
+    start = time.perf_counter()
+    folds = [
+        (featurize(X.iloc[train_idx], X.iloc[test_idx], sparse=sparse), y.iloc[train_idx], y.iloc[test_idx])
+        for train_idx, test_idx in splits
+    ]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_cv_worker, initargs=(folds,)) as pool:
+        futures = [
+            pool.submit(_run_cv_job, name, fold)
+            for name in names
+            for fold in range(n_splits)
+        ]
+        outputs = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - start
+
+    rows = [row for row, _ in outputs]
+    residuals = {name: np.empty(len(X)) for name in names}
+    for row, fold_residuals in outputs:
+        residuals[row["model"]][splits[row["fold"]][1]] = fold_residuals
+
+    per_fold = pd.DataFrame(rows)
+    columns = ["MAE", "RMSE", "R2", "fit_seconds", "fit_cpu_seconds", "fit_peak_mb", "seconds"]
+    summary = per_fold.groupby("model", sort=False)[columns].agg(["mean", "std"])
+    summary_rows = [
+        {"model": name, "fold": stat, **{col: summary.loc[name, (col, stat)] for col in columns}}
+        for name in summary.index
+        for stat in ("mean", "std")
+    ]
+    results = pd.concat([per_fold, pd.DataFrame(summary_rows)], ignore_index=True)
+    results["wall_seconds"] = wall_seconds
+    return results, residuals
 
+def run_cross_validation(X, y, n_splits, workers, sparse=False, grid=False):
+    print(f"\n[Cross-validation] {n_splits} folds, {workers or os.cpu_count()} workers")
+    results, residuals = cross_validate_models(X, y, n_splits=n_splits, workers=workers, sparse=sparse)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    results.to_csv(RESULTS_PATH, index=False)
+    print(results[results["fold"] == "mean"].to_string(index=False))
+    print(f"\n[✓] Evaluation results saved to: {RESULTS_PATH} "
+          f"({results['wall_seconds'].iloc[0]:.1f}s wall-clock)")
+
+    # Select on mean R2 across folds, then refit the winner on all the data.
+    means = results[results["fold"] == "mean"].set_index("model")
+    best_name = means["R2"].idxmax()
+    print(f"\n[Training] {best_name} on the full dataset")
+    features = featurize(X, sparse=sparse)
+    regressor = build_regressors()[best_name]
+    regressor.fit(densify_if_needed(regressor, features.X_train), y)
+    best_model = assemble_pipeline(features.preprocessor, regressor)
+    save_model(best_model, best_name, training={"fitted_on": "all", "rows": len(X)})
+    # The folds already scored every row out of fold: no refits for the intervals.
+    complete = X.notna().all(axis=1).to_numpy()
+    intervals = intervals_from_residuals(X[complete], residuals[best_name][complete], n_splits)
+    print(f"[✓] Segment intervals from the cross-validation residuals: "
+          f"{intervals['evaluation']['segment_coverage']:.1%} coverage")
+    save_best_model(best_name, best_model, X, y, intervals=intervals, grid=grid)
+
+def run_holdout(X, y, sparse=False, params=None, budget=None, grid=False):
+    """
+    Train every model on one train/test split and record what it costs to
+    train and serve; `params` overrides per model (e.g. search results),
+    `budget` ({"max_latency_ms", "max_size_mb"}) restricts which model is
+    published (see select_best).
+    """
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
 
-    preprocessor = build_preprocessor()
-    models = build_models(preprocessor)
+    features = featurize(X_train, X_test, sparse=sparse)
+    params = params or {}
 
     results = []
-    best_r2 = float("-inf")
-    best_model = None
-    best_name = ""
+    models = {}
 
-    for name, model in models.items():
+    for name, regressor in build_regressors().items():
         print(f"\n[Training] {name}")
-        metrics = evaluate_model(model, X_train, X_test, y_train, y_test)
-        results.append({"model": name, **metrics})
-        save_model(model, name)
-
-        if metrics["R2"] > best_r2:
-            best_r2 = metrics["R2"]
-            best_model = model
-            best_name = name
+        regressor.set_params(**params.get(name, {}))
+        metrics = evaluate_model(regressor, features.X_train, features.X_test, y_train, y_test)
+        model = assemble_pipeline(features.preprocessor, regressor)
+        row = {"model": name, **metrics, **measure_serving(model, X_test, y_test)}
+        if params:
+            row["params"] = json.dumps(params.get(name, {}), sort_keys=True)
+        results.append(row)
+        print(f"[✓] R² {row['R2']:.3f}, fit {row['fit_seconds']:.1f}s (+{row['fit_peak_mb']:.0f} MB), "
+              f"{row['single_ms']:.3f} ms/row, {row['size_mb']:.1f} MB")
+        save_model(model, name, training=holdout_training(X))
+        models[name] = model
 
-    pd.DataFrame(results).to_csv(RESULTS_PATH, index=False)
+    results = pd.DataFrame(results)
+    results.to_csv(RESULTS_PATH, index=False)
     print(f"\n[✓] Evaluation results saved to: {RESULTS_PATH}")
 
-    if best_model is not None:
-        save_best_model(best_name, best_model)
+    best_name = select_best(results, **(budget or {}))
+    if best_name is not None:
+        save_best_model(best_name, models[best_name], X, y, grid=grid)
+
+# === Hyperparameter search ===
+# Search space per model, and the budget successive halving grows from one
+# rung to the next: training rows, or trees for the ensembles. Models without
+# an entry keep their build_regressors() settings.
+SEARCH_SPACES = {
+    "lasso": {
+        "resource": "rows",
+        "params": {"alpha": [1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1]}
+    },
+    "random_forest": {
+        "resource": "trees",
+        "params": {
+            "max_features": [1.0, 0.5, 0.3],
+            "min_samples_leaf": [1, 2, 5],
+            "max_depth": [None, 20]
+        }
+    },
+    "xgboost": {
+        "resource": "trees",
+        "params": {
+            "learning_rate": [0.03, 0.1, 0.3],
+            "max_depth": [4, 6, 8],
+            "subsample": [0.8, 1.0],
+            "colsample_bytree": [0.8, 1.0]
+        }
+    }
+}
+
+class SearchStore:
+    """
+    Every evaluated (data, model, params, budget) result, appended to a CSV as
+    soon as it is known, so an interrupted or repeated search skips the
+    configurations it has already trained.
+    """
+
+    COLUMNS = ["data_key", "model", "params", "resource", "budget", "MAE", "RMSE", "R2", "fit_seconds"]
+
+    def __init__(self, path=SEARCH_RESULTS_PATH):
+        self.path = path
+        self._rows = {}
+        if os.path.exists(path):
+            for row in pd.read_csv(path).to_dict(orient="records"):
+                self._rows[self._key(row)] = row
+
+    @staticmethod
+    def _key(row):
+        return row["data_key"], row["model"], row["params"], int(row["budget"])
+
+    def get(self, data_key, model, params, budget):
+        return self._rows.get((data_key, model, params, budget))
+
+    def add(self, row):
+        self._rows[self._key(row)] = row
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        pd.DataFrame([row], columns=self.COLUMNS).to_csv(
+            self.path, mode="a", header=not os.path.exists(self.path), index=False
+        )
+
+def budget_schedule(min_budget, max_budget, factor):
+    """Geometric budgets ending at max_budget, e.g. (25, 300, 3) -> [33, 100, 300]."""
+    budgets = [max_budget]
+    while budgets[0] // factor >= min_budget:
+        budgets.insert(0, budgets[0] // factor)
+    return budgets
+
+def _init_search_worker(split):
+    _WORKER_DATA["search"] = split
+
+def _run_search_job(name, params, resource, budget):
+    X_fit, X_val, y_fit, y_val = _WORKER_DATA["search"]
+    regressor = build_regressors()[name].set_params(**json.loads(params))
+    if "n_jobs" in regressor.get_params():
+        regressor.set_params(n_jobs=1)
+    if resource == "trees":
+        regressor.set_params(n_estimators=budget)
+    else:
+        # The fit split is already shuffled, so its first rows are a random sample.
+        X_fit, y_fit = X_fit[:budget], y_fit.iloc[:budget]
+    metrics = evaluate_model(regressor, X_fit, X_val, y_fit, y_val)
+    return {"model": name, "params": params, "resource": resource, "budget": budget, **metrics}
+
+def successive_halving(X, y, workers=None, sparse=False, candidates=None, min_trees=25,
+                       max_trees=300, min_rows=1000, factor=3, store=None):
+    """
+    Search SEARCH_SPACES on a validation split carved out of (X, y). Every
+    candidate is trained on the smallest budget, then only the best
+    1/factor of them move on to a `factor` times larger budget, until the
+    survivors are trained on the full budget. All models advance through
+    their rungs together, each rung's jobs running in a process pool.
+    Returns the best parameters per model, at full budget.
+    """
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    features = featurize(X_fit, X_val, sparse=sparse)
+    store = store or SearchStore()
+    rng = np.random.default_rng(42)
+
+    state = {}
+    for name, space in SEARCH_SPACES.items():
+        grid = [json.dumps(params, sort_keys=True) for params in ParameterGrid(space["params"])]
+        if candidates and candidates < len(grid):
+            grid = [grid[i] for i in sorted(rng.choice(len(grid), candidates, replace=False))]
+        max_budget = max_trees if space["resource"] == "trees" else len(y_fit)
+        min_budget = min(min_trees if space["resource"] == "trees" else min_rows, max_budget)
+        state[name] = {"resource": space["resource"], "alive": grid,
+                       "budgets": budget_schedule(min_budget, max_budget, factor)}
+        print(f"[INFO] {name}: {len(grid)} candidates, {space['resource']} budgets {state[name]['budgets']}")
+
+    context = (multiprocessing.get_context("fork")
+               if "fork" in multiprocessing.get_all_start_methods() else None)
+    split = (features.X_train, features.X_test, y_fit, y_val)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_search_worker, initargs=(split,)) as pool:
+        while any(s["budgets"] for s in state.values()):
+            scores, futures = {}, []
+            for name, s in state.items():
+                if not s["budgets"]:
+                    continue
+                budget = s["budgets"][0]
+                for params in s["alive"]:
+                    cached = store.get(features.key, name, params, budget)
+                    if cached is not None:
+                        scores[name, params] = cached["RMSE"]
+                    else:
+                        futures.append(pool.submit(_run_search_job, name, params, s["resource"], budget))
+            for future in futures:
+                row = {"data_key": features.key, **future.result()}
+                store.add(row)
+                scores[row["model"], row["params"]] = row["RMSE"]
+
+            for name, s in state.items():
+                if not s["budgets"]:
+                    continue
+                budget = s["budgets"].pop(0)
+                ranked = sorted(s["alive"], key=lambda params: scores[name, params])
+                keep = max(1, math.ceil(len(ranked) / factor)) if s["budgets"] else 1
+                s["alive"] = ranked[:keep]
+                print(f"[INFO] {name} @ {budget} {s['resource']}: best RMSE {scores[name, ranked[0]]:.4f}, "
+                      f"{keep} of {len(ranked)} kept")
+
+    best = {}
+    for name, s in state.items():
+        best[name] = json.loads(s["alive"][0])
+        if s["resource"] == "trees":
+            best[name]["n_estimators"] = max_trees
+    return best
+
+def run_search(X, y, workers=None, sparse=False, budget=None, grid=False, **search_options):
+    """Tune on the training split only, then train and select as in run_holdout."""
+    print(f"\n[Search] successive halving, {workers or os.cpu_count()} workers")
+    X_train, _, y_train, _ = train_test_split(X, y, test_size=0.2, random_state=42)
+    start = time.perf_counter()
+    best_params = successive_halving(X_train, y_train, workers=workers, sparse=sparse, **search_options)
+    print(f"[✓] Search finished in {time.perf_counter() - start:.1f}s; results stored in {SEARCH_RESULTS_PATH}")
+    for name, params in best_params.items():
+        print(f"    {name}: {params}")
+    run_holdout(X, y, sparse=sparse, params=best_params, budget=budget, grid=grid)
+
+# === Incremental retraining ===
+INCREMENTAL_MODELS = ["random_forest", "xgboost"]
+
+def run_incremental(X, y, new_path, n_new=20, compare=True, grid=False):
+    """
+    Update the saved RandomForest and XGBoost pipelines with the rows of
+    `new_path` (trees appended / boosting continued), report time saved and
+    metric drift against a full retrain, and refresh best_model.pkl if its
+    model was updated.
+    """
+    new = load_data(new_path)
+    X_new, y_new = new[NUMERICAL_FEATURES + CATEGORICAL_FEATURES], new["loyer_m2"]
+
+    reports, updated = [], {}
+    for name in INCREMENTAL_MODELS:
+        path = os.path.join(MODEL_DIR, f"{name}.pkl")
+        if not os.path.exists(path):
+            print(f"[SKIP] {name}: no trained model at {path}")
+            continue
+        print(f"\n[Incremental] {name} + {len(new)} new rows")
+        updated[name], report = update_and_compare(joblib.load(path), X, y, X_new, y_new,
+                                                   n_new=n_new, compare=compare)
+        reports.append(report.assign(model=name))
+        # The new rows are not part of X: the rows held out of X stay unseen.
+        save_model(updated[name], name, training=read_training_record(name))
+
+    if not reports:
+        return
+    results = pd.concat(reports, ignore_index=True)
+    results = results[["model"] + [col for col in results.columns if col != "model"]]
+    results.to_csv(INCREMENTAL_RESULTS_PATH, index=False)
+    print(results.to_string(index=False))
+    print(f"\n[✓] Incremental results saved to: {INCREMENTAL_RESULTS_PATH}")
+
+    if os.path.exists(BEST_MODEL_PATH):
+        best = joblib.load(BEST_MODEL_PATH)
+        if best["model_name"] in updated:
+            # Rebuilding the intervals would refit from scratch K times, the
+            # cost incremental mode avoids; the current table is kept.
+            save_best_model(best["model_name"], updated[best["model_name"]], pd.concat([X, X_new]),
+                            pd.concat([y, y_new]), intervals=best.get("intervals"), grid=grid)
+
+# === Random Forest compaction ===
+def run_compaction(X, y, rmse_tolerance=0.01, grid=False):
+    """
+    Shrink the saved random_forest pipeline (see compaction.py), measure every
+    candidate on the holdout rows of run_holdout's split, and serve the
+    smallest one whose RMSE is within `rmse_tolerance` of the full forest.
+    """
+    path = os.path.join(MODEL_DIR, "random_forest.pkl")
+    if not os.path.exists(path):
+        print(f"[SKIP] No trained forest at {path}; run evaluate_models.py first.")
+        return
+    # The candidates must be scored on rows the forest never saw.
+    training = read_training_record("random_forest")
+    if training is not None and training["fitted_on"] == "all":
+        print("[SKIP] The saved forest was refit on every row (--cv), so there are no held-out rows to "
+              "compare the candidates on; retrain it without --cv first.")
+        return
+    if training is None or training.get("rows") != len(X):
+        print("[WARN] Cannot tell which rows the saved forest was trained on; the holdout rows may include "
+              "training rows and the RMSE comparison may be optimistic.")
+        training = holdout_training(X)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=training["test_size"],
+                                                        random_state=training["random_state"])
+    pipeline = joblib.load(path)
+    print(f"\n[Compaction] random_forest ({len(pipeline.named_steps['regressor'].estimators_)} trees)")
+    results, pipelines = compact_forest(pipeline, X_train, X_test, y_test)
+    results.to_csv(COMPACTION_RESULTS_PATH, index=False)
+    print(results[["candidate", "size_mb", "load_seconds", "single_ms", "batch_ms", "RMSE", "rmse_change"]]
+          .to_string(index=False))
+    print(f"\n[✓] Compaction results saved to: {COMPACTION_RESULTS_PATH}")
+
+    chosen = choose_candidate(results, rmse_tolerance)
+    if chosen == "full":
+        print(f"[INFO] No candidate keeps RMSE within {rmse_tolerance:.1%}; the full forest is kept.")
+        return
+    # Out-of-fold intervals refit the pipeline from scratch, which would give a
+    # full forest again: the compact model gets the forest's interval table.
+    best = joblib.load(BEST_MODEL_PATH) if os.path.exists(BEST_MODEL_PATH) else {}
+    intervals = best.get("intervals") if best.get("model_name") == "random_forest" else None
+    if intervals is None:
+        intervals, _ = build_intervals(pipeline, X, y)
+    save_best_model(f"random_forest_{chosen}", pipelines[chosen], X, y, intervals=intervals, grid=grid)
+
+# === Out-of-core training ===
+STREAMING_MODELS = ["linear_regression", "lasso", "xgboost"]
+
+def run_streaming(path, chunksize=CHUNKSIZE, budget=None, grid=False):
+    """
+    Train the linear and XGBoost models without loading the dataset (see
+    streaming.py) and publish the best one. Intervals and the prediction
+    grid are built from a bounded uniform sample of the rows; the dropdown
+    values come from the categories discovered over the whole file.
+    Serving costs are measured on that sample.
+    """
+    regressors = {name: model for name, model in build_regressors().items() if name in STREAMING_MODELS}
+    print(f"[INFO] Streaming {path} in chunks of {chunksize} rows")
+    preprocessor, fitted, results, sample = train_streaming(path, regressors, chunksize, memory=MemorySampler)
+    X_sample, y_sample = sample[NUMERICAL_FEATURES + CATEGORICAL_FEATURES], sample["loyer_m2"]
+    serving = [measure_serving(assemble_pipeline(preprocessor, fitted[name]), X_sample, y_sample)
+               for name in results["model"]]
+    results = pd.concat([results, pd.DataFrame(serving)], axis=1)
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    results.to_csv(STREAMING_RESULTS_PATH, index=False)
+    print(results.to_string(index=False))
+    print(f"\n[✓] Streaming results saved to: {STREAMING_RESULTS_PATH}")
+    for name, regressor in fitted.items():
+        save_model(assemble_pipeline(preprocessor, regressor), name)
+
+    best_name = select_best(results, **(budget or {}))
+    if best_name is None:
+        return
+    encoder = preprocessor.named_transformers_["cat"].named_steps["encoder"]
+    options = {col: values.tolist() for col, values in zip(CATEGORICAL_FEATURES, encoder.categories_)}
+    save_best_model(best_name, assemble_pipeline(preprocessor, fitted[best_name]), X_sample, y_sample,
+                    categorical_options=options, grid=grid)
+
+# === Dense vs sparse comparison ===
+def peak_rss_mb():
+    """Peak resident set size of the current process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def _init_layout_worker(split):
+    _WORKER_DATA["split"] = split
+
+def _run_layout_job(name, layout):
+    X_train, X_test, y_train, y_test = _WORKER_DATA["split"]
+    baseline_mb = peak_rss_mb()
+    features = featurize(X_train, X_test, sparse=(layout == "sparse"))
+    metrics = evaluate_model(build_regressors()[name], features.X_train, features.X_test, y_train, y_test)
+    return {
+        "model": name,
+        "layout": layout,
+        **metrics,
+        "feature_mb": matrix_mb(features.X_train),
+        "peak_rss_mb": peak_rss_mb() - baseline_mb
+    }
+
+def compare_layouts(X, y):
+    """
+    Train every model on dense and on CSR features and record fit time and
+    peak memory. Each (model, layout) pair runs in a fresh process so its
+    peak RSS is not masked by an earlier, larger job.
+    """
+    split = train_test_split(X, y, test_size=0.2, random_state=42)
+    context = (multiprocessing.get_context("fork")
+               if "fork" in multiprocessing.get_all_start_methods() else None)
+
+    rows = []
+    for name in build_regressors():
+        for layout in ("dense", "sparse"):
+            print(f"[Training] {name} ({layout})")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                     initializer=_init_layout_worker, initargs=(split,)) as pool:
+                rows.append(pool.submit(_run_layout_job, name, layout).result())
+    return pd.DataFrame(rows)
+
+def run_layout_comparison(X, y):
+    results = compare_layouts(X, y)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    results.to_csv(LAYOUT_RESULTS_PATH, index=False)
+    print(results[["model", "layout", "RMSE", "fit_seconds", "feature_mb", "peak_rss_mb"]].to_string(index=False))
+    print(f"\n[✓] Dense vs sparse results saved to: {LAYOUT_RESULTS_PATH}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train and evaluate the rent prediction models.")
+    parser.add_argument("--data", default=DATA_PATH,
+                        help="dataset to train on, e.g. a synthetic one from script/loyers_synth.py")
+    parser.add_argument("--cv", type=int, default=0, metavar="K",
+                        help="run K-fold cross-validation instead of a single train/test split")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for cross-validation and search (default: all cores)")
+    parser.add_argument("--sparse", action="store_true",
+                        help="keep one-hot features as CSR matrices end-to-end")
+    parser.add_argument("--compare-layouts", action="store_true",
+                        help="report fit time and peak memory for dense vs sparse features")
+    parser.add_argument("--incremental", metavar="NEW_DATA",
+                        help="update the saved random_forest/xgboost models with the rows of this dataset")
+    parser.add_argument("--new-trees", type=int, default=20,
+                        help="trees / boosting rounds trained on the new rows in incremental mode")
+    parser.add_argument("--no-compare", action="store_true",
+                        help="skip the full retrain used to report time saved and metric drift")
+    parser.add_argument("--compact", action="store_true",
+                        help="build smaller versions of the saved random forest and serve the best one")
+    parser.add_argument("--rmse-tolerance", type=float, default=0.01,
+                        help="largest relative RMSE increase a compacted forest may have")
+    parser.add_argument("--stream", action="store_true",
+                        help="train the linear and XGBoost models out of core, reading the data in chunks")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows per chunk in streaming mode")
+    parser.add_argument("--grid", action="store_true",
+                        help="also precompute the published model's prediction grid (see prediction_grid.py)")
+    parser.add_argument("--max-latency-ms", type=float, default=None,
+                        help="publish the most accurate model whose single-row prediction takes at most this long")
+    parser.add_argument("--max-size-mb", type=float, default=None,
+                        help="publish the most accurate model whose artifact is at most this large")
+    parser.add_argument("--search", action="store_true",
+                        help="tune hyperparameters with successive halving before training")
+    parser.add_argument("--candidates", type=int, default=None,
+                        help="configurations sampled per model (default: the whole grid)")
+    parser.add_argument("--min-trees", type=int, default=25, help="smallest tree budget of the search")
+    parser.add_argument("--max-trees", type=int, default=300, help="tree budget of the final rung")
+    parser.add_argument("--min-rows", type=int, default=1000, help="smallest row budget of the search")
+    parser.add_argument("--halving-factor", type=int, default=3,
+                        help="keep 1/factor of the candidates and multiply the budget by factor per rung")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    budget = {"max_latency_ms": args.max_latency_ms, "max_size_mb": args.max_size_mb}
+    if args.stream:
+        run_streaming(args.data, args.chunksize, budget, grid=args.grid)
+        return
+    df = load_data(args.data)
+    X = df[NUMERICAL_FEATURES + CATEGORICAL_FEATURES]
+    y = df["loyer_m2"]
+
+    if args.incremental:
+        run_incremental(X, y, args.incremental, args.new_trees, compare=not args.no_compare, grid=args.grid)
+    elif args.compact:
+        run_compaction(X, y, args.rmse_tolerance, grid=args.grid)
+    elif args.compare_layouts:
+        run_layout_comparison(X, y)
+    elif args.search:
+        run_search(X, y, args.workers, sparse=args.sparse, budget=budget, grid=args.grid, candidates=args.candidates,
+                   min_trees=args.min_trees, max_trees=args.max_trees,
+                   min_rows=args.min_rows, factor=args.halving_factor)
+    elif args.cv > 1:
+        run_cross_validation(X, y, args.cv, args.workers, sparse=args.sparse, grid=args.grid)
+    else:
+        run_holdout(X, y, sparse=args.sparse, budget=budget, grid=args.grid)
 
 if __name__ == "__main__":
     main()
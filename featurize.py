@@ -0,0 +1,105 @@
+"""
+featurize.py
+
+Shared featurization stage for every training script.
+
+The preprocessor (imputation, scaling, one-hot encoding) is fitted once per
+train/test split and the transformed matrices are cached on disk, keyed by a
+content hash of the data and of the preprocessing configuration. All
+regressors of a run, and later runs on the same split, reuse the cached
+matrices instead of refitting the preprocessor.
+"""
+
+import os
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import joblib
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+# Configuration
+FEATURE_CACHE_DIR = os.path.join("models", "feature_cache")
+
+# Features
+NUMERICAL_FEATURES = ["surface", "nombre_observations", "nombre_logements"]
+CATEGORICAL_FEATURES = [
+    "nombre_pieces", "agglomeration", "zone_complementaire",
+    "type_habitat", "epoque_construction_homogene"
+]
+
+def build_preprocessor(sparse=False):
+    """
+    With sparse=True the one-hot block stays sparse and the whole output is
+    a CSR matrix, instead of a mostly-zero dense float64 array.
+    """
+    numeric_pipeline = Pipeline([
+        ("imputer", SimpleImputer(strategy="mean")),
+        ("scaler", StandardScaler())
+    ])
+    categorical_pipeline = Pipeline([
+        ("imputer", SimpleImputer(strategy="most_frequent")),
+        ("encoder", OneHotEncoder(handle_unknown="ignore", sparse=sparse))
+    ])
+    return ColumnTransformer([
+        ("num", numeric_pipeline, NUMERICAL_FEATURES),
+        ("cat", categorical_pipeline, CATEGORICAL_FEATURES)
+    ], sparse_threshold=1.0 if sparse else 0.3)
+
+def matrix_mb(X):
+    """In-memory size of a dense or CSR feature matrix, in MB."""
+    if sp.issparse(X):
+        return (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1024 ** 2
+    return X.nbytes / 1024 ** 2
+
+@dataclass
+class FeatureSet:
+    preprocessor: ColumnTransformer
+    X_train: Any
+    X_test: Optional[Any]
+    key: str
+
+def _hash_frame(digest, df):
+    digest.update(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+def feature_key(preprocessor, X_train, X_test=None):
+    """Content hash of the split and of the (unfitted) preprocessor configuration."""
+    digest = hashlib.sha256()
+    digest.update(joblib.hash(preprocessor).encode())
+    _hash_frame(digest, X_train)
+    if X_test is not None:
+        _hash_frame(digest, X_test)
+    return digest.hexdigest()[:32]
+
+def featurize(X_train, X_test=None, preprocessor=None, sparse=False, cache_dir=FEATURE_CACHE_DIR):
+    """
+    Fit the preprocessor on X_train and transform both splits, or load the
+    result of an identical earlier call from the on-disk cache.
+    Pass cache_dir=None to disable caching.
+    """
+    preprocessor = preprocessor if preprocessor is not None else build_preprocessor(sparse=sparse)
+    key = feature_key(preprocessor, X_train, X_test)
+    path = os.path.join(cache_dir, f"{key}.joblib") if cache_dir else None
+
+    if path and os.path.exists(path):
+        print(f"[✓] Loaded cached features: {path}")
+        fitted, Xt_train, Xt_test = joblib.load(path)
+        return FeatureSet(fitted, Xt_train, Xt_test, key)
+
+    Xt_train = preprocessor.fit_transform(X_train)
+    Xt_test = preprocessor.transform(X_test) if X_test is not None else None
+
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write then rename, so concurrent runs never read a partial file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump((preprocessor, Xt_train, Xt_test), tmp_path)
+        os.replace(tmp_path, path)
+        print(f"[✓] Cached features: {path}")
+    return FeatureSet(preprocessor, Xt_train, Xt_test, key)
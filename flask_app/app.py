@@ -1,46 +1,273 @@
 import os
-import joblib
+import json
+import time
+import shutil
+import tempfile
+import threading
+from itertools import chain
 import numpy as np
 import pandas as pd
-from flask import Flask, render_template, request
+from flask import Flask, Response, g, jsonify, render_template, request
 
+from batcher import MicroBatcher
+from cache import PredictionCache
+from metrics import MetricsRegistry
+from profiler import MAX_SECONDS as MAX_PROFILE_SECONDS, MIN_INTERVAL as MIN_PROFILE_INTERVAL, StackSampler
+from registry import ModelRegistry
+
+APP_STARTED = time.perf_counter()
 app = Flask(__name__)
 
+# === Instrumentation ===
+# Exposed in the Prometheus text format on /metrics.
+metrics = MetricsRegistry("loyers")
+REQUESTS = metrics.counter("http_requests_total", "HTTP requests by endpoint, method and status code.",
+                           ("endpoint", "method", "status"))
+REQUEST_ERRORS = metrics.counter("http_request_errors_total", "Requests answered with a 5xx status.", ("endpoint",))
+REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds",
+                                    "Time to build the response (streamed bodies excluded).", ("endpoint",))
+STAGE_SECONDS = metrics.histogram("stage_duration_seconds", "Time spent in each prediction stage.", ("stage",))
+INPUT_ISSUES = metrics.counter("input_issues_total", "Input values that were missing, or not numeric and read as NaN.",
+                               ("column", "issue"))
+MODEL_INFO = metrics.gauge("model_info", "Served model version (always 1).", ("version", "model_name"))
+MODEL_LOADED = metrics.gauge("model_loaded_timestamp_seconds", "When the served model was loaded.")
+MODEL_STARTUP = metrics.gauge("model_startup_seconds", "Time to load, compile and warm the served model.", ("phase",))
+MODEL_SWAPS = metrics.counter("model_swaps_total", "Model versions swapped in, including the first.")
+APP_STARTUP = metrics.gauge("app_startup_seconds", "Time from importing app.py to serving the first model.")
+PROCESS_INFO = metrics.gauge("process_info", "Process that rendered this scrape (always 1).", ("pid",))
+CACHE_STATS = metrics.gauge("prediction_cache", "Prediction cache statistics (see /cache/stats).", ("stat",))
+BATCHER_STATS = metrics.gauge("microbatch", "Micro-batching statistics (see /batcher/stats).", ("stat",))
+GRID_LOOKUPS = metrics.counter("grid_lookups_total", "Single predictions answered from the precomputed grid, or not.",
+                               ("result",))
+
+# === Prediction cache ===
+# Keyed on the normalized feature tuple; PREDICTION_CACHE_SIZE=0 disables it.
+prediction_cache = PredictionCache(
+    maxsize=int(os.environ.get("PREDICTION_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("PREDICTION_CACHE_TTL", 0)) or None
+)
+
+# === Profiling ===
+# POST /admin/profile samples the stacks of busy threads for a few seconds.
+profiler = StackSampler(os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles")))
+
+# === Micro-batching ===
+# Concurrent single-row predictions are scored together, waiting at most
+# MICROBATCH_WAIT_MS for other in-flight predictions; MICROBATCH_MAX_SIZE=1 disables it.
+# A row not scored within MICROBATCH_TIMEOUT_S is scored by its own request.
+micro_batcher = MicroBatcher(
+    max_batch=int(os.environ.get("MICROBATCH_MAX_SIZE", 64)),
+    max_wait_ms=float(os.environ.get("MICROBATCH_WAIT_MS", 2)),
+    timeout_s=float(os.environ.get("MICROBATCH_TIMEOUT_S", 5)),
+    stage_seconds=STAGE_SECONDS,
+    profiler=profiler
+)
+
+# === Prediction grid ===
+# Single predictions are read from the model's precomputed grid when one was
+# built and the request is on it (see grid.py); PREDICTION_GRID=0 always runs the model.
+GRID_LOOKUP = os.environ.get("PREDICTION_GRID", "1") != "0"
+
+# === Batch prediction settings ===
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 5000))
+# CSV uploads are spooled to disk and parsed chunk by chunk; a JSON array is
+# parsed whole, so its size is capped.
+BATCH_JSON_MAX_BYTES = int(os.environ.get("BATCH_JSON_MAX_BYTES", 20 * 1024 ** 2))
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
 # === Load model ===
+# The artifact written by evaluate_models.save_best_model carries everything
+# the app needs (feature schema, dropdown values, residual statistics), so
+# startup does not touch the training data. The registry swaps in new
+# versions of it without a restart (see registry.py).
 MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../models/best_model.pkl"))
-model_data = joblib.load(MODEL_PATH)
-model = model_data["model"]
-preprocessor = model_data["preprocessor"]
-
-# === Load CSV for dropdowns ===
-CSV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../script/data/loyers_clean.csv"))
-df = pd.read_csv(CSV_PATH, encoding="ISO-8859-1")
-
-categorical_options = {
-    "agglomeration": sorted(df["agglomeration"].dropna().unique()),
-    "zone_complementaire": sorted(df["zone_complementaire"].dropna().unique()),
-    "type_habitat": sorted(df["type_habitat"].dropna().unique()),
-    "epoque_construction_homogene": sorted(df["epoque_construction_homogene"].dropna().unique())
-}
-
-# === Estimate standard deviation of residuals (for confidence interval) ===
-features = ["surface", "nombre_pieces", "nombre_observations", "nombre_logements",
-            "agglomeration", "zone_complementaire", "type_habitat", "epoque_construction_homogene"]
-df = df.dropna(subset=features + ["loyer_m2"])
-X_all = df[features]
-y_all = df["loyer_m2"]
-X_processed = preprocessor.transform(X_all)
-y_pred_all = model.predict(X_processed)
-residuals = y_all - y_pred_all
-std_dev = np.std(residuals)
+# Seconds between checks for a new best_model.pkl; 0 disables the watcher.
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 5))
+# Token required by the /admin endpoints; they are disabled when unset.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def on_model_swap(serving):
+    prediction_cache.clear()
+    MODEL_SWAPS.inc()
+
+
+registry = ModelRegistry(MODEL_PATH, on_swap=on_model_swap)
+registry.reload()
+APP_STARTUP.set(time.perf_counter() - APP_STARTED)
+
+
+@metrics.on_collect
+def collect_metrics():
+    serving = registry.current
+    MODEL_INFO.replace({(serving.version, serving.model_name): 1})
+    MODEL_LOADED.set(serving.loaded_at)
+    MODEL_STARTUP.replace({(phase,): seconds for phase, seconds in serving.timings.items()})
+    PROCESS_INFO.replace({(os.getpid(),): 1})
+    CACHE_STATS.replace({(stat,): value for stat, value in prediction_cache.stats().items()
+                         if isinstance(value, (int, float)) and not isinstance(value, bool)})
+    BATCHER_STATS.replace({(stat,): value for stat, value in micro_batcher.stats().items()
+                           if isinstance(value, (int, float)) and not isinstance(value, bool)})
+
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    profiler.mark_busy()
+    registry.ensure_watcher(MODEL_WATCH_INTERVAL)
+
+
+@app.after_request
+def record_request(response):
+    # Also runs for the 500 response Flask builds from an unhandled exception.
+    endpoint = request.endpoint or "unmatched"
+    REQUESTS.inc(endpoint, request.method, response.status_code)
+    if response.status_code >= 500:
+        REQUEST_ERRORS.inc(endpoint)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint)
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    profiler.mark_idle()
+
+
+def to_number(value):
+    """Scalar counterpart of pd.to_numeric(errors="coerce")."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def coerce_row(raw, serving):
+    """Single-record counterpart of ServingModel.prepare_input, without pandas."""
+    row = {col: raw.get(col) for col in serving.features}
+    for col in serving.numeric_inputs:
+        value = row[col]
+        row[col] = to_number(value)
+        if row[col] != row[col]:
+            INPUT_ISSUES.inc(col, "missing" if value in (None, "") else "not_numeric")
+    for col in serving.categorical_inputs:
+        if isinstance(row[col], float):
+            row[col] = str(row[col]) if row[col] == row[col] else None
+        elif row[col] in (None, ""):
+            INPUT_ISSUES.inc(col, "missing")
+    return row
+
+
+def predict_one(raw, serving):
+    """Return (prediction, (low, high)) for one raw record."""
+    with STAGE_SECONDS.time("coerce"):
+        row = coerce_row(raw, serving)
+    y_pred = None
+    if GRID_LOOKUP and serving.grid is not None:
+        with STAGE_SECONDS.time("grid_lookup"):
+            y_pred = serving.grid.lookup(row)
+        GRID_LOOKUPS.inc("hit" if y_pred is not None else "miss")
+    if y_pred is None:
+        # The version is part of the key, so a prediction computed by a request
+        # that started before a swap can never be served for the new model.
+        with STAGE_SECONDS.time("cache_lookup"):
+            key = (serving.version, PredictionCache.make_key(row, serving.features))
+            y_pred = prediction_cache.get(key)
+        if y_pred is None:
+            y_pred = micro_batcher.predict(serving, row)
+            prediction_cache.put(key, y_pred)
+    with STAGE_SECONDS.time("interval"):
+        low, high = serving.interval_offsets(row)
+    return y_pred, (y_pred + low, y_pred + high)
+
+
+def predict_chunk(chunk, serving):
+    """Score a chunk of rows with a single transform/predict call."""
+    with STAGE_SECONDS.time("batch_prepare"):
+        was_missing = chunk.reindex(columns=serving.numeric_inputs).replace("", np.nan).isna()
+        chunk = serving.prepare_input(chunk)
+        for col, missing in was_missing.sum().items():
+            if missing:
+                INPUT_ISSUES.inc(col, "missing", amount=int(missing))
+        for col, invalid in (chunk[serving.numeric_inputs].isna() & ~was_missing).sum().items():
+            if invalid:
+                INPUT_ISSUES.inc(col, "not_numeric", amount=int(invalid))
+    with STAGE_SECONDS.time("batch_transform"):
+        X = serving.preprocessor.transform(chunk)
+    with STAGE_SECONDS.time("batch_predict"):
+        y_pred = serving.model.predict(X)
+    with STAGE_SECONDS.time("batch_interval"):
+        low, high = serving.interval_frame_offsets(chunk)
+    chunk["prediction"] = np.round(y_pred, 2)
+    chunk["ci_lower"] = np.round(y_pred + low, 2)
+    chunk["ci_upper"] = np.round(y_pred + high, 2)
+    return chunk
+
+
+def iter_csv_chunks(spool, encoding):
+    try:
+        yield from pd.read_csv(spool, encoding=encoding, chunksize=BATCH_CHUNK_SIZE)
+    finally:
+        spool.close()
+
+
+def iter_record_chunks(records):
+    for start in range(0, len(records), BATCH_CHUNK_SIZE):
+        yield pd.DataFrame.from_records(records[start:start + BATCH_CHUNK_SIZE])
+
+
+def open_batch_chunks():
+    """Return an iterator of DataFrame chunks for the current request.
+
+    CSV payloads are spooled to a temporary file owned by the iterator: the
+    request (and its upload handles) is closed before the response streams.
+    JSON payloads are read and parsed in full, up to BATCH_JSON_MAX_BYTES.
+    """
+    upload = request.files.get("file")
+    if upload is not None or request.mimetype == "text/csv":
+        spool = tempfile.TemporaryFile()
+        if upload is not None:
+            upload.save(spool)
+        else:
+            shutil.copyfileobj(request.stream, spool)
+        spool.seek(0)
+        return iter_csv_chunks(spool, request.args.get("encoding", "ISO-8859-1"))
+
+    expected = "Expected a JSON array of records or a CSV upload in the 'file' field."
+    if not request.is_json:
+        raise ValueError(expected)
+    body = request.stream.read(BATCH_JSON_MAX_BYTES + 1)
+    if len(body) > BATCH_JSON_MAX_BYTES:
+        raise PayloadTooLarge(f"JSON batches are limited to {BATCH_JSON_MAX_BYTES} bytes; "
+                              "upload larger batches as CSV.")
+    try:
+        records = json.loads(body)
+    except ValueError:
+        raise ValueError(expected)
+    if not isinstance(records, list):
+        raise ValueError(expected)
+    if not all(isinstance(record, dict) for record in records):
+        raise ValueError("Every element of the JSON array must be an object of feature values.")
+    return iter_record_chunks(records)
+
+
+def render_chunk(chunk, output_format, header):
+    if output_format == "ndjson":
+        records = chunk.replace({np.nan: None}).to_dict(orient="records")
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    return chunk.to_csv(index=False, header=header)
+
 
 @app.route("/", methods=["GET", "POST"])
 def index():
+    serving = registry.current
     prediction = None
     conf_interval = None
     form_data = {}
 
     if request.method == "POST":
+        parse_started = time.perf_counter()
         form_data = {
             "surface": request.form.get("surface", ""),
             "nombre_pieces": request.form.get("nombre_pieces", ""),
@@ -51,26 +278,191 @@ def index():
             "type_habitat": request.form.get("type_habitat", ""),
             "epoque_construction_homogene": request.form.get("epoque_construction_homogene", "")
         }
+        STAGE_SECONDS.observe(time.perf_counter() - parse_started, "parse")
 
-        input_df = pd.DataFrame([form_data])
-        for col in ["surface", "nombre_pieces", "nombre_observations", "nombre_logements"]:
-            input_df[col] = pd.to_numeric(input_df[col], errors="coerce")
-
-        X_transformed = preprocessor.transform(input_df)
-        y_pred = model.predict(X_transformed)[0]
+        y_pred, (low, high) = predict_one(form_data, serving)
 
-        # Confidence interval (95%)
-        margin = 1.96 * std_dev
+        # 95% prediction interval for the listing's segment
         prediction = round(y_pred, 2)
-        conf_interval = (round(y_pred - margin, 2), round(y_pred + margin, 2))
-
-    return render_template(
-        "index.html",
-        prediction=prediction,
-        conf_interval=conf_interval,
-        form_data=form_data,
-        options=categorical_options
-    )
+        conf_interval = (round(low, 2), round(high, 2))
+
+    with STAGE_SECONDS.time("render"):
+        return render_template(
+            "index.html",
+            prediction=prediction,
+            conf_interval=conf_interval,
+            form_data=form_data,
+            options=serving.categorical_options
+        )
+
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """Score many listings at once.
+
+    Accepts a JSON array of records or a CSV upload (multipart field ``file``,
+    or a raw ``text/csv`` body) with the eight feature columns. Rows are scored
+    in chunks of ``BATCH_CHUNK_SIZE`` and streamed back as CSV (default) or
+    NDJSON (``?format=ndjson``). Memory stays flat for CSV uploads of any
+    size; JSON arrays are parsed whole and capped at ``BATCH_JSON_MAX_BYTES``.
+    """
+    # One model version for the whole stream, even if a reload happens meanwhile.
+    serving = registry.current
+    output_format = request.args.get("format", "csv").lower()
+    if output_format not in ("csv", "ndjson"):
+        return jsonify({"error": f"Unsupported format: {output_format}"}), 400
+
+    # Validate the first chunk eagerly so bad payloads get a proper 400
+    # instead of a truncated stream.
+    try:
+        chunks = open_batch_chunks()
+        first = next(chunks, None)
+    except PayloadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+    if first is None:
+        return jsonify({"error": "No rows to score."}), 400
+    first.columns = first.columns.str.strip().str.lower()
+    missing = [col for col in serving.features if col not in first.columns]
+    if missing:
+        chunks.close()
+        return jsonify({"error": f"Missing columns: {', '.join(missing)}"}), 400
+
+    def generate():
+        header = True
+        for chunk in chain([first], chunks):
+            chunk.columns = chunk.columns.str.strip().str.lower()
+            scored = predict_chunk(chunk, serving)[serving.batch_output_columns]
+            with STAGE_SECONDS.time("batch_render"):
+                body = render_chunk(scored, output_format, header)
+            yield body
+            header = False
+
+    mimetype = "application/x-ndjson" if output_format == "ndjson" else "text/csv"
+    return Response(generate(), mimetype=mimetype)
+
+@app.route("/map/zones", methods=["GET"])
+def map_zones():
+    """Export per-zone predictions for map rendering, read from the precomputed grid.
+
+    ``?surface=`` (default: the training median) and optional filters on any
+    grid column, e.g. ``type_habitat=appartement&nombre_pieces=2``. Columns
+    left unfiltered are expanded, one row per value. CSV by default, or a
+    JSON array with ``?format=json``.
+    """
+    serving = registry.current
+    grid = serving.grid
+    if grid is None:
+        return jsonify({"error": f"No prediction grid for model version {serving.version}; "
+                                 "run prediction_grid.py."}), 503
+    output_format = request.args.get("format", "csv").lower()
+    if output_format not in ("csv", "json"):
+        return jsonify({"error": f"Unsupported format: {output_format}"}), 400
+    surface = to_number(request.args.get("surface", grid.default_surface))
+    filters = {}
+    for col in grid.columns:
+        value = request.args.get(col)
+        if value is not None:
+            # Numbers (nombre_pieces) are keyed by their string form, as in coerce_row.
+            filters[col] = str(to_number(value)) if col in serving.numeric_inputs else value
+    try:
+        zones = grid.export(surface, filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    low, high = serving.interval_frame_offsets(zones)
+    zones["ci_lower"] = np.round(zones["prediction"] + low, 2)
+    zones["ci_upper"] = np.round(zones["prediction"] + high, 2)
+    zones["prediction"] = np.round(zones["prediction"], 2)
+    if output_format == "json":
+        return jsonify(zones.to_dict(orient="records"))
+    return Response(zones.to_csv(index=False), mimetype="text/csv")
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(prediction_cache.stats())
+
+@app.route("/batcher/stats", methods=["GET"])
+def batcher_stats():
+    return jsonify(micro_batcher.stats())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# === Model administration ===
+def admin_denied():
+    """Error response unless the request carries the configured ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled; set ADMIN_TOKEN to enable them."}), 403
+    if request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "Invalid admin token."}), 403
+    return None
+
+@app.route("/admin/model", methods=["GET"])
+def model_status():
+    denied = admin_denied()
+    if denied:
+        return denied
+    previous = registry.previous
+    return jsonify({
+        "current": registry.current.describe(),
+        "previous": previous.describe() if previous else None,
+        "versions": registry.versions(),
+        "last_error": registry.last_error
+    })
+
+@app.route("/admin/reload", methods=["POST"])
+def reload_model():
+    """Load best_model.pkl, or ?version=<name> from models/versions/, in the background."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    version = request.args.get("version")
+    if version is not None and version not in registry.versions():
+        return jsonify({"error": f"Unknown model version: {version}"}), 404
+
+    def load():
+        try:
+            if version:
+                registry.activate(version)
+            else:
+                registry.reload()
+            registry.last_error = None
+        except Exception as e:  # keep serving the current model
+            registry.last_error = f"{type(e).__name__}: {e}"
+
+    threading.Thread(target=load, daemon=True).start()
+    return jsonify({"status": "loading", "version": version or "latest"}), 202
+
+@app.route("/admin/rollback", methods=["POST"])
+def rollback_model():
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        serving = registry.rollback()
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"status": "rolled back", "current": serving.describe()})
+
+@app.route("/admin/profile", methods=["GET", "POST"])
+def profile():
+    """POST starts sampling stacks (?seconds=10&interval_ms=5); GET returns the last run's hottest functions."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    if request.method == "GET":
+        return jsonify({"running": profiler.running, "last": profiler.last_result})
+    seconds = to_number(request.args.get("seconds", 10))
+    interval_ms = to_number(request.args.get("interval_ms", 5))
+    if not (0 < seconds < float("inf")) or not (0 < interval_ms < float("inf")):
+        return jsonify({"error": "seconds and interval_ms must be positive numbers."}), 400
+    seconds = min(seconds, MAX_PROFILE_SECONDS)
+    interval = max(interval_ms / 1000, MIN_PROFILE_INTERVAL)
+    if not profiler.start(seconds, interval):
+        return jsonify({"error": "A profile is already running."}), 409
+    return jsonify({"status": "sampling", "seconds": seconds, "interval_ms": interval * 1000, "pid": os.getpid()}), 202
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,209 @@
+"""
+batcher.py
+
+Dynamic micro-batching of concurrent single-row predictions.
+
+Scoring one row costs almost as much as scoring a few hundred: the fixed
+overhead of transform/predict dominates. Request threads hand their row to
+a MicroBatcher and block; a single background thread collects the rows that
+arrive within a short window (or until the batch is full), scores them with
+one vectorized call and hands every caller its own result.
+
+The window is only waited out while other predictions are in flight: a
+lone request is scored immediately, so an idle or single-threaded server
+pays no extra latency. A caller whose row is not scored within
+`timeout_s` (e.g. the batching thread died) scores it itself.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _Pending:
+    __slots__ = ("serving", "row", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, serving, row):
+        self.serving = serving
+        self.row = row
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, max_batch=64, max_wait_ms=2.0, timeout_s=5.0, history=10000, stage_seconds=None,
+                 profiler=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout_s
+        # Optional metrics.Histogram (label: stage) for queue/transform/predict times.
+        self.stage_seconds = stage_seconds
+        # Optional profiler.StackSampler, told which threads are doing work.
+        self.profiler = profiler
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        # Callers inside predict(): only they can join a batch.
+        self._in_flight = 0
+        # Recent batches, for the percentiles reported by stats().
+        self._sizes = deque(maxlen=history)
+        self._delays = deque(maxlen=history)
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self):
+        return self.max_batch > 1
+
+    # === Request side ===
+    def predict(self, serving, row):
+        """Prediction for one normalized record, scored together with concurrent ones."""
+        if not self.enabled:
+            return float(self._score(serving, [row])[0])
+        self._ensure_worker()
+        pending = _Pending(serving, row)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            self._queue.put(pending)
+            # The scoring shows up in the profile of the batching thread instead.
+            if self.profiler is not None:
+                self.profiler.mark_idle()
+            done = pending.done.wait(self.timeout)
+            if self.profiler is not None:
+                self.profiler.mark_busy()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if not done:
+            with self._lock:
+                self.timeouts += 1
+            return float(self._score(serving, [row])[0])
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    # === Batching thread ===
+    def _ensure_worker(self):
+        # Threads do not survive fork: each pre-forked worker starts its own,
+        # and a thread that died is replaced.
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _score(self, serving, rows):
+        if self.stage_seconds is None:
+            return serving.predict_rows(rows)
+        with self.stage_seconds.time("transform"):
+            X = serving.transform_rows(rows)
+        with self.stage_seconds.time("predict"):
+            return serving.predict_matrix(X)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # Nobody else can join: every request in flight is already here.
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or len(batch) >= self._in_flight:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._collect()
+                self._process(batch)
+            except Exception as e:
+                # Never let the thread die: every caller of the batch is answered.
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                self.failures += 1
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.mark_busy()
+        try:
+            # A hot reload can land mid-window: score each model's rows with that model.
+            groups = {}
+            for pending in batch:
+                groups.setdefault(id(pending.serving), []).append(pending)
+            for group in groups.values():
+                try:
+                    predictions = self._score(group[0].serving, [pending.row for pending in group])
+                    for pending, y_pred in zip(group, predictions):
+                        pending.result = float(y_pred)
+                except Exception as e:
+                    for pending in group:
+                        pending.error = e
+                    self.failures += 1
+                for pending in group:
+                    pending.done.set()
+        finally:
+            if self.profiler is not None:
+                self.profiler.mark_idle()
+        self._record(batch, started)
+
+    def _record(self, batch, started):
+        if self.stage_seconds is not None:
+            for pending in batch:
+                self.stage_seconds.observe(started - pending.enqueued_at, "queue")
+        with self._lock:
+            self.batches += 1
+            self.rows += len(batch)
+            self._sizes.append(len(batch))
+            self._delays.extend(started - pending.enqueued_at for pending in batch)
+
+    # === Metrics ===
+    def stats(self):
+        with self._lock:
+            sizes = np.array(self._sizes, dtype=float)
+            delays = np.array(self._delays) * 1000
+            stats = {
+                "enabled": self.enabled,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "in_flight": self._in_flight,
+                "batches": self.batches,
+                "rows": self.rows,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "mean_batch_size": self.rows / self.batches if self.batches else 0.0
+            }
+        if len(sizes):
+            stats.update({
+                "recent_mean_fill": float(sizes.mean() / self.max_batch),
+                "recent_max_batch_size": int(sizes.max()),
+                "queue_delay_ms_p50": float(np.percentile(delays, 50)),
+                "queue_delay_ms_p95": float(np.percentile(delays, 95)),
+                "queue_delay_ms_max": float(delays.max())
+            })
+        return stats
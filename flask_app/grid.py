@@ -0,0 +1,120 @@
+"""
+grid.py
+
+Precomputed predictions of one model version, memory-mapped.
+
+prediction_grid.py (repository root) scores the model on every observed
+(agglomeration, zone) pair x type_habitat x epoque x nombre_pieces over a
+grid of surfaces, with nombre_observations and nombre_logements held at
+the values the preprocessor imputes for them, and writes models/grids/<version>.npy plus a JSON
+description of the axes. Here a request becomes a cell index (one dict
+lookup per axis) and a linear interpolation between the two grid surfaces
+around its own. The array is opened with mmap_mode="r", so it is loaded
+lazily and its pages are shared by every gunicorn worker.
+"""
+
+import os
+import json
+import bisect
+import numpy as np
+import pandas as pd
+
+
+class PredictionGrid:
+    def __init__(self, array_path, meta_path):
+        with open(meta_path) as f:
+            self.meta = json.load(f)
+        self.version = self.meta["version"]
+        self.values = np.load(array_path, mmap_mode="r")
+        if list(self.values.shape) != self.meta["shape"]:
+            raise RuntimeError(f"{array_path} does not match {meta_path}")
+        self.surfaces = self.meta["surfaces"]
+        self._surfaces = np.asarray(self.surfaces)
+        self.held = {col: value for col, value in self.meta["held"].items() if col != "surface"}
+        self.default_surface = self.meta["held"]["surface"]
+
+        # Row-major cell index: one (columns, {value tuple: position}, stride) per axis.
+        self.axes = self.meta["axes"]
+        self.columns = [col for axis in self.axes for col in axis["columns"]]
+        stride = 1
+        self._axes = []
+        for axis in reversed(self.axes):
+            positions = {tuple(values): i for i, values in enumerate(axis["values"])}
+            self._axes.append((axis["columns"], positions, stride))
+            stride *= len(axis["values"])
+        self._axes.reverse()
+
+    @classmethod
+    def open(cls, directory, version):
+        """The grid of `version` in `directory`, or None if it has not been built."""
+        array_path = os.path.join(directory, f"{version}.npy")
+        meta_path = os.path.join(directory, f"{version}.json")
+        if not (os.path.exists(array_path) and os.path.exists(meta_path)):
+            return None
+        return cls(array_path, meta_path)
+
+    def covers(self, row):
+        """
+        True if the grid's held values are the row's: counts missing (the
+        model imputes exactly the held values) or equal to them.
+        """
+        return all(row.get(col) != row.get(col) or row.get(col) == value for col, value in self.held.items())
+
+    def cell(self, row):
+        index = 0
+        for columns, positions, stride in self._axes:
+            position = positions.get(tuple(row.get(col) for col in columns))
+            if position is None:
+                return None
+            index += position * stride
+        return index
+
+    def lookup(self, row):
+        """Interpolated prediction for a record normalized by coerce_row, or None if it is off the grid."""
+        surface = row.get("surface")
+        if not self.covers(row) or not (self.surfaces[0] <= surface <= self.surfaces[-1]):
+            return None
+        index = self.cell(row)
+        if index is None:
+            return None
+        j = min(bisect.bisect_right(self.surfaces, surface) - 1, len(self.surfaces) - 2)
+        weight = (surface - self.surfaces[j]) / (self.surfaces[j + 1] - self.surfaces[j])
+        low, high = self.values[index, j:j + 2]
+        return float((1 - weight) * low + weight * high)
+
+    def export(self, surface, filters):
+        """
+        Predictions at `surface` for every cell matching `filters` ({column: value}),
+        as a DataFrame with the axis columns, surface and prediction.
+        """
+        if not (self.surfaces[0] <= surface <= self.surfaces[-1]):
+            raise ValueError(f"surface must be between {self.surfaces[0]:.1f} and {self.surfaces[-1]:.1f}")
+        selected = []
+        for axis, (columns, _, stride) in zip(self.axes, self._axes):
+            keep = [i for i, values in enumerate(axis["values"])
+                    if all(col not in filters or filters[col] == value for col, value in zip(columns, values))]
+            selected.append(np.asarray(keep, dtype=np.int64) * stride)
+        # Every combination of the kept positions, as flat cell indices.
+        cells = np.zeros(1, dtype=np.int64)
+        for offsets in selected:
+            cells = (cells[:, None] + offsets[None, :]).ravel()
+
+        j = min(int(np.searchsorted(self._surfaces, surface, side="right")) - 1, len(self.surfaces) - 2)
+        weight = (surface - self.surfaces[j]) / (self.surfaces[j + 1] - self.surfaces[j])
+        predictions = (1 - weight) * self.values[cells, j] + weight * self.values[cells, j + 1]
+
+        frame = {}
+        remainder = cells
+        for axis, (columns, _, stride) in zip(self.axes, self._axes):
+            values = np.array(axis["values"], dtype=object)[remainder // stride]
+            remainder = remainder % stride
+            for i, col in enumerate(columns):
+                frame[col] = values[:, i]
+        frame["surface"] = surface
+        frame["prediction"] = predictions.astype(np.float64)
+        return pd.DataFrame(frame)
+
+    def describe(self):
+        return {"version": self.version, "cells": self.meta["shape"][0], "surfaces": len(self.surfaces),
+                "surface_range": [self.surfaces[0], self.surfaces[-1]], "held": self.meta["held"],
+                "interpolation_error": self.meta.get("interpolation_error")}
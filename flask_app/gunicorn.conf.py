@@ -0,0 +1,44 @@
+"""
+gunicorn.conf.py
+
+Production serving configuration for the Flask app: a pre-fork server whose
+master process imports app.py (and therefore loads and compiles the model)
+once, before forking the workers. The workers inherit the model's memory
+copy-on-write instead of each loading its own copy.
+
+Usage:  gunicorn -c flask_app/gunicorn.conf.py
+        WEB_CONCURRENCY=8 gunicorn -c flask_app/gunicorn.conf.py
+"""
+
+import gc
+import os
+import multiprocessing
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "app:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# The micro-batcher (batcher.py) coalesces concurrent requests of one worker,
+# so a worker needs threads for it to ever see more than one row at a time.
+batching = int(os.environ.get("MICROBATCH_MAX_SIZE", 64)) > 1
+threads = int(os.environ.get("GUNICORN_THREADS", 16 if batching else 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Load the model in the master, once, so its pages are shared by every worker
+# (GUNICORN_PRELOAD=0 loads it in each worker instead, for comparison).
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    if batching and server.cfg.threads == 1:
+        server.log.warning("GUNICORN_THREADS=1: micro-batching has no concurrent requests to coalesce "
+                           "(set MICROBATCH_MAX_SIZE=1 to disable it)")
+    # Runs in the master after the app is loaded and before the first fork.
+    # Moving every object allocated so far into a permanent generation keeps
+    # the workers' garbage collector from writing to (and thereby copying)
+    # the shared pages of the model.
+    if not server.cfg.preload_app:
+        return
+    gc.collect()
+    gc.freeze()
+    server.log.info("Model preloaded; %d objects frozen before forking", gc.get_freeze_count())
@@ -0,0 +1,306 @@
+"""
+inference.py
+
+Compiled inference path for the trained rent model.
+
+At load time the fitted ColumnTransformer is flattened into plain NumPy
+arrays (imputation constants, scaler mean/scale, category -> column lookups)
+and the regressor into either a coefficient vector or flat tree arrays. A
+single prediction is then a handful of array operations instead of a trip
+through pandas and the sklearn pipeline machinery. Results are bit-for-bit
+identical to `model.predict(preprocessor.transform(X))`.
+"""
+
+import json
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LinearRegression, Lasso
+from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+try:
+    from xgboost import XGBRegressor
+except ImportError:
+    XGBRegressor = None
+
+
+def _is_missing(value):
+    return value is None or value != value
+
+
+def _pipeline_steps(transformer):
+    if isinstance(transformer, Pipeline):
+        return [step for _, step in transformer.steps]
+    return [transformer]
+
+
+class CompiledPreprocessor:
+    """
+    Flat-array equivalent of the fitted numeric/categorical ColumnTransformer,
+    or of a FeatureUnion of them (a preprocessor extended by incremental.py).
+    """
+
+    def __init__(self, preprocessor):
+        parts = ([part for _, part in preprocessor.transformer_list]
+                 if isinstance(preprocessor, FeatureUnion) else [preprocessor])
+        if not all(isinstance(part, ColumnTransformer) for part in parts):
+            raise NotImplementedError(f"Cannot compile preprocessor {type(preprocessor).__name__}")
+
+        self.numeric = []      # (column, output index, fill value, mean, scale)
+        self.categorical = []  # (column, fill value, {category: output index})
+        offset = 0
+
+        for part in parts:
+            for name, transformer, columns in part.transformers_:
+                if transformer == "drop":
+                    continue
+                if isinstance(transformer, str):
+                    raise NotImplementedError(f"Cannot compile '{transformer}' columns")
+                steps = _pipeline_steps(transformer)
+                if isinstance(steps[-1], OneHotEncoder):
+                    offset = self._compile_categorical(steps, columns, offset)
+                else:
+                    offset = self._compile_numeric(steps, columns, offset)
+
+        self.n_features_out = offset
+        # CSR output changes how some regressors see zeros (see CompiledModel).
+        self.sparse_output = any(getattr(part, "sparse_output_", False) for part in parts)
+
+    def _compile_numeric(self, steps, columns, offset):
+        fill = np.full(len(columns), np.nan)
+        mean = np.zeros(len(columns))
+        scale = np.ones(len(columns))
+        for step in steps:
+            if isinstance(step, SimpleImputer) and step.strategy in ("mean", "median", "constant"):
+                fill = step.statistics_.astype(float)
+            elif isinstance(step, StandardScaler):
+                if step.mean_ is not None:
+                    mean = step.mean_
+                if step.scale_ is not None:
+                    scale = step.scale_
+            else:
+                raise NotImplementedError(f"Cannot compile numeric step {type(step).__name__}")
+
+        for i, column in enumerate(columns):
+            self.numeric.append((column, offset + i, fill[i], mean[i], scale[i]))
+        return offset + len(columns)
+
+    def _compile_categorical(self, steps, columns, offset):
+        *imputers, encoder = steps
+        fill = [None] * len(columns)
+        for step in imputers:
+            if not isinstance(step, SimpleImputer):
+                raise NotImplementedError(f"Cannot compile categorical step {type(step).__name__}")
+            fill = list(step.statistics_)
+        if encoder.drop is not None or getattr(encoder, "infrequent_categories_", None):
+            raise NotImplementedError("Cannot compile OneHotEncoder with drop or infrequent categories")
+
+        for column, categories, fill_value in zip(columns, encoder.categories_, fill):
+            lookup = {category: offset + j for j, category in enumerate(categories)}
+            self.categorical.append((column, fill_value, lookup))
+            offset += len(categories)
+        return offset
+
+    def transform_one(self, row):
+        """Transform one record (a mapping of already-coerced values) into a (1, n) array."""
+        x = np.zeros((1, self.n_features_out))
+        out = x[0]
+        for column, index, fill, mean, scale in self.numeric:
+            value = row.get(column)
+            if _is_missing(value):
+                value = fill
+            out[index] = (value - mean) / scale
+        for column, fill, lookup in self.categorical:
+            value = row.get(column)
+            if _is_missing(value):
+                value = fill
+            index = lookup.get(value)
+            if index is not None:
+                out[index] = 1.0
+        return x
+
+
+class LinearPredictor:
+    def __init__(self, regressor, sparse_input=False):
+        self.coef = np.asarray(regressor.coef_).T
+        self.intercept = regressor.intercept_
+        self.sparse_input = sparse_input
+
+    def predict(self, X):
+        # Same operation order as LinearModel._decision_function: a dense
+        # matrix product, or scipy's CSR mat-vec (a running sum over the
+        # non-zero columns) when the pipeline produces sparse features.
+        if not self.sparse_input:
+            return X @ self.coef + self.intercept
+        out = np.zeros(X.shape[0])
+        for i, row in enumerate(X):
+            total = 0.0
+            for j in np.flatnonzero(row):
+                total += row[j] * self.coef[j]
+            out[i] = total
+        return out + self.intercept
+
+
+class TreeEnsemblePredictor:
+    """
+    Every tree of an ensemble concatenated into flat node arrays.
+
+    Leaves point to themselves, so traversal is a fixed number of vectorized
+    steps (the deepest tree's depth) over all rows and trees at once.
+    """
+
+    def __init__(self, trees, dtype, strict, input_dtype=np.float32, base_score=None, average=False,
+                 zero_as_missing=False):
+        left, right, feature, threshold, value, default_left, roots = [], [], [], [], [], [], []
+        offset = 0
+        self.depth = 0
+        for tree in trees:
+            n_nodes = len(tree["left"])
+            nodes = np.arange(n_nodes)
+            is_leaf = tree["left"] == -1
+            left.append(np.where(is_leaf, nodes, tree["left"]) + offset)
+            right.append(np.where(is_leaf, nodes, tree["right"]) + offset)
+            feature.append(np.where(is_leaf, 0, tree["feature"]))
+            threshold.append(tree["threshold"])
+            value.append(tree["value"])
+            default_left.append(tree.get("default_left", np.zeros(n_nodes, dtype=bool)))
+            roots.append(offset)
+            self.depth = max(self.depth, tree["depth"])
+            offset += n_nodes
+
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.feature = np.concatenate(feature)
+        self.threshold = np.concatenate(threshold)
+        self.value = np.concatenate(value).astype(dtype)
+        self.default_left = np.concatenate(default_left)
+        self.roots = np.asarray(roots)
+        self.dtype = dtype
+        self.input_dtype = input_dtype
+        self.strict = strict
+        self.base_score = base_score
+        self.average = average
+        self.zero_as_missing = zero_as_missing
+
+    def apply(self, X):
+        """Return the leaf node index reached in every tree, shape (n_rows, n_trees)."""
+        X = np.asarray(X, dtype=self.input_dtype)
+        if self.zero_as_missing:
+            X = np.where(X == 0, np.nan, X)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        for _ in range(self.depth):
+            values = X[rows, self.feature[nodes]]
+            if self.strict:
+                go_left = (values < self.threshold[nodes]) | (np.isnan(values) & self.default_left[nodes])
+            else:
+                go_left = values <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, X):
+        leaf_values = self.value[self.apply(X)]
+        if self.base_score is not None:
+            base = np.full((leaf_values.shape[0], 1), self.base_score, dtype=self.dtype)
+            leaf_values = np.hstack([base, leaf_values])
+        # Accumulate tree by tree, in the same order and precision as the
+        # reference implementations.
+        total = np.cumsum(leaf_values, axis=1, dtype=self.dtype)[:, -1]
+        if self.average:
+            total /= leaf_values.shape[1]
+        return total
+
+    @classmethod
+    def from_random_forest(cls, forest):
+        trees = []
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            trees.append({
+                "left": tree.children_left,
+                "right": tree.children_right,
+                "feature": tree.feature,
+                "threshold": tree.threshold,
+                "value": tree.value[:, 0, 0],
+                "depth": tree.max_depth
+            })
+        # sklearn trees compare float32 inputs against float64 thresholds.
+        return cls(trees, dtype=np.float64, strict=False, average=True)
+
+    @classmethod
+    def from_xgboost(cls, regressor, sparse_input=False):
+        booster = regressor.get_booster()
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        if learner["objective"]["name"] != "reg:squarederror":
+            raise NotImplementedError(f"Cannot compile XGBoost objective {learner['objective']['name']}")
+        model = learner["gradient_booster"]["model"]
+        if learner["gradient_booster"]["name"] != "gbtree":
+            raise NotImplementedError("Only gbtree boosters can be compiled")
+
+        trees = []
+        for tree in model["trees"]:
+            left = np.asarray(tree["left_children"])
+            right = np.asarray(tree["right_children"])
+            if any(tree.get("split_type", [])):
+                raise NotImplementedError("Cannot compile XGBoost categorical splits")
+            trees.append({
+                "left": left,
+                "right": right,
+                "feature": np.asarray(tree["split_indices"]),
+                # Leaves store their output in split_conditions.
+                "threshold": np.asarray(tree["split_conditions"], dtype=np.float32),
+                "value": np.asarray(tree["split_conditions"], dtype=np.float32),
+                "default_left": np.asarray(tree["default_left"], dtype=bool),
+                "depth": _tree_depth(left, right)
+            })
+        base_score = np.float32(learner["learner_model_param"]["base_score"].strip("[]"))
+        # XGBoost treats entries absent from a CSR matrix as missing values.
+        return cls(trees, dtype=np.float32, strict=True, base_score=base_score,
+                   zero_as_missing=sparse_input)
+
+
+def _tree_depth(left, right):
+    depth, frontier = 0, [0]
+    while True:
+        frontier = [child for node in frontier for child in (left[node], right[node]) if child != -1]
+        if not frontier:
+            return depth
+        depth += 1
+
+
+def compile_regressor(regressor, sparse_input=False):
+    if isinstance(regressor, (LinearRegression, Lasso)):
+        return LinearPredictor(regressor, sparse_input)
+    if isinstance(regressor, RandomForestRegressor):
+        return TreeEnsemblePredictor.from_random_forest(regressor)
+    if XGBRegressor is not None and isinstance(regressor, XGBRegressor):
+        return TreeEnsemblePredictor.from_xgboost(regressor, sparse_input)
+    raise NotImplementedError(f"Cannot compile regressor {type(regressor).__name__}")
+
+
+class CompiledModel:
+    """Compiled preprocessor + regressor with a single-row fast path."""
+
+    def __init__(self, preprocessor, regressor):
+        self.preprocessor = CompiledPreprocessor(preprocessor)
+        self.regressor = compile_regressor(regressor, self.preprocessor.sparse_output)
+
+    def predict_one(self, row):
+        return self.regressor.predict(self.preprocessor.transform_one(row))[0]
+
+    def transform_rows(self, rows):
+        return np.vstack([self.preprocessor.transform_one(row) for row in rows])
+
+    def predict_rows(self, rows):
+        """Score several records with a single regressor call."""
+        return self.regressor.predict(self.transform_rows(rows))
+
+
+def compile_model(preprocessor, regressor):
+    """Return a CompiledModel, or None if some fitted step is not supported."""
+    try:
+        return CompiledModel(preprocessor, regressor)
+    except NotImplementedError as e:
+        print(f"[WARN] Falling back to the sklearn pipeline: {e}")
+        return None
@@ -0,0 +1,98 @@
+"""
+profiler.py
+
+On-demand sampling profiler for the serving hot path.
+
+While armed, a background thread snapshots the Python stack of every busy
+thread at a fixed interval (sys._current_frames) and counts the collapsed
+stacks. Threads mark themselves busy while handling a request or scoring a
+micro-batch, so idle threads and background loops do not drown the hot
+path. Unlike cProfile it adds no per-call cost to the profiled code and sees
+the micro-batching thread as well as the request threads. A run writes a
+collapsed-stack file (one `frame;frame;... count` line per stack, the input
+of flamegraph.pl and speedscope) and keeps a summary of the hottest
+functions.
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Shortest sampling interval: below it the sampler thread spins and holds the GIL.
+MIN_INTERVAL = 0.001
+MAX_SECONDS = 300
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.last_result = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._busy = set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def mark_busy(self):
+        self._busy.add(threading.get_ident())
+
+    def mark_idle(self):
+        self._busy.discard(threading.get_ident())
+
+    def start(self, seconds=10.0, interval=0.005):
+        """
+        Sample for `seconds` (at most MAX_SECONDS) every `interval` seconds (at
+        least MIN_INTERVAL) in the background; returns False if a run is
+        already in progress.
+        """
+        seconds, interval = min(seconds, MAX_SECONDS), max(interval, MIN_INTERVAL)
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(target=self._sample, args=(seconds, interval), daemon=True)
+            self._thread.start()
+            return True
+
+    def _sample(self, seconds, interval):
+        stacks = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident not in self._busy:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks[";".join(reversed(names))] += 1
+            samples += 1
+            time.sleep(interval)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Self samples: the innermost frame of each stack.
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        self.last_result = {
+            "path": path,
+            "pid": os.getpid(),
+            "seconds": seconds,
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "top_self": [{"function": name, "samples": count} for name, count in leaves.most_common(25)]
+        }
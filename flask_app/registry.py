@@ -0,0 +1,285 @@
+"""
+registry.py
+
+Versioned serving models with hot reload and rollback.
+
+evaluate_models.save_best_model writes every model to models/versions/ and
+then points models/best_model.pkl at the newest one. The registry serves one
+immutable ServingModel at a time. A new version is loaded, compiled and
+warmed up off the request path, then swapped in with a single reference
+assignment. A request reads `registry.current` once and uses that object
+throughout, so it always sees one complete model. The previous model stays
+in memory for instant rollback, and older versions can be reloaded from disk.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+
+from grid import PredictionGrid
+from inference import compile_model
+
+logger = logging.getLogger(__name__)
+
+
+def bounds_frame(bounds):
+    """A level's {segment tuple: (low, high)} as a DataFrame indexed by segment."""
+    frame = pd.DataFrame.from_dict(bounds, orient="index", columns=["low", "high"])
+    frame.index = pd.MultiIndex.from_tuples(frame.index)
+    return frame
+
+
+def frame_offsets(levels, default, df):
+    """
+    Vectorized (low, high) offsets of every row of df: each level is one
+    reindex over the rows no finer level matched. Same lookup as
+    intervals.interval_offsets at the repository root, kept here so the
+    app image stays self-contained.
+    """
+    low = np.full(len(df), np.nan)
+    high = np.full(len(df), np.nan)
+    for columns, bounds in levels:
+        todo = np.isnan(low)
+        if not todo.any():
+            break
+        rows = df.reindex(columns=columns)[todo]
+        found = bounds.reindex(pd.MultiIndex.from_arrays([rows[col].astype(str) for col in columns]))
+        low[todo] = found["low"].to_numpy()
+        high[todo] = found["high"].to_numpy()
+    missing = np.isnan(low)
+    low[missing], high[missing] = default
+    return low, high
+
+
+def publish(artifact_path, target_path):
+    """Atomically point target_path at artifact_path (hard link, or copy where links are unsupported)."""
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    try:
+        os.link(artifact_path, tmp_path)
+    except OSError:
+        shutil.copyfile(artifact_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+
+class ServingModel:
+    """Everything needed to serve one artifact version. Never mutated once loaded."""
+
+    def __init__(self, path, grids_dir=None):
+        # Seconds spent in each startup phase, exported by /metrics.
+        self.timings = {}
+        start = time.perf_counter()
+        data = joblib.load(path)
+        self.timings["load"] = time.perf_counter() - start
+        if "residuals" not in data:
+            raise RuntimeError(f"{path} predates the serving metadata; rerun evaluate_models.py.")
+        self.path = path
+        self.version = data.get("version") or os.path.basename(path)
+        self.model_name = data["model_name"]
+        self.model = data["model"]
+        self.preprocessor = data["preprocessor"]
+        # Flat-array fast path for single predictions (None if unsupported).
+        start = time.perf_counter()
+        self.compiled = compile_model(self.preprocessor, self.model)
+        self.timings["compile"] = time.perf_counter() - start
+
+        self.numeric_inputs = data["features"]["numerical"] + ["nombre_pieces"]
+        self.categorical_inputs = data["features"]["categorical"]
+        self.features = data["features"]["numerical"] + self.categorical_inputs
+        self.categorical_options = data["categorical_options"]
+        self.batch_output_columns = self.features + ["prediction", "ci_lower", "ci_upper"]
+
+        # Prediction intervals: per-segment residual quantiles (see intervals.py
+        # at the repository root), or ±1.96σ for artifacts built without them.
+        self.std_dev = data["residuals"]["std"]
+        self.margin = 1.96 * self.std_dev
+        self.intervals = data.get("intervals")
+        if self.intervals is not None:
+            self._interval_levels = [(level["columns"], level["bounds"]) for level in self.intervals["levels"]]
+            self._interval_frames = [(columns, bounds_frame(bounds)) for columns, bounds in self._interval_levels if bounds]
+
+        # Precomputed predictions of this version (see grid.py), if prediction_grid.py built them.
+        start = time.perf_counter()
+        self.grid = PredictionGrid.open(grids_dir, self.version) if grids_dir else None
+        self.timings["grid"] = time.perf_counter() - start
+        self.loaded_at = time.time()
+
+    def prepare_input(self, input_df):
+        """Coerce raw (string) inputs to the dtypes expected by the preprocessor."""
+        input_df = input_df.reindex(columns=self.features)
+        for col in self.numeric_inputs:
+            input_df[col] = pd.to_numeric(input_df[col], errors="coerce").astype(float)
+        # Categorical features that arrive as numbers (nombre_pieces) were
+        # encoded from their string form during training. Missing values (NaN,
+        # or None from a JSON null) all become NaN, which the imputer fills,
+        # as the compiled path does, instead of an unknown category.
+        for col in self.categorical_inputs:
+            values = input_df[col]
+            if pd.api.types.is_numeric_dtype(values):
+                values = values.astype(str)
+            input_df[col] = values.where(input_df[col].notna())
+        return input_df
+
+    def predict_row(self, row):
+        """Prediction for one record already normalized by coerce_row."""
+        if self.compiled is not None:
+            return self.compiled.predict_one(row)
+        return self.model.predict(self.preprocessor.transform(self.prepare_input(pd.DataFrame([row]))))[0]
+
+    def transform_rows(self, rows):
+        """Feature matrix for a list of records normalized by coerce_row."""
+        if self.compiled is not None:
+            return self.compiled.transform_rows(rows)
+        return self.preprocessor.transform(self.prepare_input(pd.DataFrame(rows)))
+
+    def predict_matrix(self, X):
+        if self.compiled is not None:
+            return self.compiled.regressor.predict(X)
+        return self.model.predict(X)
+
+    def predict_rows(self, rows):
+        return self.predict_matrix(self.transform_rows(rows))
+
+    def predict_frame(self, df):
+        return self.model.predict(self.preprocessor.transform(self.prepare_input(df)))
+
+    def interval_offsets(self, row):
+        """(low, high) to add to the prediction for `row`: the bounds of its finest known segment."""
+        if self.intervals is None:
+            return -self.margin, self.margin
+        for columns, bounds in self._interval_levels:
+            found = bounds.get(tuple(row.get(col) for col in columns))
+            if found is not None:
+                return found
+        return self.intervals["default"]
+
+    def interval_frame_offsets(self, df):
+        """Arrays of low and high offsets for every row of a DataFrame."""
+        if self.intervals is None:
+            return np.full(len(df), -self.margin), np.full(len(df), self.margin)
+        return frame_offsets(self._interval_frames, self.intervals["default"], df)
+
+    def warm(self):
+        """Run both prediction paths once so the first real request pays no first-call cost."""
+        start = time.perf_counter()
+        row = {col: options[0] for col, options in self.categorical_options.items() if options}
+        row.update({col: 1.0 for col in self.numeric_inputs if col not in row})
+        self.predict_row(row)
+        self.predict_frame(pd.DataFrame([row] * 8))
+        self.timings["warm"] = time.perf_counter() - start
+
+    def describe(self):
+        return {"version": self.version, "model_name": self.model_name,
+                "path": self.path, "loaded_at": self.loaded_at,
+                "intervals": "segment residual quantiles" if self.intervals is not None else "global ±1.96σ",
+                "grid": self.grid.describe() if self.grid is not None else None}
+
+
+class ModelRegistry:
+    def __init__(self, path, versions_dir=None, on_swap=None):
+        self.path = path
+        self.versions_dir = versions_dir or os.path.join(os.path.dirname(path), "versions")
+        self.grids_dir = os.path.join(os.path.dirname(path), "grids")
+        self.on_swap = on_swap
+        self.last_error = None
+        self._current = None
+        self._previous = None
+        self._stamp = None
+        # Serializes loads and swaps; requests never take it.
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def previous(self):
+        return self._previous
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _swap(self, candidate):
+        self._previous, self._current = self._current, candidate
+        if self.on_swap is not None:
+            self.on_swap(candidate)
+        logger.info("Serving model version %s (%s)", candidate.version, candidate.model_name)
+
+    def _load(self, path):
+        candidate = ServingModel(path, self.grids_dir)
+        versioned = os.path.join(self.versions_dir, f"{candidate.version}.pkl")
+        if os.path.exists(versioned):
+            candidate.path = versioned
+        candidate.warm()
+        return candidate
+
+    def reload(self):
+        """Load, warm and swap in whatever best_model.pkl now points to."""
+        with self._lock:
+            # Recorded first: a broken file is not retried until it changes again.
+            self._stamp = self._file_stamp()
+            candidate = self._load(self.path)
+            if self._current is None or candidate.version != self._current.version:
+                self._swap(candidate)
+            return self._current
+
+    def activate(self, version):
+        """Serve a version from models/versions/ and point best_model.pkl at it for every other worker."""
+        path = os.path.join(self.versions_dir, f"{version}.pkl")
+        if not os.path.exists(path):
+            raise LookupError(f"Unknown model version: {version}")
+        with self._lock:
+            candidate = self._load(path)
+            self._swap(candidate)
+            self._publish(candidate)
+            return candidate
+
+    def rollback(self):
+        """Instantly swap back to the previous model, which is still in memory."""
+        with self._lock:
+            if self._previous is None:
+                raise LookupError("No previous model version to roll back to")
+            self._swap(self._previous)
+            self._publish(self._current)
+            return self._current
+
+    def _publish(self, serving):
+        if os.path.dirname(serving.path) == self.versions_dir:
+            publish(serving.path, self.path)
+            self._stamp = self._file_stamp()
+
+    def versions(self):
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name[:-len(".pkl")] for name in os.listdir(self.versions_dir) if name.endswith(".pkl"))
+
+    def check(self):
+        """Reload if best_model.pkl has been replaced since it was last loaded."""
+        if self._file_stamp() != self._stamp:
+            self.reload()
+
+    def ensure_watcher(self, interval):
+        """
+        Start the file watcher thread of this process. Called on every request,
+        so each pre-forked worker starts its own (threads do not survive fork).
+        """
+        if interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, args=(interval,), daemon=True).start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.check()
+                self.last_error = None
+            except Exception as e:  # keep serving the current model
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Model reload failed: %s", self.last_error)
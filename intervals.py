@@ -0,0 +1,121 @@
+"""
+intervals.py
+
+Prediction intervals from out-of-fold residual quantiles, per segment.
+
+In-sample residuals understate the error of a model that fits its training
+rows closely (a Random Forest nearly memorizes them), and a single global
+±1.96σ gives a Paris studio and a rural house the same width. Here every
+row is scored by a copy of the pipeline that did not see it (K-fold), and
+the residual quantiles are tabulated per segment, e.g. agglomeration ×
+type_habitat. Segments with too few rows back off to a coarser level, then
+to the global quantiles.
+
+The table is a few plain dicts stored in the model artifact, so the web app
+turns a prediction into an interval with one or two dict lookups.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import KFold
+
+# Segment levels, finest first; a row takes the bounds of the first level
+# whose segment has at least MIN_SEGMENT_ROWS residuals.
+SEGMENT_LEVELS = [
+    ["agglomeration", "type_habitat"],
+    ["agglomeration"],
+    ["type_habitat"]
+]
+COVERAGE = 0.95
+MIN_SEGMENT_ROWS = 30
+INTERVAL_FOLDS = 5
+# Out-of-fold predictions need K refits: larger datasets are subsampled.
+INTERVAL_MAX_ROWS = 200_000
+
+def out_of_fold_residuals(pipeline, X, y, n_splits=INTERVAL_FOLDS, max_rows=INTERVAL_MAX_ROWS, random_state=42):
+    """
+    y - prediction for every row, each predicted by a clone of `pipeline`
+    fitted on the other folds. Returns (X, residuals), subsampled to max_rows.
+    """
+    if max_rows and len(X) > max_rows:
+        X = X.sample(n=max_rows, random_state=random_state)
+        y = y.loc[X.index]
+    residuals = np.empty(len(X))
+    for train_idx, test_idx in KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X):
+        model = clone(pipeline).fit(X.iloc[train_idx], y.iloc[train_idx])
+        residuals[test_idx] = y.iloc[test_idx].to_numpy() - model.predict(X.iloc[test_idx])
+    return X, residuals
+
+def _segment_keys(X, columns):
+    return pd.MultiIndex.from_arrays([X[col].astype(str) for col in columns])
+
+def residual_quantile_table(X, residuals, levels=SEGMENT_LEVELS, coverage=COVERAGE, min_rows=MIN_SEGMENT_ROWS):
+    """
+    {"coverage", "levels": [{"columns", "bounds": {segment tuple: (low, high)}}], "default": (low, high)}.
+    Bounds are residual quantiles: the interval of a prediction p is (p + low, p + high).
+    """
+    alpha = (1 - coverage) / 2
+    residuals = pd.Series(residuals, index=X.index)
+    table = {"coverage": coverage, "min_rows": min_rows, "levels": []}
+    for columns in levels:
+        grouped = residuals.groupby([X[col].astype(str).to_numpy() for col in columns])
+        counts = grouped.size()
+        bounds = grouped.quantile([alpha, 1 - alpha]).unstack()[counts >= min_rows]
+        table["levels"].append({
+            "columns": list(columns),
+            "bounds": {key if isinstance(key, tuple) else (key,): (float(low), float(high))
+                       for key, low, high in zip(bounds.index, bounds.iloc[:, 0], bounds.iloc[:, 1])}
+        })
+    table["default"] = (float(residuals.quantile(alpha)), float(residuals.quantile(1 - alpha)))
+    return table
+
+def interval_offsets(table, X):
+    """Vectorized (low, high) offsets of every row of X under `table`."""
+    low = np.full(len(X), np.nan)
+    high = np.full(len(X), np.nan)
+    for level in table["levels"]:
+        todo = np.isnan(low)
+        if not todo.any() or not level["bounds"]:
+            continue
+        bounds = pd.DataFrame.from_dict(level["bounds"], orient="index", columns=["low", "high"])
+        bounds.index = pd.MultiIndex.from_tuples(bounds.index)
+        found = bounds.reindex(_segment_keys(X[todo], level["columns"]))
+        low[todo] = found["low"].to_numpy()
+        high[todo] = found["high"].to_numpy()
+    missing = np.isnan(low)
+    low[missing], high[missing] = table["default"]
+    return low, high
+
+def evaluate_intervals(X, residuals, random_state=42, **table_args):
+    """
+    Coverage and mean width of segment intervals against the global ±1.96σ,
+    measured on residuals the table was not built from (2-fold cross-fit).
+    """
+    rows = []
+    halves = KFold(n_splits=2, shuffle=True, random_state=random_state).split(X)
+    for fit_idx, eval_idx in halves:
+        table = residual_quantile_table(X.iloc[fit_idx], residuals[fit_idx], **table_args)
+        low, high = interval_offsets(table, X.iloc[eval_idx])
+        margin = 1.96 * np.std(residuals[fit_idx])
+        r = residuals[eval_idx]
+        rows.append({"segment_coverage": np.mean((r >= low) & (r <= high)), "segment_width": np.mean(high - low),
+                     "global_coverage": np.mean(np.abs(r) <= margin), "global_width": 2 * margin})
+    return {key: float(np.mean([row[key] for row in rows])) for key in rows[0]}
+
+def intervals_from_residuals(X, residuals, folds, seconds=0.0, **table_args):
+    """Interval table from out-of-fold residuals computed elsewhere (e.g. by cross-validation)."""
+    start = time.perf_counter()
+    table = residual_quantile_table(X, residuals, **table_args)
+    table.update(folds=folds, rows=len(X), seconds=seconds + time.perf_counter() - start,
+                 evaluation=evaluate_intervals(X, residuals, **table_args))
+    return table
+
+def build_intervals(pipeline, X, y, n_splits=INTERVAL_FOLDS, max_rows=INTERVAL_MAX_ROWS, **table_args):
+    """Interval table for the artifact of `pipeline`, with its held-out evaluation."""
+    start = time.perf_counter()
+    X_oof, residuals = out_of_fold_residuals(pipeline, X, y, n_splits, max_rows)
+    table = intervals_from_residuals(X_oof, residuals, n_splits, time.perf_counter() - start, **table_args)
+    return table, residuals
@@ -4,24 +4,26 @@ lasso.py
 Train a Lasso Regression model on rental price data using a full preprocessing pipeline.
 Saves the trained model and prints evaluation metrics.
 
-Input:  data/loyers_clean.csv  
+Input:  script/data/loyers_clean.parquet (or .csv)  
 Output: models/lasso_model.pkl
 """
 
 import os
+import argparse
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import Lasso
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.impute import SimpleImputer
-from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import joblib
 
+from featurize import featurize
+from streaming import CHUNKSIZE, train_streaming
+from script.loyers_store import load_dataset
+
 # === Configuration ===
-DATA_FILE = "script/data/loyers_clean.csv"
+DATA_FILE = "script/data/loyers_clean"  # .parquet, .feather or .csv
 MODEL_DIR = "models"
 MODEL_FILE = os.path.join(MODEL_DIR, "lasso_model.pkl")
 TARGET = "loyer_m2"
@@ -36,35 +38,46 @@ CATEGORICAL_FEATURES = [
 ]
 
 def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path, encoding="ISO-8859-1")
-    df.columns = df.columns.str.strip().str.lower()
+    df = load_dataset(path, columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES + [TARGET])
     return df.dropna(subset=[TARGET])
 
-def build_pipeline() -> Pipeline:
-    numeric_pipeline = Pipeline([
-        ("imputer", SimpleImputer(strategy="mean")),
-        ("scaler", StandardScaler())
-    ])
-    categorical_pipeline = Pipeline([
-        ("imputer", SimpleImputer(strategy="most_frequent")),
-        ("encoder", OneHotEncoder(handle_unknown="ignore", sparse=False))
-    ])
-    preprocessor = ColumnTransformer([
-        ("num", numeric_pipeline, NUMERIC_FEATURES),
-        ("cat", categorical_pipeline, CATEGORICAL_FEATURES)
-    ])
-    pipeline = Pipeline([
-        ("preprocessing", preprocessor),
-        ("regressor", Lasso(alpha=0.01))
-    ])
-    return pipeline
+def build_regressor() -> Lasso:
+    return Lasso(alpha=0.01)
 
 def evaluate(y_true, y_pred):
     print(f"MAE:  {mean_absolute_error(y_true, y_pred):.2f}")
     print(f"RMSE: {np.sqrt(mean_squared_error(y_true, y_pred)):.2f}")
     print(f"R²:   {r2_score(y_true, y_pred):.3f}")
 
+def train_out_of_core(chunksize):
+    """Train on chunks of DATA_FILE (see streaming.py) instead of loading it whole."""
+    preprocessor, fitted, report, _ = train_streaming(DATA_FILE, {"regressor": build_regressor()}, chunksize)
+    metrics = report.iloc[0]
+    print(f"MAE:  {metrics['MAE']:.2f}")
+    print(f"RMSE: {metrics['RMSE']:.2f}")
+    print(f"R²:   {metrics['R2']:.3f}")
+
+    pipeline = Pipeline([
+        ("preprocessing", preprocessor),
+        ("regressor", fitted["regressor"])
+    ])
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    joblib.dump(pipeline, MODEL_FILE)
+    print(f"[✓] Model saved to {MODEL_FILE}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream", action="store_true",
+                        help="train out of core, reading the data in chunks")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows per chunk with --stream")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    if args.stream:
+        train_out_of_core(args.chunksize)
+        return
+
     print("[INFO] Loading data...")
     df = load_data(DATA_FILE)
     X = df[NUMERIC_FEATURES + CATEGORICAL_FEATURES]
@@ -75,16 +88,22 @@ def main():
         X, y, test_size=0.2, random_state=42
     )
 
-    print("[INFO] Building pipeline...")
-    pipeline = build_pipeline()
+    print("[INFO] Featurizing data...")
+    features = featurize(X_train, X_test)
 
     print("[INFO] Training model...")
-    pipeline.fit(X_train, y_train)
+    regressor = build_regressor()
+    regressor.fit(features.X_train, y_train)
 
     print("[INFO] Evaluating model...")
-    y_pred = pipeline.predict(X_test)
+    y_pred = regressor.predict(features.X_test)
     evaluate(y_test, y_pred)
 
+    pipeline = Pipeline([
+        ("preprocessing", features.preprocessor),
+        ("regressor", regressor)
+    ])
+
     os.makedirs(MODEL_DIR, exist_ok=True)
     joblib.dump(pipeline, MODEL_FILE)
     print(f"[✓] Model saved to {MODEL_FILE}")
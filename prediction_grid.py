@@ -0,0 +1,180 @@
+"""
+prediction_grid.py
+
+Precompute the best model's predictions over the whole input space.
+
+Every categorical input comes from a finite vocabulary, so the space is the
+observed (agglomeration, zone_complementaire) pairs x type_habitat x epoque
+x nombre_pieces, times a grid of surfaces; nombre_observations and
+nombre_logements are held at the values the fitted preprocessor imputes
+when they are missing, so a request without counts gets from the grid what
+the model would have predicted for it. The predictions are
+stored as a float32 .npy array (one row per categorical cell, one column
+per grid surface) that the web app memory-maps, next to a JSON file that
+describes the axes. The app then answers a request by lookup plus linear
+interpolation between the two nearest surfaces (flask_app/grid.py), and
+exports per-zone predictions for map rendering without running the model.
+
+evaluate_models.py --grid builds the grid of the new version before
+publishing it. Use this script to (re)build the grid of an existing one.
+
+Usage: python prediction_grid.py [--version VERSION] [--surface-points 48]
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.pipeline import FeatureUnion
+
+from featurize import NUMERICAL_FEATURES, CATEGORICAL_FEATURES
+from script.loyers_store import load_dataset
+
+# Configuration
+DATA_PATH = "script/data/loyers_clean"  # .parquet, .feather or .csv
+MODEL_DIR = "models"
+GRID_DIR = os.path.join(MODEL_DIR, "grids")
+VERSIONS_DIR = os.path.join(MODEL_DIR, "versions")
+BEST_MODEL_PATH = os.path.join(MODEL_DIR, "best_model.pkl")
+
+# Categorical axes of the grid, in array order. Zones are nested in their
+# agglomeration, so only the observed pairs are enumerated.
+CELL_AXES = [
+    ["agglomeration", "zone_complementaire"],
+    ["type_habitat"],
+    ["epoque_construction_homogene"],
+    ["nombre_pieces"]
+]
+HELD_COLUMNS = ["nombre_observations", "nombre_logements"]
+# Surfaces are spaced geometrically: rent per m² changes fastest for small homes.
+SURFACE_POINTS = 48
+# Rows scored per predict call while filling the grid.
+GRID_CHUNK_ROWS = 250_000
+# Off-grid points used to measure the interpolation error.
+CHECK_POINTS = 2000
+
+def grid_paths(version, directory=GRID_DIR):
+    return os.path.join(directory, f"{version}.npy"), os.path.join(directory, f"{version}.json")
+
+def grid_axes(X):
+    """Axis values: the observed combinations of each axis' columns, sorted."""
+    axes = []
+    for columns in CELL_AXES:
+        values = X[columns].dropna().astype(str).drop_duplicates().sort_values(columns)
+        axes.append({"columns": columns, "values": values.to_numpy().tolist()})
+    return axes
+
+def cell_frame(axes, cells, surface, held):
+    """Input rows for the flat cell indices `cells` at `surface`, in the training column order."""
+    positions = np.unravel_index(cells, [len(axis["values"]) for axis in axes])
+    rows = {}
+    for axis, position in zip(axes, positions):
+        values = np.array(axis["values"], dtype=object)[position]
+        for i, col in enumerate(axis["columns"]):
+            rows[col] = values[:, i]
+    rows["surface"] = surface
+    for col, value in held.items():
+        rows[col] = np.full(len(cells), value)
+    return pd.DataFrame(rows)[NUMERICAL_FEATURES + CATEGORICAL_FEATURES]
+
+def interpolate(grid, surfaces, cells, surface):
+    """Linear interpolation of the grid rows `cells` at `surface` (scalar or array)."""
+    j = np.clip(np.searchsorted(surfaces, surface, side="right") - 1, 0, len(surfaces) - 2)
+    weight = (surface - surfaces[j]) / (surfaces[j + 1] - surfaces[j])
+    return (1 - weight) * grid[cells, j] + weight * grid[cells, j + 1]
+
+def interpolation_error(predict, grid, axes, surfaces, held, n=CHECK_POINTS, random_state=42):
+    """Absolute error of grid interpolation against the model on random off-grid points."""
+    rng = np.random.default_rng(random_state)
+    cells = rng.integers(0, grid.shape[0], n)
+    surface = np.exp(rng.uniform(np.log(surfaces[0]), np.log(surfaces[-1]), n))
+    error = np.abs(predict(cell_frame(axes, cells, surface, held)) - interpolate(grid, surfaces, cells, surface))
+    return {"mean": float(error.mean()), "p99": float(np.quantile(error, 0.99)), "max": float(error.max())}
+
+def imputed_values(preprocessor):
+    """{column: value} that the fitted preprocessor imputes for a missing HELD_COLUMNS value."""
+    # Incrementally extended preprocessors (incremental.py) keep the original one first.
+    base = preprocessor.transformer_list[0][1] if isinstance(preprocessor, FeatureUnion) else preprocessor
+    for name, branch, columns in base.transformers_:
+        if name == "num":
+            imputer = branch.named_steps["imputer"]
+            return {col: float(value) for col, value in zip(columns, imputer.statistics_) if col in HELD_COLUMNS}
+    raise ValueError("The preprocessor has no numeric imputer")
+
+def build_grid(predict, X, version, held, model_name=None, directory=GRID_DIR,
+               surface_points=SURFACE_POINTS, chunk_rows=GRID_CHUNK_ROWS):
+    """
+    Score every cell of the input space with `predict` (a function of a
+    DataFrame of raw features), with the HELD_COLUMNS at `held` (see
+    imputed_values), and write models/grids/<version>.npy and .json.
+    Returns the metadata written to the JSON file.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    axes = grid_axes(X)
+    surfaces = np.geomspace(X["surface"].min(), X["surface"].max(), surface_points)
+    n_cells = int(np.prod([len(axis["values"]) for axis in axes]))
+
+    array_path, meta_path = grid_paths(version, directory)
+    tmp_path = f"{array_path}.tmp.npy"
+    grid = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n_cells, len(surfaces)))
+    cells_per_chunk = max(1, chunk_rows // len(surfaces))
+    for first in range(0, n_cells, cells_per_chunk):
+        cells = np.arange(first, min(first + cells_per_chunk, n_cells))
+        rows = cell_frame(axes, np.repeat(cells, len(surfaces)), np.tile(surfaces, len(cells)), held)
+        grid[cells] = predict(rows).reshape(len(cells), len(surfaces))
+    grid.flush()
+    fill_seconds = time.perf_counter() - start
+
+    meta = {
+        "version": version,
+        "model_name": model_name,
+        "shape": [n_cells, len(surfaces)],
+        "dtype": "float32",
+        "axes": axes,
+        "surfaces": surfaces.tolist(),
+        "held": {**held, "surface": float(X["surface"].median())},
+        "fill_seconds": fill_seconds,
+        "interpolation_error": interpolation_error(predict, grid, axes, surfaces, held),
+        "built_at": time.time()
+    }
+    del grid
+    os.replace(tmp_path, array_path)
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+    error = meta["interpolation_error"]
+    print(f"[✓] Prediction grid: {n_cells} cells x {len(surfaces)} surfaces "
+          f"({os.path.getsize(array_path) / 1024 ** 2:.1f} MB) in {fill_seconds:.1f}s, "
+          f"interpolation error mean {error['mean']:.3f} / p99 {error['p99']:.3f} €/m² -> {array_path}")
+    return meta
+
+def artifact_predictor(artifact):
+    """predict(DataFrame) for an artifact written by evaluate_models.save_best_model."""
+    model, preprocessor = artifact["model"], artifact["preprocessor"]
+    return lambda df: model.predict(preprocessor.transform(df))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute the model's predictions over the whole input space.")
+    parser.add_argument("--version", default=None,
+                        help="model version in models/versions/ (default: the one best_model.pkl points to)")
+    parser.add_argument("--data", default=DATA_PATH, help="training data the vocabularies and surface range come from")
+    parser.add_argument("--surface-points", type=int, default=SURFACE_POINTS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    path = os.path.join(VERSIONS_DIR, f"{args.version}.pkl") if args.version else BEST_MODEL_PATH
+    artifact = joblib.load(path)
+    X = load_dataset(args.data, columns=NUMERICAL_FEATURES + CATEGORICAL_FEATURES)
+    X["nombre_pieces"] = X["nombre_pieces"].astype(str).where(X["nombre_pieces"].notna())
+    build_grid(artifact_predictor(artifact), X, artifact["version"], imputed_values(artifact["preprocessor"]),
+               artifact["model_name"], surface_points=args.surface_points)
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,26 @@ random_forest.py
 Train a Random Forest regression model on rent prediction data
 using full preprocessing (scaling + encoding). Saves model and prints metrics.
 
-Input:  data/loyers_clean.csv
+Input:  script/data/loyers_clean.parquet (or .csv)
 Output: models/random_forest_model.pkl
 """
 
 import os
+import argparse
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.impute import SimpleImputer
-from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import joblib
 
+from featurize import featurize
+from incremental import update_and_compare
+from script.loyers_store import load_dataset
+
 # === Configuration ===
-DATA_FILE = "script/data/loyers_clean.csv"
+DATA_FILE = "script/data/loyers_clean"  # .parquet, .feather or .csv
 MODEL_DIR = "models"
 MODEL_FILE = os.path.join(MODEL_DIR, "random_forest_model.pkl")
 TARGET = "loyer_m2"
@@ -36,35 +38,50 @@ CATEGORICAL_FEATURES = [
 ]
 
 def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path, encoding="ISO-8859-1")
-    df.columns = df.columns.str.strip().str.lower()
+    df = load_dataset(path, columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES + [TARGET])
     return df.dropna(subset=[TARGET])
 
-def build_pipeline() -> Pipeline:
-    numeric_pipeline = Pipeline([
-        ("imputer", SimpleImputer(strategy="mean")),
-        ("scaler", StandardScaler())
-    ])
-    categorical_pipeline = Pipeline([
-        ("imputer", SimpleImputer(strategy="most_frequent")),
-        ("encoder", OneHotEncoder(handle_unknown="ignore", sparse=False))
-    ])
-    preprocessor = ColumnTransformer([
-        ("num", numeric_pipeline, NUMERIC_FEATURES),
-        ("cat", categorical_pipeline, CATEGORICAL_FEATURES)
-    ])
-    pipeline = Pipeline([
-        ("preprocessing", preprocessor),
-        ("regressor", RandomForestRegressor(n_estimators=100, random_state=42))
-    ])
-    return pipeline
+def build_regressor() -> RandomForestRegressor:
+    return RandomForestRegressor(n_estimators=100, random_state=42)
 
 def evaluate(y_true, y_pred):
     print(f"MAE:  {mean_absolute_error(y_true, y_pred):.2f}")
     print(f"RMSE: {np.sqrt(mean_squared_error(y_true, y_pred)):.2f}")
     print(f"R²:   {r2_score(y_true, y_pred):.3f}")
 
+def retrain_incrementally(new_data, n_new, compare=True):
+    """Update the saved model with the rows of `new_data` instead of retraining from scratch."""
+    print("[INFO] Loading saved model and data...")
+    pipeline = joblib.load(MODEL_FILE)
+    old = load_data(DATA_FILE)
+    new = load_data(new_data)
+    features = NUMERIC_FEATURES + CATEGORICAL_FEATURES
+
+    print(f"[INFO] Updating model with {len(new)} new rows...")
+    pipeline, report = update_and_compare(
+        pipeline, old[features], old[TARGET], new[features], new[TARGET], n_new=n_new, compare=compare
+    )
+    print(report.to_string(index=False))
+
+    joblib.dump(pipeline, MODEL_FILE)
+    print(f"[✓] Model saved to {MODEL_FILE}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--incremental", metavar="NEW_DATA",
+                        help="update the saved model with the rows of this dataset instead of retraining")
+    parser.add_argument("--new-trees", type=int, default=20,
+                        help="trees trained on the new rows in incremental mode")
+    parser.add_argument("--no-compare", action="store_true",
+                        help="skip the full retrain used to report time saved and metric drift")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    if args.incremental:
+        retrain_incrementally(args.incremental, args.new_trees, compare=not args.no_compare)
+        return
+
     print("[INFO] Loading data...")
     df = load_data(DATA_FILE)
     X = df[NUMERIC_FEATURES + CATEGORICAL_FEATURES]
@@ -75,16 +92,22 @@ def main():
         X, y, test_size=0.2, random_state=42
     )
 
-    print("[INFO] Building pipeline...")
-    pipeline = build_pipeline()
+    print("[INFO] Featurizing data...")
+    features = featurize(X_train, X_test)
 
     print("[INFO] Training model...")
-    pipeline.fit(X_train, y_train)
+    regressor = build_regressor()
+    regressor.fit(features.X_train, y_train)
 
     print("[INFO] Evaluating model...")
-    y_pred = pipeline.predict(X_test)
+    y_pred = regressor.predict(features.X_test)
     evaluate(y_test, y_pred)
 
+    pipeline = Pipeline([
+        ("preprocessing", features.preprocessor),
+        ("regressor", regressor)
+    ])
+
     os.makedirs(MODEL_DIR, exist_ok=True)
     joblib.dump(pipeline, MODEL_FILE)
     print(f"[✓] Model saved to {MODEL_FILE}")
@@ -1,115 +1,371 @@
+"""
+loyers_explore.py
+
+Exploratory report on the cleaned dataset (data/loyers_clean.*), written to
+a report directory as PNG figures, CSV tables and a report.md index. Nothing
+is displayed, so it runs headless (matplotlib's Agg backend).
+
+The dataset is read once, in chunks (see loyers_store.iter_dataset), and
+every statistic is accumulated during that pass:
+- moments, extremes and pairwise correlations of the numeric columns;
+- fixed-width histograms of loyer_m2, overall and per type_habitat and
+  nombre_pieces, from which the quantiles and box plots are drawn;
+- category counts and per-agglomeration rent levels;
+- a stratified sample (at most --per-stratum rows per type_habitat x
+  nombre_pieces) for the scatter plot, so rare strata stay visible at any
+  row count.
+
+The accumulated statistics are cached in the report directory, keyed by the
+data file and the settings; a rerun on unchanged data skips the pass.
+Feature importances are read from the trained models in models/
+(evaluate_models.py) instead of being refitted.
+
+Usage: python loyers_explore.py [--data data/loyers_clean.parquet] [--output report]
+"""
+
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import time
+import hashlib
+import argparse
+import joblib
 import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import seaborn as sns  # noqa: E402
 
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.linear_model import Lasso
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.impute import SimpleImputer
-from sklearn.model_selection import train_test_split
+from loyers_store import NUMERIC_COLUMNS, iter_dataset, resolve_path  # noqa: E402
 
 # === Configuration ===
 DATA_DIR = "data"
-CLEAN_FILE = os.path.join(DATA_DIR, "loyers_clean.csv")
-
-# === Load dataset ===
-df = pd.read_csv(CLEAN_FILE, encoding="ISO-8859-1")
-df.columns = df.columns.str.strip()
-print("Cleaned data loaded:", df.shape)
-
-# === Basic statistics ===
-print("\nDescriptive statistics for 'loyer_m2':")
-print(df["loyer_m2"].describe())
-
-# === Distribution of target ===
-plt.figure(figsize=(10, 5))
-sns.histplot(df["loyer_m2"], kde=True, bins=30, color="steelblue", edgecolor="black")
-plt.title("Distribution du loyer au m²")
-plt.xlabel("Loyer (€/m²)")
-plt.ylabel("Nombre de logements")
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-# === Boxplot: loyer_m2 by type of housing ===
-plt.figure(figsize=(10, 6))
-sns.boxplot(x="Type_habitat", y="loyer_m2", data=df)
-plt.title("Loyer au m² par type d'habitat")
-plt.ylabel("Loyer (€/m²)")
-plt.xticks(rotation=45)
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-# === Boxplot: loyer_m2 by number of rooms ===
-plt.figure(figsize=(12, 6))
-sns.boxplot(x="nombre_pieces", y="loyer_m2", data=df)
-plt.title("Loyer au m² selon le nombre de pièces")
-plt.xlabel("Nombre de pièces")
-plt.ylabel("Loyer (€/m²)")
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-# === Correlation matrix ===
-numeric_cols = ["loyer", "surface", "nombre_pieces", "nombre_observations", "nombre_logements", "loyer_m2"]
-corr_matrix = df[numeric_cols].corr()
-
-plt.figure(figsize=(8, 6))
-sns.heatmap(corr_matrix, annot=True, cmap="coolwarm", fmt=".2f")
-plt.title("Corrélation des variables numériques")
-plt.tight_layout()
-plt.show()
-
-# === Feature importance via RandomForest & Lasso ===
-numerical_cols = ["surface", "nombre_pieces", "nombre_observations", "nombre_logements"]
-categorical_cols = ["agglomeration", "Zone_complementaire", "Type_habitat", "epoque_construction_homogene"]
-
-num_pipeline = Pipeline([
-    ("imputer", SimpleImputer(strategy="mean")),
-    ("scaler", StandardScaler())
-])
-
-cat_pipeline = Pipeline([
-    ("imputer", SimpleImputer(strategy="most_frequent")),
-    ("encoder", OneHotEncoder(handle_unknown="ignore", sparse=False))
-])
-
-preprocessor = ColumnTransformer([
-    ("num", num_pipeline, numerical_cols),
-    ("cat", cat_pipeline, categorical_cols)
-])
-
-X = df[numerical_cols + categorical_cols]
-y = df["loyer_m2"]
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-X_train_transformed = preprocessor.fit_transform(X_train)
-feature_names = preprocessor.get_feature_names_out()
-
-rf = RandomForestRegressor(n_estimators=100, random_state=42)
-lasso = Lasso(alpha=0.01)
-
-rf.fit(X_train_transformed, y_train)
-lasso.fit(X_train_transformed, y_train)
-
-importance_df = pd.DataFrame({
-    "Variable": feature_names,
-    "Random Forest": rf.feature_importances_,
-    "Lasso": np.abs(lasso.coef_)
-}).sort_values(by="Random Forest", ascending=False).head(10)
-
-# === Plot feature importances ===
-plt.figure(figsize=(12, 6))
-importance_df.set_index("Variable").plot(kind="bar", figsize=(12, 6))
-plt.title("Top 10 - Importance des variables (Random Forest & Lasso)")
-plt.ylabel("Importance")
-plt.xticks(rotation=90)
-plt.grid(True)
-plt.tight_layout()
-plt.show()
+CLEAN_FILE = os.path.join(DATA_DIR, "loyers_clean")  # .parquet, .feather or .csv
+REPORT_DIR = "report"
+MODEL_DIR = os.path.join("..", "models")
+# Unpenalized linear coefficients of collinear one-hot columns say nothing about importance.
+MODEL_NAMES = ["random_forest", "xgboost", "lasso"]
+
+CATEGORICAL_COLUMNS = ["agglomeration", "zone_complementaire", "type_habitat", "epoque_construction_homogene"]
+GROUP_COLUMNS = ["type_habitat", "nombre_pieces"]  # box plots of loyer_m2
+STRATA = ["type_habitat", "nombre_pieces"]         # stratified sample
+BIN_WIDTH = 0.05  # €/m², resolution of the loyer_m2 quantiles
+PER_STRATUM = 2000
+CHUNKSIZE = 500_000
+
+# === One-pass statistics ===
+class ReportStats:
+    """Everything the report needs, accumulated chunk by chunk."""
+
+    def __init__(self, per_stratum=PER_STRATUM, bin_width=BIN_WIDTH, seed=42):
+        self.per_stratum = per_stratum
+        self.bin_width = bin_width
+        self.rng = np.random.default_rng(seed)
+        self.rows = 0
+        k = len(NUMERIC_COLUMNS)
+        self.count = np.zeros(k)
+        self.total = np.zeros(k)
+        self.total_sq = np.zeros(k)
+        self.minimum = np.full(k, np.inf)
+        self.maximum = np.full(k, -np.inf)
+        # Pairwise-complete sums, as DataFrame.corr() uses them.
+        self.pair_n = np.zeros((k, k))
+        self.pair_x = np.zeros((k, k))
+        self.pair_xx = np.zeros((k, k))
+        self.pair_xy = np.zeros((k, k))
+        self.histogram = np.zeros(0, dtype=np.int64)
+        self.group_histograms = {col: {} for col in GROUP_COLUMNS}
+        self.category_counts = {col: pd.Series(dtype="int64") for col in CATEGORICAL_COLUMNS}
+        self.agglomerations = pd.DataFrame(columns=["count", "loyer_m2_sum"], dtype="float64")
+        self.sample = None
+
+    def _bins(self, values):
+        values = values[~np.isnan(values)]
+        return np.bincount(np.clip(values / self.bin_width, 0, None).astype(np.int64))
+
+    @staticmethod
+    def _add(counts, new):
+        if len(new) > len(counts):
+            counts = np.pad(counts, (0, len(new) - len(counts)))
+        counts[:len(new)] += new
+        return counts
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        X = chunk[NUMERIC_COLUMNS].to_numpy(dtype=float)
+        present = ~np.isnan(X)
+        filled = np.where(present, X, 0.0)
+        self.count += present.sum(axis=0)
+        self.total += filled.sum(axis=0)
+        self.total_sq += (filled ** 2).sum(axis=0)
+        self.minimum = np.minimum(self.minimum, np.where(present, X, np.inf).min(axis=0))
+        self.maximum = np.maximum(self.maximum, np.where(present, X, -np.inf).max(axis=0))
+        mask = present.astype(float)
+        self.pair_n += mask.T @ mask
+        self.pair_x += filled.T @ mask
+        self.pair_xx += (filled ** 2).T @ mask
+        self.pair_xy += filled.T @ filled
+
+        loyer_m2 = chunk["loyer_m2"].to_numpy(dtype=float)
+        self.histogram = self._add(self.histogram, self._bins(loyer_m2))
+        for col in GROUP_COLUMNS:
+            histograms = self.group_histograms[col]
+            codes, uniques = pd.factorize(chunk[col])
+            for code, value in enumerate(uniques):
+                histograms[value] = self._add(histograms.get(value, np.zeros(0, dtype=np.int64)),
+                                              self._bins(loyer_m2[codes == code]))
+
+        for col in CATEGORICAL_COLUMNS:
+            counts = chunk[col].astype("string").value_counts()
+            self.category_counts[col] = self.category_counts[col].add(counts, fill_value=0)
+        agglomerations = chunk.groupby(chunk["agglomeration"].astype("string"))["loyer_m2"].agg(["count", "sum"])
+        agglomerations.columns = ["count", "loyer_m2_sum"]
+        self.agglomerations = self.agglomerations.add(agglomerations, fill_value=0)
+
+        # Bottom-k by a random key in each stratum: a uniform sample of every
+        # stratum without replacement, whatever the chunking.
+        rows = chunk[["surface", "loyer_m2"] + STRATA].assign(_key=self.rng.random(len(chunk)))
+        rows[STRATA] = rows[STRATA].astype("string")
+        pool = rows if self.sample is None else pd.concat([self.sample, rows], ignore_index=True)
+        self.sample = (pool.sort_values("_key").groupby(STRATA, dropna=False, sort=False)
+                       .head(self.per_stratum).reset_index(drop=True))
+
+    # --- Derived statistics ---
+    def numeric_summary(self):
+        mean = self.total / self.count
+        std = np.sqrt(np.maximum(self.total_sq / self.count - mean ** 2, 0) * self.count / (self.count - 1))
+        return pd.DataFrame({"count": self.count, "mean": mean, "std": std,
+                             "min": self.minimum, "max": self.maximum}, index=NUMERIC_COLUMNS)
+
+    def correlation(self):
+        n = self.pair_n
+        mean_x, mean_y = self.pair_x / n, self.pair_x.T / n
+        cov = self.pair_xy / n - mean_x * mean_y
+        var_x = self.pair_xx / n - mean_x ** 2
+        var_y = self.pair_xx.T / n - mean_y ** 2
+        return pd.DataFrame(cov / np.sqrt(var_x * var_y), index=NUMERIC_COLUMNS, columns=NUMERIC_COLUMNS)
+
+    def quantiles(self, counts, qs):
+        """Quantiles of loyer_m2 from a histogram, at bin centres (±bin_width / 2)."""
+        cumulative = np.cumsum(counts)
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side="left")
+        return (positions + 0.5) * self.bin_width
+
+    def box_stats(self, counts, label):
+        """Box plot statistics (matplotlib bxp format) of a loyer_m2 histogram; outliers omitted."""
+        q1, med, q3 = self.quantiles(counts, [0.25, 0.5, 0.75])
+        centres = (np.flatnonzero(counts) + 0.5) * self.bin_width
+        iqr = q3 - q1
+        return {"label": label, "q1": q1, "med": med, "q3": q3, "fliers": [],
+                "whislo": centres[centres >= q1 - 1.5 * iqr].min(),
+                "whishi": centres[centres <= q3 + 1.5 * iqr].max()}
+
+def stats_key(path, per_stratum, bin_width):
+    stat = os.stat(path)
+    return hashlib.sha256(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+                                per_stratum, bin_width)).encode()).hexdigest()[:32]
+
+def collect_stats(path, output_dir, per_stratum=PER_STRATUM, chunksize=CHUNKSIZE, use_cache=True):
+    """ReportStats of the dataset, from the cache in output_dir when the data has not changed."""
+    path = resolve_path(path)
+    key = stats_key(path, per_stratum, BIN_WIDTH)
+    cache_path = os.path.join(output_dir, "stats_cache.joblib")
+    if use_cache and os.path.exists(cache_path):
+        cached = joblib.load(cache_path)
+        if cached["key"] == key:
+            print(f"[✓] Loaded cached statistics: {cache_path}")
+            stats = ReportStats.__new__(ReportStats)
+            stats.__dict__.update(cached["stats"])
+            return stats
+
+    start = time.perf_counter()
+    stats = ReportStats(per_stratum)
+    columns = list(dict.fromkeys(NUMERIC_COLUMNS + CATEGORICAL_COLUMNS))
+    for chunk in iter_dataset(path, columns=columns, chunksize=chunksize):
+        stats.update(chunk)
+    print(f"[✓] {stats.rows} rows summarized in one pass ({time.perf_counter() - start:.1f}s)")
+
+    tmp_path = f"{cache_path}.tmp"
+    # Plain attributes, so the cache does not depend on where the class is imported from.
+    joblib.dump({"key": key, "stats": vars(stats)}, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return stats
+
+# === Feature importances of the trained models ===
+def forest_importances(forest):
+    """
+    A forest's feature_importances_, also for one widened by incremental.py,
+    whose older trees were fitted on fewer columns: they count zero for the
+    columns appended after them.
+    """
+    n_features = forest.n_features_in_
+    values = [np.pad(tree.feature_importances_, (0, n_features - len(tree.feature_importances_)))
+              for tree in forest.estimators_ if tree.tree_.node_count > 1]
+    if not values:
+        return np.zeros(n_features)
+    values = np.mean(values, axis=0)
+    return values / values.sum() if values.sum() else values
+
+def feature_importances(model_dir=MODEL_DIR):
+    """One column per trained model in model_dir: feature_importances_, or |coef_| for linear models."""
+    columns = {}
+    for name in MODEL_NAMES:
+        path = os.path.join(model_dir, f"{name}.pkl")
+        if not os.path.exists(path):
+            continue
+        pipeline = joblib.load(path)
+        preprocessor, regressor = pipeline.steps[0][1], pipeline.steps[-1][1]
+        if hasattr(regressor, "estimators_") and hasattr(regressor.estimators_[0], "tree_"):
+            values = forest_importances(regressor)
+        elif hasattr(regressor, "feature_importances_"):
+            values = regressor.feature_importances_
+        elif hasattr(regressor, "coef_"):
+            values = np.abs(np.ravel(regressor.coef_))
+        else:
+            continue
+        try:
+            names = preprocessor.get_feature_names_out()
+        except (AttributeError, ValueError):
+            names = [f"feature_{i}" for i in range(len(values))]
+        columns[name] = pd.Series(values, index=names)
+    return pd.DataFrame(columns)
+
+def source_variable(feature):
+    """Input column a preprocessed feature comes from, e.g. 'cat__agglomeration_Lyon' -> 'agglomeration'."""
+    name = feature.split("__", 1)[-1]
+    for col in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS:
+        if name == col or name.startswith(col + "_"):
+            return col
+    return name
+
+# === Report ===
+def save_figure(fig, output_dir, name, figures):
+    path = os.path.join(output_dir, f"{name}.png")
+    fig.tight_layout()
+    fig.savefig(path, dpi=110)
+    plt.close(fig)
+    figures.append(path)
+
+def save_table(df, output_dir, name, tables, index=True):
+    path = os.path.join(output_dir, f"{name}.csv")
+    df.to_csv(path, index=index)
+    tables.append(path)
+
+def write_report(stats, output_dir, model_dir=MODEL_DIR, data_path=None):
+    figures, tables = [], []
+
+    # Distribution of the target, rebinned to about 60 bars
+    summary = stats.numeric_summary()
+    qs = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+    target = summary.loc["loyer_m2"].to_dict()
+    target.update({f"{q:.0%}": value for q, value in zip(qs, stats.quantiles(stats.histogram, qs))})
+    save_table(pd.Series(target, name="loyer_m2").to_frame(), output_dir, "loyer_m2_summary", tables)
+    save_table(summary, output_dir, "numeric_summary", tables)
+
+    low, high = stats.quantiles(stats.histogram, [0.001, 0.999])
+    factor = max(1, int(np.ceil((high - low) / stats.bin_width / 60)))
+    counts = stats.histogram[:len(stats.histogram) // factor * factor].reshape(-1, factor).sum(axis=1)
+    edges = np.arange(len(counts) + 1) * factor * stats.bin_width
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.stairs(counts, edges, fill=True, color="steelblue", edgecolor="black")
+    ax.set_xlim(low, high)
+    ax.set_title("Distribution du loyer au m²")
+    ax.set_xlabel("Loyer (€/m²)")
+    ax.set_ylabel("Nombre de logements")
+    ax.grid(True)
+    save_figure(fig, output_dir, "loyer_m2_distribution", figures)
+
+    # Box plots of loyer_m2 by group, from the group histograms
+    titles = {"type_habitat": "Loyer au m² par type d'habitat",
+              "nombre_pieces": "Loyer au m² selon le nombre de pièces"}
+    for col in GROUP_COLUMNS:
+        groups = sorted(value for value, counts in stats.group_histograms[col].items()
+                        if not pd.isna(value) and counts.sum())
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.bxp([stats.box_stats(stats.group_histograms[col][value], f"{value:g}" if col == "nombre_pieces"
+                                else str(value)) for value in groups], showfliers=False)
+        ax.set_title(titles[col])
+        ax.set_ylabel("Loyer (€/m²)")
+        ax.grid(True)
+        save_figure(fig, output_dir, f"loyer_m2_by_{col}", figures)
+
+    # Correlation matrix
+    corr = stats.correlation()
+    save_table(corr, output_dir, "correlation", tables)
+    fig, ax = plt.subplots(figsize=(8, 6))
+    sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f", ax=ax)
+    ax.set_title("Corrélation des variables numériques")
+    save_figure(fig, output_dir, "correlation", figures)
+
+    # Rent against surface, on the stratified sample
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.scatterplot(data=stats.sample, x="surface", y="loyer_m2", hue="type_habitat", s=8, alpha=0.4, ax=ax)
+    ax.set_title(f"Loyer au m² selon la surface (échantillon de {len(stats.sample)} logements)")
+    ax.set_xlabel("Surface (m²)")
+    ax.set_ylabel("Loyer (€/m²)")
+    ax.grid(True)
+    save_figure(fig, output_dir, "loyer_m2_vs_surface", figures)
+
+    # Category counts and rent level per agglomeration
+    counts = pd.concat([series.sort_values(ascending=False).rename("count").to_frame().assign(column=col)
+                        for col, series in stats.category_counts.items()])
+    counts["count"] = counts["count"].astype("int64")
+    save_table(counts.rename_axis("value").reset_index()[["column", "value", "count"]], output_dir,
+               "category_counts", tables, index=False)
+    agglomerations = stats.agglomerations.assign(
+        loyer_m2_mean=stats.agglomerations["loyer_m2_sum"] / stats.agglomerations["count"]
+    ).drop(columns="loyer_m2_sum").sort_values("count", ascending=False)
+    save_table(agglomerations.rename_axis("agglomeration"), output_dir, "agglomeration_summary", tables)
+
+    # Feature importances of the trained models
+    importances = feature_importances(model_dir)
+    if importances.empty:
+        print(f"[SKIP] Feature importances: no trained model in {model_dir}; run evaluate_models.py first.")
+    else:
+        first = importances.columns[0]
+        top = importances.sort_values(first, ascending=False).head(10)
+        save_table(importances.sort_values(first, ascending=False), output_dir, "feature_importance", tables)
+        by_variable = importances.groupby(importances.index.map(source_variable)).sum()
+        save_table(by_variable.sort_values(first, ascending=False), output_dir, "feature_importance_by_variable",
+                   tables)
+        # Linear coefficients and impurity importances are on different
+        # scales: each model's column is normalized to sum to 1.
+        fig, ax = plt.subplots(figsize=(12, 6))
+        (top / importances.sum()).plot(kind="bar", ax=ax)
+        ax.set_title("Top 10 - Importance des variables (modèles entraînés)")
+        ax.set_ylabel("Importance (part du total)")
+        ax.grid(True)
+        save_figure(fig, output_dir, "feature_importance", figures)
+
+    # Index
+    lines = ["# Rapport exploratoire - loyers", "",
+             f"Source : `{data_path}` ({stats.rows} lignes)", "",
+             "## Loyer au m²", "", "| Statistique | Valeur |", "|---|---|"]
+    lines += [f"| {name} | {value:.2f} |" for name, value in target.items()]
+    lines += ["", "## Figures", ""]
+    lines += [f"![{os.path.basename(path)}]({os.path.basename(path)})" for path in figures]
+    lines += ["", "## Tables", ""] + [f"- [{os.path.basename(path)}]({os.path.basename(path)})" for path in tables]
+    with open(os.path.join(output_dir, "report.md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return figures, tables
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write the exploratory report of the cleaned dataset.")
+    parser.add_argument("--data", default=CLEAN_FILE)
+    parser.add_argument("--output", default=REPORT_DIR, help="report directory")
+    parser.add_argument("--models", default=MODEL_DIR, help="directory of the models trained by evaluate_models.py")
+    parser.add_argument("--per-stratum", type=int, default=PER_STRATUM,
+                        help="sampled rows per type_habitat x nombre_pieces for the scatter plot")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--no-cache", action="store_true", help="recompute the statistics even if cached")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.makedirs(args.output, exist_ok=True)
+    stats = collect_stats(args.data, args.output, args.per_stratum, args.chunksize, use_cache=not args.no_cache)
+    figures, tables = write_report(stats, args.output, args.models, data_path=resolve_path(args.data))
+    print(f"[✓] Report written to '{os.path.join(args.output, 'report.md')}' "
+          f"({len(figures)} figures, {len(tables)} tables)")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
+"""
+loyers_obtain.py
+
+Download the rent observatory sources (OpenDataSoft export + data.gouv.fr
+yearly CSVs) and combine them into data/loyers_raw.csv.
+
+Sources are fetched concurrently into an on-disk cache. A cached file is
+revalidated with its ETag/Last-Modified (or, when the server sends neither,
+compared by content hash), interrupted downloads resume with HTTP Range
+requests, and each source is parsed as soon as it arrives. Source URLs can be
+overridden on the command line, e.g. to point at a local test server.
+"""
+
 import os
+import json
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 import pandas as pd
 
 # Output configuration
 DATA_DIR = "data"
 RAW_FILE = os.path.join(DATA_DIR, "loyers_raw.csv")
-
-# Ensure data directory exists
-os.makedirs(DATA_DIR, exist_ok=True)
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
 
 # OpenDataSoft API endpoint
 ODS_API_URL = (
@@ -15,17 +33,6 @@ ODS_API_URL = (
     "resultats-nationaux-des-observatoires-locaux-des-loyers-france/exports/json"
 )
 
-# Load data from OpenDataSoft
-try:
-    print("Fetching OpenDataSoft data...")
-    response = requests.get(ODS_API_URL)
-    response.raise_for_status()
-    df_ods = pd.DataFrame(response.json())
-    print("OpenDataSoft data loaded successfully.")
-except requests.exceptions.RequestException as e:
-    print(f"Failed to fetch OpenDataSoft data: {e}")
-    df_ods = pd.DataFrame()
-
 # Data.gouv.fr sources (CSV files for years 2014–2024)
 DATA_GOUV_CSV_URLS = [
     "https://www.data.gouv.fr/fr/datasets/r/13d660de-6108-4df6-8a54-1828a991a186",
@@ -41,28 +48,209 @@ DATA_GOUV_CSV_URLS = [
     "https://www.data.gouv.fr/fr/datasets/r/42aaf838-46c9-4434-95a9-00173c6d4627",
 ]
 
-# Load data from data.gouv.fr CSV files
-df_gouv_list = []
-for url in DATA_GOUV_CSV_URLS:
+def build_sources(ods_url=ODS_API_URL, csv_urls=DATA_GOUV_CSV_URLS):
+    """Ordered list of sources; the order is the row order of the combined file."""
+    sources = []
+    if ods_url:
+        sources.append({"name": "opendatasoft", "url": ods_url, "format": "json"})
+    for i, url in enumerate(csv_urls):
+        sources.append({"name": f"data_gouv_{i:02d}", "url": url, "format": "csv"})
+    return sources
+
+# === Download cache ===
+def _read_meta(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def _write_meta(path, meta):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _range_total(content_range):
+    """Total size from a Content-Range header such as "bytes */12345", or None."""
     try:
-        print(f"Downloading: {url}")
-        df = pd.read_csv(url, delimiter=";", encoding="ISO-8859-1", low_memory=False)
-        df_gouv_list.append(df)
-    except Exception as e:
-        print(f"Error loading CSV from {url}: {e}")
-
-# Concatenate all datasets
-df_gouv = pd.concat(df_gouv_list, ignore_index=True) if df_gouv_list else pd.DataFrame()
-df_loyers = pd.concat([df_ods, df_gouv], ignore_index=True)
-
-# Clean column names
-df_loyers.columns = df_loyers.columns.str.strip()
-
-# Save result
-if not df_loyers.empty:
-    df_loyers.to_csv(RAW_FILE, index=False, encoding="ISO-8859-1")
-    print(f"Combined dataset saved to '{RAW_FILE}' ({len(df_loyers)} rows).")
-    print("First 5 rows:")
-    print(df_loyers.head())
-else:
-    print("No valid data collected. Check sources or connection.")
+        return int(content_range.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def download(source, cache_dir=CACHE_DIR, session=None):
+    """
+    Fetch one source into the cache and return (path, meta, changed).
+
+    - A complete cached copy is revalidated with If-None-Match /
+      If-Modified-Since; a 304 reuses it without downloading.
+    - A partial copy (.part) is resumed with a Range request, guarded by
+      If-Range so a changed upstream file restarts from scratch. If the
+      server answers 416, a .part of the full size is already complete;
+      any other one is deleted and the download restarts.
+    - `changed` is False when the content hash matches the previous download,
+      even if the server offered no validators.
+    """
+    session = session or requests.Session()
+    path = os.path.join(cache_dir, source["name"])
+    part_path = f"{path}.part"
+    meta_path = f"{path}.meta.json"
+    meta = _read_meta(meta_path)
+    if meta.get("url") != source["url"]:
+        meta = {}
+
+    headers = {}
+    validator = meta.get("etag") or meta.get("last_modified")
+    if os.path.exists(path) and meta.get("complete"):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    elif os.path.exists(part_path) and validator:
+        headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+        headers["If-Range"] = validator
+
+    with session.get(source["url"], headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return path, meta, False
+        restart = False
+        if response.status_code == 416 and "Range" in headers:
+            # Nothing left to fetch past the end of the .part.
+            restart = _range_total(response.headers.get("Content-Range")) != os.path.getsize(part_path)
+        else:
+            response.raise_for_status()
+
+            resumed = response.status_code == 206
+            if not resumed:
+                # Record validators before writing, so an interrupted transfer can resume.
+                meta = {
+                    "url": source["url"],
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "previous_sha256": meta.get("sha256"),
+                    "complete": False
+                }
+                _write_meta(meta_path, meta)
+
+            with open(part_path, "ab" if resumed else "wb") as f:
+                for block in response.iter_content(CHUNK_SIZE):
+                    f.write(block)
+
+    if restart:
+        # Stale partial copy: without it and its validators the next request has no Range.
+        os.remove(part_path)
+        os.remove(meta_path)
+        return download(source, cache_dir, session)
+
+    meta["sha256"] = _sha256(part_path)
+    meta["size"] = os.path.getsize(part_path)
+    meta["complete"] = True
+    os.replace(part_path, path)
+    _write_meta(meta_path, meta)
+    return path, meta, meta["sha256"] != meta.get("previous_sha256")
+
+# === Parsing ===
+def parse_source(source, path):
+    if source["format"] == "json":
+        with open(path, encoding="utf-8") as f:
+            df = pd.DataFrame(json.load(f))
+    else:
+        df = pd.read_csv(path, delimiter=";", encoding="ISO-8859-1", low_memory=False)
+    df.columns = df.columns.str.strip()
+    return df
+
+def fetch_and_parse(source, cache_dir=CACHE_DIR, session=None):
+    """
+    Download (or revalidate) one source and parse it, reusing the parsed
+    frame from the cache when the content has not changed.
+    """
+    path, meta, changed = download(source, cache_dir, session)
+    parsed_path = f"{path}.parsed.pkl"
+    if changed or not os.path.exists(parsed_path):
+        df = parse_source(source, path)
+        df.to_pickle(parsed_path)
+        rows = len(df)
+    else:
+        rows = meta.get("rows")
+    if meta.get("rows") != rows:
+        meta["rows"] = rows
+        _write_meta(f"{path}.meta.json", meta)
+    return {"name": source["name"], "parsed_path": parsed_path, "changed": changed,
+            "rows": rows, "sha256": meta["sha256"]}
+
+def fetch_all(sources, cache_dir=CACHE_DIR, workers=8):
+    """Fetch every source concurrently; returns results in source order."""
+    os.makedirs(cache_dir, exist_ok=True)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_and_parse, source, cache_dir, session): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                result = future.result()
+                status = "downloaded" if result["changed"] else "cached"
+                print(f"[✓] {source['name']}: {result['rows']} rows ({status}) <- {source['url']}")
+                results[source["name"]] = result
+            except (requests.exceptions.RequestException, ValueError, OSError) as e:
+                print(f"Error loading {source['url']}: {e}")
+    return [results[source["name"]] for source in sources if source["name"] in results]
+
+# === Combine ===
+def combine(results, output=RAW_FILE):
+    """
+    Write the parsed sources to one CSV, one source at a time, aligned on the
+    union of their columns (same layout as concatenating them all).
+    """
+    columns = []
+    for result in results:
+        header = pd.read_pickle(result["parsed_path"]).columns
+        columns.extend(col for col in header if col not in columns)
+
+    total = 0
+    tmp_path = f"{output}.tmp"
+    for i, result in enumerate(results):
+        df = pd.read_pickle(result["parsed_path"]).reindex(columns=columns)
+        df.to_csv(tmp_path, mode="w" if i == 0 else "a", header=(i == 0),
+                  index=False, encoding="ISO-8859-1")
+        total += len(df)
+    os.replace(tmp_path, output)
+    return total
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download and combine the rent observatory sources.")
+    parser.add_argument("--ods-url", default=ODS_API_URL,
+                        help="OpenDataSoft JSON export URL (empty string to skip)")
+    parser.add_argument("--csv-url", action="append", dest="csv_urls",
+                        help="data.gouv.fr CSV URL; repeat to replace the default list")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--output", default=RAW_FILE)
+    parser.add_argument("--workers", type=int, default=8)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+
+    sources = build_sources(args.ods_url, args.csv_urls if args.csv_urls is not None else DATA_GOUV_CSV_URLS)
+    print(f"Fetching {len(sources)} sources with {args.workers} workers...")
+    results = fetch_all(sources, args.cache_dir, args.workers)
+
+    if results:
+        total = combine(results, args.output)
+        print(f"Combined dataset saved to '{args.output}' ({total} rows).")
+    else:
+        print("No valid data collected. Check sources or connection.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+loyers_refresh.py
+
+Incrementally refresh the cleaned dataset from the rent observatory sources.
+
+Each source is scrubbed into its own partition (data/partitions/<source>.*),
+and data/manifest.json records, per source, the content hash, raw and clean
+row counts and processing state. A refresh downloads every source through the
+loyers_obtain cache, but only scrubs sources that are new or whose content
+changed. The clean dataset is then reassembled from the partitions, keeping
+the most recent row for each observatory key. The partitions that were added,
+changed or removed are reported and stored under "last_refresh" in the
+manifest, so downstream training can decide whether to rerun.
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime, timezone
+import pandas as pd
+
+from loyers_obtain import CACHE_DIR, DATA_GOUV_CSV_URLS, ODS_API_URL, build_sources, fetch_all
+from loyers_scrub import CLEAN_FILE, DATA_DIR, scrub_file
+from loyers_store import (
+    CSV_ENCODING, NUMERIC_COLUMNS, DatasetWriter, dataset_columns, dataset_path, load_dataset
+)
+
+# Define file paths
+MANIFEST_FILE = os.path.join(DATA_DIR, "manifest.json")
+PARTITION_DIR = os.path.join(DATA_DIR, "partitions")
+
+# Columns identifying one observatory measurement, as loyers_store lowercases
+# the source headers (Observatory, Data_annee, ...); those absent from every
+# partition are ignored. A later source wins over an earlier one.
+OBSERVATORY_KEYS = [
+    "observatory",
+    "data_annee",
+    "agglomeration",
+    "zone_complementaire",
+    "type_habitat",
+    "epoque_construction_homogene",
+    "anciennete_locataire_homogene",
+    "nombre_pieces"
+]
+
+# === Manifest ===
+def read_manifest(path=MANIFEST_FILE):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"sources": {}}
+
+def write_manifest(manifest, path=MANIFEST_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def needs_scrub(entry, result):
+    if not entry or entry.get("sha256") != result["sha256"]:
+        return True
+    if entry.get("state") == "scrubbed":
+        return not os.path.exists(entry["partition"])
+    return entry.get("state") != "empty"
+
+# === Partitions ===
+def scrub_partition(result, partition_dir=PARTITION_DIR, cache_dir=CACHE_DIR, chunksize=None):
+    """Scrub one fetched source into its partition and return its manifest entry."""
+    name = result["name"]
+    partition = dataset_path(os.path.join(partition_dir, name))
+    entry = {"sha256": result["sha256"], "raw_rows": result["rows"], "partition": partition}
+
+    # Same text round trip as the combined raw file, so the rules see identical values.
+    raw_path = os.path.join(cache_dir, f"{name}.raw.csv")
+    pd.read_pickle(result["parsed_path"]).to_csv(raw_path, index=False, encoding=CSV_ENCODING)
+    try:
+        counts = scrub_file(raw_path, partition, chunksize)
+    except KeyError as e:
+        counts = {"final": 0}
+        entry["note"] = e.args[0]
+    finally:
+        os.remove(raw_path)
+
+    if counts["final"]:
+        entry.update(state="scrubbed", clean_rows=counts["final"], columns=dataset_columns(partition))
+    else:
+        # No partition file is written for a source without usable rows.
+        if os.path.exists(partition):
+            os.remove(partition)
+        entry.update(state="empty", clean_rows=0, columns=[])
+    entry["updated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    return entry
+
+def key_hashes(path, keys):
+    """64-bit hash of the observatory key of every row (missing key columns count as NA)."""
+    present = [col for col in keys if col in dataset_columns(path)]
+    df = load_dataset(path, columns=present).reindex(columns=keys).astype("string")
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def assemble(entries, output=CLEAN_FILE):
+    """
+    Rebuild the clean dataset from the partitions, in source order, dropping
+    every row whose observatory key reappears later. Only the key columns are
+    held in memory across partitions; rows are written one partition at a time.
+    """
+    columns = []
+    for entry in entries:
+        columns.extend(col for col in entry["columns"] if col not in columns)
+    keys = [col for col in OBSERVATORY_KEYS if col in columns]
+
+    # Walk the partitions backwards so the last occurrence of a key is kept.
+    masks, seen = {}, set()
+    for entry in reversed(entries if keys else []):
+        hashes = pd.Series(key_hashes(entry["partition"], keys))
+        keep = ~hashes.duplicated(keep="last") & ~hashes.isin(seen)
+        seen.update(hashes[keep])
+        masks[entry["partition"]] = keep.to_numpy()
+
+    rows, duplicates = 0, 0
+    with DatasetWriter(output) as writer:
+        for entry in entries:
+            df = load_dataset(entry["partition"])
+            if entry["partition"] in masks:
+                duplicates += int((~masks[entry["partition"]]).sum())
+                df = df[masks[entry["partition"]]]
+            # Align on the union of columns, with the dtype the column has elsewhere.
+            for col in columns:
+                if col not in df.columns:
+                    df[col] = pd.Series(float("nan") if col in NUMERIC_COLUMNS else pd.NA, index=df.index,
+                                        dtype="float64" if col in NUMERIC_COLUMNS else "string")
+            if len(df):
+                writer.write(df[columns])
+                rows += len(df)
+    return rows, duplicates
+
+# === Refresh ===
+def refresh(sources, manifest_path=MANIFEST_FILE, output=CLEAN_FILE, partition_dir=PARTITION_DIR,
+            cache_dir=CACHE_DIR, workers=8, chunksize=None, full=False):
+    """Bring the partitions and the clean dataset up to date; returns the change report."""
+    manifest = read_manifest(manifest_path)
+    previous = manifest["sources"]
+    results = fetch_all(sources, cache_dir, workers)
+    fetched = {result["name"] for result in results}
+
+    report = {"added": [], "changed": [], "removed": [], "unchanged": [], "unavailable": []}
+    current = {}
+    for result in results:
+        name = result["name"]
+        entry = previous.get(name)
+        if full or needs_scrub(entry, result):
+            current[name] = scrub_partition(result, partition_dir, cache_dir, chunksize)
+            report["changed" if entry else "added"].append(name)
+            print(f"[✓] {name}: {current[name]['clean_rows']} clean rows -> {current[name]['state']}")
+        else:
+            current[name] = entry
+            report["unchanged"].append(name)
+
+    # A source that could not be fetched keeps its previous partition.
+    for source in sources:
+        if source["name"] not in fetched and source["name"] in previous:
+            current[source["name"]] = previous[source["name"]]
+            report["unavailable"].append(source["name"])
+
+    for name, entry in previous.items():
+        if name not in current:
+            report["removed"].append(name)
+            if entry.get("state") == "scrubbed" and os.path.exists(entry["partition"]):
+                os.remove(entry["partition"])
+
+    partitions = [current[source["name"]] for source in sources
+                  if source["name"] in current and current[source["name"]]["state"] == "scrubbed"]
+    report["partitions"] = len(partitions)
+    dirty = bool(report["added"] or report["changed"] or report["removed"])
+    report["rebuilt"] = bool(partitions) and (dirty or not os.path.exists(output))
+    if report["rebuilt"]:
+        report["rows"], report["duplicates_dropped"] = assemble(partitions, output)
+    report["finished_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    manifest["sources"] = current
+    manifest["output"] = output
+    manifest["last_refresh"] = report
+    write_manifest(manifest, manifest_path)
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Incrementally refresh the cleaned rent dataset.")
+    parser.add_argument("--ods-url", default=ODS_API_URL,
+                        help="OpenDataSoft JSON export URL (empty string to skip)")
+    parser.add_argument("--csv-url", action="append", dest="csv_urls",
+                        help="data.gouv.fr CSV URL; repeat to replace the default list")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--partition-dir", default=PARTITION_DIR)
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--output", default=CLEAN_FILE)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="scrub each source in batches of this many rows")
+    parser.add_argument("--full", action="store_true",
+                        help="rescrub every source, e.g. after changing the cleaning rules")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.makedirs(args.partition_dir, exist_ok=True)
+
+    sources = build_sources(args.ods_url, args.csv_urls if args.csv_urls is not None else DATA_GOUV_CSV_URLS)
+    print(f"Refreshing {len(sources)} sources with {args.workers} workers...")
+    report = refresh(sources, args.manifest, args.output, args.partition_dir,
+                     args.cache_dir, args.workers, args.chunksize, args.full)
+
+    for state in ["added", "changed", "removed", "unavailable"]:
+        if report[state]:
+            print(f"{state.capitalize()} partitions: {', '.join(report[state])}")
+    if report["rebuilt"]:
+        print(f"Clean dataset rebuilt at '{args.output}' with {report['rows']} rows "
+              f"({report['duplicates_dropped']} duplicate observations dropped).")
+    elif report["partitions"]:
+        print("No source changed; the clean dataset is up to date.")
+    else:
+        print("No usable data collected. Check sources or connection.")
+
+if __name__ == "__main__":
+    main()
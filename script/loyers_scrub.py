@@ -1,89 +1,158 @@
+"""
+loyers_scrub.py
+
+Clean data/loyers_raw.csv into the modelling dataset (data/loyers_clean.*).
+
+Every rule is applied with vectorized pandas operations. With --chunksize the
+raw file is streamed in bounded-memory batches and the clean output is written
+incrementally; the result is the same as processing the whole file at once.
+Raw values are read as text so that parsing never depends on how a chunk
+happens to infer dtypes; the numeric columns are then converted explicitly.
+"""
+
 import os
+import argparse
 import pandas as pd
 
+from loyers_store import DatasetWriter, dataset_path
+
 # Define file paths
 DATA_DIR = "data"
 RAW_FILE = os.path.join(DATA_DIR, "loyers_raw.csv")
-CLEAN_FILE = os.path.join(DATA_DIR, "loyers_clean.csv")
-
-# Check if raw data file exists
-if not os.path.exists(RAW_FILE):
-    print(f"File not found: {RAW_FILE}")
-    exit()
-
-# Load raw data
-df = pd.read_csv(RAW_FILE, delimiter=",", encoding="ISO-8859-1", low_memory=False)
-print("Raw data loaded successfully.")
-print(f"Initial shape: {df.shape}")
+CLEAN_FILE = dataset_path(os.path.join(DATA_DIR, "loyers_clean"))
 
 # Rename important columns
-column_mapping = {
+COLUMN_MAPPING = {
     "loyer_median": "loyer",
     "surface_moyenne": "surface",
     "nombre_pieces_homogene": "nombre_pieces"
 }
-df = df.rename(columns=column_mapping)
-
-# Extract number of rooms from text
-def extract_number_of_rooms(val):
-    if isinstance(val, str):
-        for part in val.split():
-            try:
-                return float(part.replace("P", ""))
-            except:
-                continue
-    try:
-        return float(val)
-    except:
-        return None
+REQUIRED_COLUMNS = ["loyer", "surface", "nombre_pieces"]
+# Other numeric raw columns (matched case-insensitively) and the dtype they
+# get back after being read as text. The dtype is fixed rather than inferred
+# so that every chunk of a streamed file has the same schema.
+NUMERIC_DTYPES = {
+    "nombre_observations": "float64",
+    "nombre_logements": "float64",
+    "data_annee": "Int64"
+}
+
+VALID_EPOQUES = [
+    "1. Avant 1946",
+    "2. Entre 1946-1970",
+    "3. Entre 1971-1990",
+    "4. Entre 1991-2005",
+    "5. Après 2005"
+]
+
+# First whitespace-separated token that Python's float() accepts (after the
+# "P" of "3P" is dropped), e.g. "Appart 3P" -> 3.0, "4P et +" -> 4.0.
+_DIGITS = r"\d(?:_?\d)*"
+_FLOAT_TOKEN = (
+    rf"[+-]?(?:(?:{_DIGITS}\.?(?:{_DIGITS})?|\.{_DIGITS})(?:[eE][+-]?{_DIGITS})?"
+    r"|(?i:inf(?:inity)?|nan))"
+)
+ROOMS_PATTERN = rf"(?:^|\s)({_FLOAT_TOKEN})(?=\s|$)"
+
+def extract_number_of_rooms(values):
+    """Vectorized number of rooms from labels like "Appart 3P"; NaN when none is found."""
+    token = values.astype("string").str.replace("P", "", regex=False).str.extract(ROOMS_PATTERN, expand=False)
+    return pd.to_numeric(token.str.replace("_", "", regex=False), errors="coerce").astype("float64")
+
+def scrub_chunk(df, counts):
+    """Apply every cleaning rule to one batch of raw rows, tallying rows kept per stage."""
+    df = df.rename(columns=COLUMN_MAPPING)
+    df["nombre_pieces"] = extract_number_of_rooms(df["nombre_pieces"])
+    counts["initial"] += len(df)
+
+    # Drop rows with missing values, then rows that are not numeric
+    keep = df[REQUIRED_COLUMNS].notna().all(axis=1)
+    counts["after_dropna"] += int(keep.sum())
+    numeric = {col: pd.to_numeric(df[col], errors="coerce") for col in REQUIRED_COLUMNS}
+    for col in REQUIRED_COLUMNS:
+        keep &= numeric[col].notna()
+    counts["after_numeric"] += int(keep.sum())
+
+    # Filter outliers
+    keep &= numeric["loyer"].between(5, 10000, inclusive="neither")
+    keep &= numeric["surface"].between(5, 500, inclusive="neither")
+    counts["after_outliers"] += int(keep.sum())
 
-df["nombre_pieces"] = df["nombre_pieces"].apply(extract_number_of_rooms)
+    df = df[keep].copy()
+    for col in REQUIRED_COLUMNS:
+        df[col] = numeric[col][keep]
 
-# Check required columns
-required_columns = ["loyer", "surface", "nombre_pieces"]
-for col in required_columns:
-    if col not in df.columns:
-        print(f"Missing required column: {col}")
+    # Standardize categorical column values
+    if "epoque_construction_homogene" in df.columns:
+        epoque = df["epoque_construction_homogene"].str.strip().replace({
+            "2. Entre 1991-2005": "4. Entre 1991-2005"
+        })
+        df["epoque_construction_homogene"] = epoque
+        df = df[epoque.isin(VALID_EPOQUES)]
+
+    # Restore the numeric dtype of the other numeric columns
+    for col in df.columns:
+        dtype = NUMERIC_DTYPES.get(col.strip().lower())
+        if dtype is not None:
+            values = pd.to_numeric(df[col], errors="coerce")
+            df[col] = (values.where(values % 1 == 0) if dtype == "Int64" else values).astype(dtype)
+
+    # Create target variable
+    df["loyer_m2"] = df["loyer"] / df["surface"]
+    counts["final"] += len(df)
+    return df
+
+def scrub_file(raw_file=RAW_FILE, clean_file=CLEAN_FILE, chunksize=None):
+    """Clean raw_file into clean_file, whole or in chunks of `chunksize` rows."""
+    header = pd.read_csv(raw_file, encoding="ISO-8859-1", nrows=0).rename(columns=COLUMN_MAPPING).columns
+    missing = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing:
+        raise KeyError(f"Missing required column: {', '.join(missing)}")
+
+    reader = pd.read_csv(raw_file, delimiter=",", encoding="ISO-8859-1", dtype=str, chunksize=chunksize)
+    chunks = reader if chunksize else [reader]
+
+    counts = dict.fromkeys(["initial", "after_dropna", "after_numeric", "after_outliers", "final"], 0)
+    with DatasetWriter(clean_file) as writer:
+        for chunk in chunks:
+            cleaned = scrub_chunk(chunk, counts)
+            if len(cleaned):
+                writer.write(cleaned)
+    return counts
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clean the raw rent observatory data.")
+    parser.add_argument("--raw", default=RAW_FILE)
+    parser.add_argument("--output", default=CLEAN_FILE,
+                        help="output file; the extension (.parquet, .feather, .csv) selects the format")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="stream the raw file in batches of this many rows")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Check if raw data file exists
+    if not os.path.exists(args.raw):
+        print(f"File not found: {args.raw}")
+        exit()
+
+    try:
+        counts = scrub_file(args.raw, args.output, args.chunksize)
+    except KeyError as e:
+        print(e.args[0])
         exit()
 
-# Drop rows with missing values
-df = df.dropna(subset=required_columns)
-print(f"After dropping rows with missing values: {df.shape}")
-
-# Convert to numeric types
-for col in required_columns:
-    df[col] = pd.to_numeric(df[col], errors="coerce")
-
-df = df.dropna(subset=required_columns)
-print(f"After numeric conversion: {df.shape}")
-
-# Filter outliers
-df = df[(df["loyer"] > 5) & (df["loyer"] < 10000)]
-df = df[(df["surface"] > 5) & (df["surface"] < 500)]
-print(f"After filtering outliers: {df.shape}")
-
-# Standardize categorical column values
-if "epoque_construction_homogene" in df.columns:
-    df["epoque_construction_homogene"] = df["epoque_construction_homogene"].str.strip()
-    df["epoque_construction_homogene"] = df["epoque_construction_homogene"].replace({
-        "2. Entre 1991-2005": "4. Entre 1991-2005"
-    })
-
-    valid_values = [
-        "1. Avant 1946",
-        "2. Entre 1946-1970",
-        "3. Entre 1971-1990",
-        "4. Entre 1991-2005",
-        "5. Après 2005"
-    ]
-    df = df[df["epoque_construction_homogene"].isin(valid_values)]
-
-# Create target variable
-df["loyer_m2"] = df["loyer"] / df["surface"]
-
-# Save cleaned dataset
-if len(df) == 0:
-    print("No data remaining after cleaning. Please review the filters.")
-else:
-    df.to_csv(CLEAN_FILE, index=False, encoding="ISO-8859-1")
-    print(f"Cleaned dataset saved to '{CLEAN_FILE}' with {len(df)} rows.")
+    print(f"Raw rows: {counts['initial']}")
+    print(f"After dropping rows with missing values: {counts['after_dropna']}")
+    print(f"After numeric conversion: {counts['after_numeric']}")
+    print(f"After filtering outliers: {counts['after_outliers']}")
+
+    # Save cleaned dataset
+    if counts["final"] == 0:
+        print("No data remaining after cleaning. Please review the filters.")
+    else:
+        print(f"Cleaned dataset saved to '{args.output}' with {counts['final']} rows.")
+
+if __name__ == "__main__":
+    main()
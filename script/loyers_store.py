@@ -0,0 +1,230 @@
+"""
+loyers_store.py
+
+Typed columnar storage for the rent datasets.
+
+The cleaned dataset is stored as Parquet (or Feather) with a fixed schema:
+categorical dtypes for the string features and float64 for the numeric ones,
+so readers no longer reparse Latin-1 text or re-infer dtypes. `load_dataset`
+is the one loader shared by every consumer; it reads only the requested
+columns and still accepts the legacy CSV files. `iter_dataset` reads the
+same files in bounded-memory chunks.
+
+Parquet and Feather need pyarrow. Without it, datasets are written as CSV.
+"""
+
+import os
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CSV_ENCODING = "ISO-8859-1"
+FORMATS = {".parquet": "parquet", ".feather": "feather", ".csv": "csv"}
+DEFAULT_SUFFIX = ".parquet" if HAS_PYARROW else ".csv"
+
+# Schema of the cleaned dataset
+CATEGORICAL_COLUMNS = [
+    "agglomeration", "zone_complementaire", "type_habitat", "epoque_construction_homogene"
+]
+NUMERIC_COLUMNS = [
+    "loyer", "surface", "nombre_pieces", "nombre_observations", "nombre_logements", "loyer_m2"
+]
+
+def normalize_columns(df):
+    """Strip/lowercase column names; columns that collide once lowercased are merged."""
+    df.columns = df.columns.str.strip().str.lower()
+    if df.columns.duplicated().any():
+        df = pd.DataFrame({
+            name: df.loc[:, df.columns == name].bfill(axis=1).iloc[:, 0]
+            for name in dict.fromkeys(df.columns)
+        })
+    return df
+
+def apply_schema(df):
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    # Any other text column: a proper string dtype, so mixed str/number
+    # columns can be written to Arrow formats.
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("string")
+    return df
+
+def dataset_path(stem, suffix=DEFAULT_SUFFIX):
+    """File path to write a dataset to, in the preferred format."""
+    return stem + suffix
+
+def resolve_path(path):
+    """
+    Return an existing file for `path`. A path without a known extension is
+    a stem: the first of <stem>.parquet, <stem>.feather, <stem>.csv wins.
+    """
+    if os.path.splitext(path)[1] in FORMATS:
+        return path
+    for suffix in FORMATS:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    raise FileNotFoundError(f"No dataset found for '{path}' (tried {', '.join(FORMATS)})")
+
+def _raw_columns(path, fmt):
+    """Column names of an Arrow-format file, as stored."""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+def dataset_columns(path):
+    """Normalized column names of a dataset, read from its schema or header only."""
+    path = resolve_path(path)
+    fmt = FORMATS.get(os.path.splitext(path)[1], "csv")
+    if fmt == "csv":
+        names = pd.read_csv(path, encoding=CSV_ENCODING, nrows=0).columns
+    else:
+        names = _raw_columns(path, fmt)
+    return list(dict.fromkeys(str(name).strip().lower() for name in names))
+
+def write_dataset(df, path):
+    """Write with the schema applied, in the format given by the file extension."""
+    fmt = FORMATS.get(os.path.splitext(path)[1], "csv")
+    if fmt != "csv" and not HAS_PYARROW:
+        raise ImportError(f"Writing {fmt} requires pyarrow. Please install it via 'pip install pyarrow'")
+    df = apply_schema(normalize_columns(df.copy()))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False, encoding=CSV_ENCODING)
+    return path
+
+class DatasetWriter:
+    """
+    Append DataFrame chunks to one dataset file, so a large dataset can be
+    written incrementally with bounded memory. Categorical columns are stored
+    as plain strings (their categories may differ between chunks) and get
+    their dtype back in load_dataset. The file only appears at its final path
+    once closed without error.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = FORMATS.get(os.path.splitext(path)[1], "csv")
+        if self.format != "csv" and not HAS_PYARROW:
+            raise ImportError(f"Writing {self.format} requires pyarrow. Please install it via 'pip install pyarrow'")
+        self.tmp_path = f"{path}.tmp"
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return self
+
+    def write(self, df):
+        df = apply_schema(normalize_columns(df.copy()))
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("string")
+
+        if self.format == "csv":
+            df.to_csv(self.tmp_path, mode="a" if self.rows else "w", header=not self.rows,
+                      index=False, encoding=CSV_ENCODING)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = (pq.ParquetWriter(self.tmp_path, self._schema) if self.format == "parquet"
+                                else pa.ipc.new_file(self.tmp_path, self._schema))
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._writer is not None:
+            self._writer.close()
+        if exc_type is None and self.rows:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        return False
+
+def load_dataset(path, columns=None):
+    """
+    Load a dataset, reading only `columns` (lowercase names) when given.
+    Column names come back stripped and lowercased, with the schema applied.
+    """
+    path = resolve_path(path)
+    fmt = FORMATS.get(os.path.splitext(path)[1], "csv")
+    wanted = [col.lower() for col in columns] if columns is not None else None
+
+    if fmt == "parquet":
+        df = pd.read_parquet(path, columns=wanted)
+    elif fmt == "feather":
+        df = pd.read_feather(path, columns=wanted)
+    else:
+        usecols = (lambda col: col.strip().lower() in wanted) if wanted is not None else None
+        df = pd.read_csv(path, encoding=CSV_ENCODING, usecols=usecols, low_memory=False)
+
+    df = apply_schema(normalize_columns(df))
+    if wanted is not None:
+        missing = [col for col in wanted if col not in df.columns]
+        if missing:
+            raise KeyError(f"Columns not found in {path}: {', '.join(missing)}")
+        df = df[wanted]
+    return df
+
+def iter_dataset(path, columns=None, chunksize=500_000):
+    """
+    Yield a dataset as DataFrames of at most `chunksize` rows, with the same
+    column projection, names and schema as load_dataset. Categorical columns
+    come back with per-chunk categories.
+    """
+    path = resolve_path(path)
+    fmt = FORMATS.get(os.path.splitext(path)[1], "csv")
+    wanted = [col.lower() for col in columns] if columns is not None else None
+    # Arrow formats are projected by their original (not normalized) names.
+    if wanted is not None and fmt != "csv":
+        names = {str(name).strip().lower(): name for name in _raw_columns(path, fmt)}
+        missing = [col for col in wanted if col not in names]
+        if missing:
+            raise KeyError(f"Columns not found in {path}: {', '.join(missing)}")
+        projection = [names[col] for col in wanted]
+    else:
+        projection = None
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        batches = (batch.to_pandas() for batch in
+                   pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=projection))
+    elif fmt == "feather":
+        batches = _feather_chunks(path, projection, chunksize)
+    else:
+        usecols = (lambda col: col.strip().lower() in wanted) if wanted is not None else None
+        batches = pd.read_csv(path, encoding=CSV_ENCODING, usecols=usecols, low_memory=False, chunksize=chunksize)
+
+    for df in batches:
+        df = apply_schema(normalize_columns(df))
+        yield df[wanted] if wanted is not None else df
+
+def _feather_chunks(path, projection, chunksize):
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if projection is not None:
+                batch = batch.select(projection)
+            for start in range(0, batch.num_rows, chunksize):
+                yield batch.slice(start, chunksize).to_pandas()
@@ -0,0 +1,129 @@
+"""
+loyers_synth.py
+
+Generate a synthetic dataset shaped like data/loyers_clean.* for scale
+testing: same columns and dtypes, realistic cardinalities, and a plausible
+loyer_m2 signal, at any row count.
+
+The geography is drawn once from the seed: every agglomeration gets a base
+rent level and its own set of complementary zones, each with a price factor.
+Rows are then generated and written in chunks through DatasetWriter, so
+memory use depends on --chunksize, not on --rows. The same seed, row count
+and chunk size always produce the same file.
+
+loyer_m2 = base(agglomeration) x zone x epoque x habitat type x a falling
+surface curve x log-normal noise, so the models have real structure to fit.
+Every row passes the loyers_scrub filters (loyer and surface within bounds,
+valid epoques).
+
+Usage: python loyers_synth.py --rows 10000000 [--output data/loyers_synth.parquet]
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from loyers_scrub import DATA_DIR, VALID_EPOQUES
+from loyers_store import DatasetWriter, dataset_path
+
+# Define file paths
+SYNTH_FILE = dataset_path(os.path.join(DATA_DIR, "loyers_synth"))
+
+# Cardinalities and proportions
+N_AGGLOMERATIONS = 50
+ZONES_PER_AGGLOMERATION = (1, 12)  # inclusive range
+HABITAT_TYPES = ["appartement", "maison"]
+HABITAT_WEIGHTS = [0.8, 0.2]
+HABITAT_FACTORS = [1.0, 0.85]
+EPOQUE_WEIGHTS = [0.25, 0.25, 0.22, 0.15, 0.13]
+EPOQUE_FACTORS = [1.06, 0.94, 0.96, 1.0, 1.10]
+ROOM_WEIGHTS = {"appartement": [0.25, 0.35, 0.28, 0.12], "maison": [0.03, 0.12, 0.35, 0.50]}
+
+def build_geography(rng, n_agglomerations=N_AGGLOMERATIONS):
+    """Zone table: one row per (agglomeration, zone) with its price level and sampling weight."""
+    rows = []
+    for i in range(n_agglomerations):
+        # Log-normal rent levels: most agglomerations near 10 EUR/m2, a few far above.
+        base = float(np.clip(rng.lognormal(np.log(10.5), 0.25), 6, 30))
+        size = rng.pareto(1.2) + 1  # a few large agglomerations hold most observations
+        n_zones = int(rng.integers(ZONES_PER_AGGLOMERATION[0], ZONES_PER_AGGLOMERATION[1] + 1))
+        for z in range(n_zones):
+            rows.append({
+                "agglomeration": f"Agglomeration {i + 1:03d}",
+                "zone_complementaire": f"L{i + 1:03d}.{z + 1:02d}",
+                "level": base * rng.uniform(0.8, 1.3),
+                "weight": size / n_zones
+            })
+    zones = pd.DataFrame(rows)
+    zones["weight"] /= zones["weight"].sum()
+    return zones
+
+def generate_chunk(rng, zones, n):
+    zone = rng.choice(len(zones), size=n, p=zones["weight"].to_numpy())
+    habitat = rng.choice(len(HABITAT_TYPES), size=n, p=HABITAT_WEIGHTS)
+    epoque = rng.choice(len(VALID_EPOQUES), size=n, p=EPOQUE_WEIGHTS)
+
+    pieces = np.empty(n)
+    for code, name in enumerate(HABITAT_TYPES):
+        mask = habitat == code
+        pieces[mask] = rng.choice([1.0, 2.0, 3.0, 4.0], size=int(mask.sum()), p=ROOM_WEIGHTS[name])
+
+    surface = (12 + 19 * pieces + 15 * habitat) * rng.lognormal(0, 0.18, n)
+    surface = np.round(np.clip(surface, 9, 250), 1)
+
+    loyer_m2 = (zones["level"].to_numpy()[zone]
+                * np.array(EPOQUE_FACTORS)[epoque]
+                * np.array(HABITAT_FACTORS)[habitat]
+                * (surface / 50) ** -0.18
+                * rng.lognormal(0, 0.08, n))
+    loyer = np.round(loyer_m2 * surface, 1)
+
+    nombre_observations = np.clip(np.round(rng.lognormal(3.5, 1.0, n)), 5, 5000)
+    nombre_logements = np.round(nombre_observations * rng.uniform(3, 30, n))
+
+    return pd.DataFrame({
+        "agglomeration": zones["agglomeration"].to_numpy()[zone],
+        "zone_complementaire": zones["zone_complementaire"].to_numpy()[zone],
+        "type_habitat": np.array(HABITAT_TYPES)[habitat],
+        "epoque_construction_homogene": np.array(VALID_EPOQUES)[epoque],
+        "nombre_pieces": pieces,
+        "surface": surface,
+        "loyer": loyer,
+        "nombre_observations": nombre_observations,
+        "nombre_logements": nombre_logements,
+        "loyer_m2": loyer / surface
+    })
+
+def generate(rows, output=SYNTH_FILE, chunksize=500_000, seed=42, agglomerations=N_AGGLOMERATIONS):
+    """Write `rows` synthetic rows to `output`; returns the zone table used."""
+    seeds = np.random.SeedSequence(seed).spawn(2)
+    zones = build_geography(np.random.default_rng(seeds[0]), agglomerations)
+    rng = np.random.default_rng(seeds[1])
+    with DatasetWriter(output) as writer:
+        for start in range(0, rows, chunksize):
+            writer.write(generate_chunk(rng, zones, min(chunksize, rows - start)))
+    return zones
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic loyers_clean-shaped dataset.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--output", default=SYNTH_FILE,
+                        help="output file; the extension (.parquet, .feather, .csv) selects the format")
+    parser.add_argument("--chunksize", type=int, default=500_000, help="rows generated and written at a time")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--agglomerations", type=int, default=N_AGGLOMERATIONS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    zones = generate(args.rows, args.output, args.chunksize, args.seed, args.agglomerations)
+    elapsed = time.perf_counter() - start
+    print(f"[✓] {args.rows} synthetic rows ({zones['agglomeration'].nunique()} agglomerations, "
+          f"{len(zones)} zones) written to '{args.output}' in {elapsed:.1f}s "
+          f"({os.path.getsize(args.output) / 1024 ** 2:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
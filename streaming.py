@@ -0,0 +1,340 @@
+"""
+streaming.py
+
+Out-of-core training: fit the preprocessor and the linear / XGBoost models
+while reading the dataset in chunks, so peak memory depends on the chunk
+size and not on the number of rows.
+
+- train/test split: every row is drawn into the holdout set with a seeded
+  per-chunk generator, so each pass over the file sees the same split.
+- preprocessor: running means and variances (merged chunk by chunk) for
+  the mean imputer and the scaler, category discovery and counts for the
+  most-frequent imputer and the one-hot encoder. The result is the
+  ColumnTransformer of featurize.build_preprocessor with those statistics,
+  so it serves exactly like one fitted in memory.
+- linear models: X'X, X'y and the column sums are accumulated per chunk on
+  sparse features. Least squares is solved from them exactly; the Lasso by
+  coordinate descent on the same Gram matrix. Both come out as ordinary
+  LinearRegression / Lasso instances.
+- XGBoost: an xgboost.DataIter over the transformed chunks feeds an
+  external-memory DMatrix whose pages are cached on disk.
+"""
+
+import os
+import time
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression, Lasso
+
+try:
+    import xgboost as xgb
+    from xgboost import XGBRegressor
+except ImportError:
+    xgb = XGBRegressor = None
+
+from featurize import NUMERICAL_FEATURES, CATEGORICAL_FEATURES, build_preprocessor
+from script.loyers_store import iter_dataset
+
+# Configuration
+TARGET = "loyer_m2"
+CHUNKSIZE = 200_000
+TEST_SIZE = 0.2
+SAMPLE_ROWS = 200_000  # rows kept in memory for the serving metadata
+
+# === Chunks ===
+def iter_chunks(path, chunksize=CHUNKSIZE, test_size=TEST_SIZE, random_state=42):
+    """
+    Yield (X, y, is_test) for every chunk of `path`, prepared like
+    evaluate_models.load_data. `is_test` is a boolean array drawn from a
+    generator seeded with (random_state, chunk number).
+    """
+    columns = NUMERICAL_FEATURES + CATEGORICAL_FEATURES + [TARGET]
+    for i, df in enumerate(iter_dataset(path, columns=columns, chunksize=chunksize)):
+        df = df.dropna(subset=[TARGET])
+        df["nombre_pieces"] = df["nombre_pieces"].astype(str).where(df["nombre_pieces"].notna())
+        is_test = np.random.default_rng([random_state, i]).random(len(df)) < test_size
+        yield df[NUMERICAL_FEATURES + CATEGORICAL_FEATURES], df[TARGET], is_test
+
+def iter_split(path, split, **chunk_options):
+    """(X, y) of the "train" or "test" rows of every chunk."""
+    for X, y, is_test in iter_chunks(path, **chunk_options):
+        keep = is_test if split == "test" else ~is_test
+        if keep.any():
+            yield X[keep], y[keep]
+
+# === Preprocessor ===
+class StreamingPreprocessor:
+    """
+    Accumulates what featurize.build_preprocessor learns in fit(): per
+    numeric column the count, mean and sum of squared deviations of its
+    non-missing values (Chan et al. merge of per-chunk moments), per
+    categorical column the count of every value.
+    """
+    def __init__(self, sparse=True):
+        self.sparse = sparse
+        self.n_rows = 0
+        self.count = np.zeros(len(NUMERICAL_FEATURES))
+        self.mean = np.zeros(len(NUMERICAL_FEATURES))
+        self.m2 = np.zeros(len(NUMERICAL_FEATURES))
+        self.categories = {col: Counter() for col in CATEGORICAL_FEATURES}
+
+    def partial_fit(self, X):
+        self.n_rows += len(X)
+        values = X[NUMERICAL_FEATURES].to_numpy(dtype=np.float64)
+        count = np.sum(~np.isnan(values), axis=0)
+        if count.any():
+            with np.errstate(invalid="ignore"):
+                mean = np.where(count > 0, np.nansum(values, axis=0) / np.maximum(count, 1), 0.0)
+                m2 = np.nansum((values - mean) ** 2, axis=0)
+            total = self.count + count
+            delta = mean - self.mean
+            safe_total = np.maximum(total, 1)
+            self.mean = self.mean + delta * count / safe_total
+            self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe_total
+            self.count = total
+        for col in CATEGORICAL_FEATURES:
+            self.categories[col].update(X[col].dropna().astype(object).value_counts().to_dict())
+        return self
+
+    def build(self):
+        """A fitted ColumnTransformer carrying the accumulated statistics."""
+        categories = {col: sorted(counts) for col, counts in self.categories.items()}
+        empty = [col for col, values in categories.items() if not values]
+        if empty or not self.count.all():
+            raise ValueError(f"No values seen for: {', '.join(empty or NUMERICAL_FEATURES)}")
+
+        # Fit the real transformer on a few rows that contain every category,
+        # then replace the statistics learned from them by the streamed ones.
+        n = max(len(values) for values in categories.values())
+        prototype = pd.DataFrame({
+            **{col: np.arange(n, dtype=np.float64) for col in NUMERICAL_FEATURES},
+            **{col: [values[i % len(values)] for i in range(n)] for col, values in categories.items()}
+        })
+        preprocessor = build_preprocessor(sparse=self.sparse).fit(prototype)
+
+        numeric = preprocessor.named_transformers_["num"]
+        numeric.named_steps["imputer"].statistics_ = self.mean.copy()
+        # The scaler is fitted after imputation: missing values count as rows at the mean.
+        var = self.m2 / self.n_rows
+        scale = np.sqrt(var)
+        scale[scale < 10 * np.finfo(np.float64).eps] = 1.0
+        scaler = numeric.named_steps["scaler"]
+        scaler.mean_, scaler.var_, scaler.scale_ = self.mean.copy(), var, scale
+        scaler.n_samples_seen_ = self.n_rows
+
+        # Most frequent value, ties broken by the smallest one like SimpleImputer.
+        most_frequent = [min(counts.items(), key=lambda item: (-item[1], item[0]))[0]
+                         for counts in self.categories.values()]
+        preprocessor.named_transformers_["cat"].named_steps["imputer"].statistics_ = \
+            np.array(most_frequent, dtype=object)
+        return preprocessor
+
+# === Linear models ===
+class NormalEquations:
+    """Running X'X, X'y, column sums and target moments of the chunks passed to partial_fit."""
+    def __init__(self):
+        self.n = 0
+        self.gram = self.xy = self.x_sum = None
+        self.y_sum = 0.0
+
+    def partial_fit(self, X, y):
+        y = np.asarray(y, dtype=np.float64)
+        gram = X.T @ X
+        gram = gram.toarray() if hasattr(gram, "toarray") else np.asarray(gram)
+        xy = np.asarray(X.T @ y).ravel()
+        x_sum = np.asarray(X.sum(axis=0)).ravel()
+        if self.gram is None:
+            self.gram, self.xy, self.x_sum = gram, xy, x_sum
+        else:
+            self.gram += gram
+            self.xy += xy
+            self.x_sum += x_sum
+        self.n += len(y)
+        self.y_sum += y.sum()
+        return self
+
+    def centered(self):
+        """(X'X, X'y, column means, target mean) of the column-centered problem."""
+        x_mean = self.x_sum / self.n
+        y_mean = self.y_sum / self.n
+        gram = self.gram - self.n * np.outer(x_mean, x_mean)
+        xy = self.xy - self.n * x_mean * y_mean
+        return gram, xy, x_mean, y_mean
+
+def _as_fitted(model, coef, intercept):
+    model.coef_ = coef
+    model.intercept_ = float(intercept)
+    model.n_features_in_ = len(coef)
+    return model
+
+def solve_least_squares(equations, model=None):
+    """LinearRegression fitted from accumulated normal equations (minimum-norm solution, as lstsq)."""
+    gram, xy, x_mean, y_mean = equations.centered()
+    coef = np.linalg.lstsq(gram, xy, rcond=None)[0]
+    return _as_fitted(model if model is not None else LinearRegression(), coef, y_mean - x_mean @ coef)
+
+def solve_lasso(equations, model=None):
+    """
+    Lasso fitted from accumulated normal equations by cyclic coordinate
+    descent on the centered Gram matrix, with the objective, alpha, tol and
+    max_iter of sklearn's Lasso.
+    """
+    model = model if model is not None else Lasso(alpha=0.01)
+    gram, xy, x_mean, y_mean = equations.centered()
+    threshold = model.alpha * equations.n
+    diagonal = np.diag(gram)
+    coef = np.zeros(len(xy))
+    residual = xy.copy()  # X'(y - Xw) for the current coef
+    for n_iter in range(1, model.max_iter + 1):
+        max_update = 0.0
+        for j in np.flatnonzero(diagonal > 0):
+            rho = residual[j] + diagonal[j] * coef[j]
+            new = np.sign(rho) * max(abs(rho) - threshold, 0.0) / diagonal[j]
+            if new != coef[j]:
+                residual -= gram[:, j] * (new - coef[j])
+                max_update = max(max_update, abs(new - coef[j]))
+                coef[j] = new
+        if max_update <= model.tol * max(np.max(np.abs(coef)), 1e-12):
+            break
+    model.n_iter_ = n_iter
+    return _as_fitted(model, coef, y_mean - x_mean @ coef)
+
+# === XGBoost ===
+if xgb is not None:
+    class ChunkIterator(xgb.DataIter):
+        """Transformed training chunks for an external-memory DMatrix, pages cached under `cache_dir`."""
+        def __init__(self, make_chunks, preprocessor, cache_dir):
+            self.make_chunks = make_chunks
+            self.preprocessor = preprocessor
+            self._chunks = None
+            super().__init__(cache_prefix=os.path.join(cache_dir, "train"))
+
+        def next(self, input_data):
+            if self._chunks is None:
+                self._chunks = iter(self.make_chunks())
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            X, y = chunk
+            input_data(data=self.preprocessor.transform(X), label=y.to_numpy(dtype=np.float64))
+            return True
+
+        def reset(self):
+            self._chunks = None
+
+def train_xgboost(make_chunks, preprocessor, model=None):
+    """
+    XGBRegressor trained with the parameters of `model` through an
+    external-memory DMatrix built from `make_chunks()`, an iterable of (X, y).
+    """
+    if xgb is None:
+        raise ImportError("XGBoost is required for streaming XGBoost training")
+    model = model if model is not None else XGBRegressor(n_estimators=100, random_state=42, verbosity=0)
+    params = {key: value for key, value in model.get_xgb_params().items() if value is not None}
+    params["tree_method"] = "hist"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        data = xgb.ExtMemQuantileDMatrix(ChunkIterator(make_chunks, preprocessor, cache_dir),
+                                         max_bin=params.get("max_bin", 256))
+        booster = xgb.train(params, data, num_boost_round=model.get_params()["n_estimators"] or 100)
+    model.load_model(booster.save_raw("json"))
+    return model
+
+# === Training ===
+class _NoMemory:
+    """Stand-in memory meter of train_streaming when none is given."""
+    peak_mb = float("nan")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+def _is_linear(model):
+    return isinstance(model, (LinearRegression, Lasso))
+
+def _sample(kept, X, y, rng, size):
+    """Bottom-k of uniform keys: a uniform sample of `size` rows over all chunks seen so far."""
+    frame = X.assign(**{TARGET: y.to_numpy()}, _key=rng.random(len(X)))
+    frame = pd.concat([kept, frame]) if kept is not None else frame
+    return frame.nsmallest(size, "_key") if len(frame) > size else frame
+
+def train_streaming(path, regressors, chunksize=CHUNKSIZE, sample_rows=SAMPLE_ROWS, random_state=42, memory=None):
+    """
+    Fit a sparse preprocessor and every regressor of `regressors` ({name:
+    unfitted LinearRegression, Lasso or XGBRegressor}) out of core, then
+    score them on the streamed holdout rows. `memory` (e.g.
+    evaluate_models.MemorySampler) makes context managers whose `peak_mb`
+    is recorded per fit as fit_peak_mb; without it that column is NaN.
+
+    Returns (preprocessor, {name: fitted regressor}, metrics DataFrame,
+    sample) where `sample` is a uniform sample of at most `sample_rows`
+    rows (features and target) for what still needs an in-memory frame.
+    """
+    unsupported = [name for name, model in regressors.items()
+                   if not _is_linear(model) and not (XGBRegressor is not None and isinstance(model, XGBRegressor))]
+    if unsupported:
+        raise ValueError(f"No streaming training for: {', '.join(unsupported)}")
+    options = {"chunksize": chunksize, "random_state": random_state}
+
+    print("[INFO] Pass 1: preprocessor statistics...")
+    stats, sample = StreamingPreprocessor(sparse=True), None
+    rng = np.random.default_rng(random_state)
+    for X, y, is_test in iter_chunks(path, **options):
+        stats.partial_fit(X[~is_test])
+        sample = _sample(sample, X, y, rng, sample_rows)
+    preprocessor = stats.build()
+    print(f"[✓] {stats.n_rows} training rows, {len(preprocessor.get_feature_names_out())} features")
+
+    # Wall and CPU seconds and peak memory per model; the linear models share
+    # the cost of pass 2 (their peak is the higher of pass 2 and their solve).
+    fitted, timings, peaks = {}, {}, {}
+    meter = memory if memory is not None else _NoMemory
+    linear = {name: model for name, model in regressors.items() if _is_linear(model)}
+    if linear:
+        print("[INFO] Pass 2: normal equations for the linear models...")
+        start, cpu_start = time.perf_counter(), time.process_time()
+        with meter() as shared_memory:
+            equations = NormalEquations()
+            for X, y in iter_split(path, "train", **options):
+                equations.partial_fit(preprocessor.transform(X), y)
+        shared = np.array([time.perf_counter() - start, time.process_time() - cpu_start])
+        for name, model in linear.items():
+            start, cpu_start = time.perf_counter(), time.process_time()
+            solve = solve_least_squares if isinstance(model, LinearRegression) else solve_lasso
+            with meter() as solve_memory:
+                fitted[name] = solve(equations, model)
+            timings[name] = shared + [time.perf_counter() - start, time.process_time() - cpu_start]
+            peaks[name] = max(shared_memory.peak_mb, solve_memory.peak_mb)
+            print(f"[✓] {name} solved")
+    for name, model in regressors.items():
+        if name not in fitted:
+            print(f"[INFO] {name}: external-memory training...")
+            start, cpu_start = time.perf_counter(), time.process_time()
+            with meter() as fit_memory:
+                fitted[name] = train_xgboost(lambda: iter_split(path, "train", **options), preprocessor, model)
+            timings[name] = np.array([time.perf_counter() - start, time.process_time() - cpu_start])
+            peaks[name] = fit_memory.peak_mb
+            print(f"[✓] {name} trained")
+
+    print("[INFO] Scoring the holdout rows...")
+    totals = {name: np.zeros(3) for name in fitted}  # absolute error, squared error, count
+    y_sum = y_sq = 0.0
+    for X, y in iter_split(path, "test", **options):
+        features, y = preprocessor.transform(X), y.to_numpy(dtype=np.float64)
+        y_sum, y_sq = y_sum + y.sum(), y_sq + (y ** 2).sum()
+        for name, model in fitted.items():
+            error = y - model.predict(features)
+            totals[name] += [np.abs(error).sum(), (error ** 2).sum(), len(y)]
+    rows = []
+    for name, (absolute, squared, n) in totals.items():
+        total_ss = y_sq - y_sum ** 2 / n
+        rows.append({"model": name, "MAE": absolute / n, "RMSE": np.sqrt(squared / n),
+                     "R2": 1 - squared / total_ss, "test_rows": int(n),
+                     "fit_seconds": timings[name][0], "fit_cpu_seconds": timings[name][1],
+                     "fit_peak_mb": peaks[name]})
+    sample = sample.drop(columns="_key").reset_index(drop=True)
+    return preprocessor, fitted, pd.DataFrame(rows), sample
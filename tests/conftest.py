@@ -0,0 +1,49 @@
+"""
+Shared fixtures: a small synthetic dataset shaped like evaluate_models.load_data.
+
+The repository modules import each other flat (flask_app/ and script/ are
+directories, not packages), so their directories go on sys.path the same
+way the benchmarks do it.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (ROOT, os.path.join(ROOT, "script"), os.path.join(ROOT, "flask_app")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from featurize import NUMERICAL_FEATURES, CATEGORICAL_FEATURES  # noqa: E402
+from loyers_synth import build_geography, generate_chunk  # noqa: E402
+
+FEATURES = NUMERICAL_FEATURES + CATEGORICAL_FEATURES
+ROWS = 3000
+
+
+def synthetic_frame(rows=ROWS, seed=0, missing=0.03):
+    """Modelling frame (features + loyer_m2) with a few missing counts and room numbers."""
+    rng = np.random.default_rng(seed)
+    df = generate_chunk(rng, build_geography(rng, n_agglomerations=6), rows)
+    for col in ["nombre_observations", "nombre_logements", "nombre_pieces"]:
+        df.loc[rng.random(rows) < missing, col] = np.nan
+    df["nombre_pieces"] = df["nombre_pieces"].astype(str).where(df["nombre_pieces"].notna())
+    return df[FEATURES + ["loyer_m2"]]
+
+
+@pytest.fixture(scope="session")
+def rents():
+    return synthetic_frame()
+
+
+@pytest.fixture(scope="session")
+def X(rents):
+    return rents[FEATURES]
+
+
+@pytest.fixture(scope="session")
+def y(rents):
+    return rents["loyer_m2"]
@@ -0,0 +1,117 @@
+import contextlib
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batcher import MicroBatcher
+
+THREADS = 32
+
+
+class EchoModel:
+    """Stands in for a ServingModel: the prediction of a row is a function of its id."""
+
+    def __init__(self, offset=0.0, delay=0.005):
+        self.offset = offset
+        self.delay = delay
+        self.batch_sizes = []
+
+    def predict_rows(self, rows):
+        self.batch_sizes.append(len(rows))
+        time.sleep(self.delay)  # lets the next requests queue up behind this batch
+        return np.array([row["id"] * 10.0 + self.offset for row in rows])
+
+
+class FailingModel:
+    def predict_rows(self, rows):
+        raise ValueError("bad batch")
+
+
+def run_concurrently(batcher, requests):
+    """predict() every (serving, row) from its own thread; returns the results in request order."""
+    results = [None] * len(requests)
+    start = threading.Barrier(len(requests))
+
+    def call(i, serving, row):
+        try:
+            start.wait()
+            results[i] = batcher.predict(serving, row)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, serving, row)) for i, (serving, row) in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return results
+
+
+def test_every_caller_gets_its_own_prediction():
+    batcher = MicroBatcher(max_batch=8, max_wait_ms=50)
+    model = EchoModel()
+    results = run_concurrently(batcher, [(model, {"id": i}) for i in range(THREADS)])
+    assert results == [i * 10.0 for i in range(THREADS)]
+    # Rows were actually coalesced, and no batch exceeded max_batch.
+    assert sum(model.batch_sizes) == THREADS
+    assert max(model.batch_sizes) > 1
+    assert max(model.batch_sizes) <= 8
+
+
+def test_rows_of_different_models_are_scored_by_their_own_model():
+    batcher = MicroBatcher(max_batch=64, max_wait_ms=50)
+    old, new = EchoModel(offset=0.0), EchoModel(offset=0.5)
+    requests = [(old if i % 2 else new, {"id": i}) for i in range(THREADS)]
+    results = run_concurrently(batcher, requests)
+    assert results == [i * 10.0 + (0.0 if i % 2 else 0.5) for i in range(THREADS)]
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    batcher = MicroBatcher(max_batch=64, max_wait_ms=50)
+    results = run_concurrently(batcher, [(FailingModel(), {"id": i}) for i in range(4)])
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_disabled_batcher_scores_inline():
+    batcher = MicroBatcher(max_batch=1)
+    model = EchoModel(delay=0)
+    assert batcher.predict(model, {"id": 3}) == pytest.approx(30.0)
+    assert model.batch_sizes == [1]
+    assert batcher.batches == 0
+
+
+class BrokenHistogram:
+    """A stage_seconds whose observe() fails, as a metrics bug in the batching thread would."""
+
+    def time(self, stage):
+        return contextlib.nullcontext()
+
+    def observe(self, value, *labels):
+        raise RuntimeError("metrics are broken")
+
+
+def test_batching_thread_survives_errors_outside_scoring():
+    batcher = MicroBatcher(max_batch=8, max_wait_ms=1, timeout_s=5, stage_seconds=BrokenHistogram())
+    model = EchoModel(delay=0)
+    model.transform_rows = lambda rows: rows
+    model.predict_matrix = model.predict_rows
+    assert batcher.predict(model, {"id": 1}) == 10.0
+    assert batcher.predict(model, {"id": 2}) == 20.0
+    assert batcher.failures == 2
+    assert batcher.timeouts == 0
+
+
+def test_a_row_not_scored_in_time_is_scored_by_its_caller():
+    batcher = MicroBatcher(max_batch=8, max_wait_ms=1, timeout_s=0.05)
+    model = EchoModel(delay=0.5)
+    assert batcher.predict(model, {"id": 4}) == 40.0
+    assert batcher.timeouts == 1
+
+
+def test_a_lone_prediction_does_not_wait_for_the_window():
+    batcher = MicroBatcher(max_batch=8, max_wait_ms=2000)
+    start = time.perf_counter()
+    assert batcher.predict(EchoModel(delay=0), {"id": 5}) == 50.0
+    assert time.perf_counter() - start < 1
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+import compaction
+from featurize import build_preprocessor
+
+
+@pytest.fixture(scope="module")
+def fitted(X, y):
+    features = build_preprocessor().fit_transform(X)
+    forest = RandomForestRegressor(n_estimators=6, max_depth=10, random_state=42).fit(features, y)
+    return forest, features, y.to_numpy()
+
+
+@pytest.mark.skipif(not compaction.tree_state_supported(), reason="tree surgery needs the supported scikit-learn")
+def test_pruning_keeps_the_trees_it_does_not_cut(fitted):
+    forest, features, _ = fitted
+    np.testing.assert_array_equal(compaction.cap_depth(forest, 64).predict(features), forest.predict(features))
+    np.testing.assert_array_equal(compaction.merge_leaves(forest, 0.0).predict(features), forest.predict(features))
+    capped = compaction.cap_depth(forest, 3)
+    assert all(e.tree_.max_depth <= 3 for e in capped.estimators_)
+
+
+def test_candidates_without_tree_surgery_skip_pruning(fitted, monkeypatch):
+    forest, features, y = fitted
+    monkeypatch.setattr(compaction, "TREE_STATE_SKLEARN", (0, 0))
+    monkeypatch.setattr(compaction, "XGBRegressor", None)
+    candidates = compaction.compaction_candidates(forest, features, features[:500], y[:500])
+    assert set(candidates) == {"full"} | {f"trees_{n}" for n in compaction.TREE_COUNTS}
+
+
+class Compacted(Exception):
+    pass
+
+
+def test_compaction_uses_the_recorded_holdout_and_refuses_a_full_refit(X, y, fitted, tmp_path, monkeypatch, capsys):
+    import evaluate_models
+    from sklearn.model_selection import train_test_split
+
+    def compact_forest(pipeline, X_train, X_holdout, y_holdout):
+        raise Compacted(X_holdout.index)
+
+    monkeypatch.chdir(tmp_path)  # MODEL_DIR is relative
+    monkeypatch.setattr(evaluate_models, "compact_forest", compact_forest)
+    forest, _, _ = fitted
+    pipeline = evaluate_models.assemble_pipeline(build_preprocessor().fit(X), forest)
+
+    evaluate_models.save_model(pipeline, "random_forest", training={"fitted_on": "all", "rows": len(X)})
+    evaluate_models.run_compaction(X, y)
+    assert "[SKIP]" in capsys.readouterr().out
+
+    training = evaluate_models.holdout_training(X, random_state=7)
+    evaluate_models.save_model(pipeline, "random_forest", training=training)
+    with pytest.raises(Compacted) as holdout:
+        evaluate_models.run_compaction(X, y)
+    expected = train_test_split(X, test_size=0.2, random_state=7)[1].index
+    assert holdout.value.args[0].equals(expected)
@@ -0,0 +1,33 @@
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+
+from featurize import build_preprocessor
+from incremental import incremental_retrain
+from inference import compile_model
+
+
+def test_widened_forest_keeps_its_trees_and_serves_exactly(X, y):
+    # The first rows miss one agglomeration, which then arrives with the new rows.
+    unseen = X["agglomeration"].value_counts().index[-1]
+    old = (X["agglomeration"] != unseen).to_numpy()
+    old[len(X) // 2:] = False
+    pipeline = Pipeline([
+        ("preprocessor", build_preprocessor(sparse=True)),
+        ("regressor", RandomForestRegressor(n_estimators=5, max_depth=8, random_state=42))
+    ]).fit(X[old], y[old])
+
+    updated = incremental_retrain(pipeline, X[~old], y[~old], n_new=3)
+    preprocessor, forest = updated.named_steps["preprocessor"], updated.named_steps["regressor"]
+    features = preprocessor.transform(X)
+    assert features.shape[1] > pipeline.named_steps["preprocessor"].transform(X).shape[1]
+    assert len(forest.estimators_) == 8
+
+    # The original trees still predict what they did, reading the same columns.
+    before = pipeline.named_steps["regressor"].estimators_[0].predict(pipeline.named_steps["preprocessor"].transform(X))
+    np.testing.assert_array_equal(forest.estimators_[0].predict(features), before)
+
+    compiled = compile_model(preprocessor, forest)
+    sample = X.head(30)
+    expected = [updated.predict(sample.iloc[[i]])[0] for i in range(len(sample))]
+    np.testing.assert_array_equal([compiled.predict_one(row) for row in sample.to_dict(orient="records")], expected)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Lasso
+
+from featurize import build_preprocessor
+from inference import compile_model
+
+try:
+    from xgboost import XGBRegressor
+except ImportError:
+    XGBRegressor = None
+
+REGRESSORS = {
+    "linear_regression": lambda: LinearRegression(),
+    "lasso": lambda: Lasso(alpha=0.01),
+    "random_forest": lambda: RandomForestRegressor(n_estimators=10, max_depth=10, random_state=42),
+    "xgboost": lambda: XGBRegressor(n_estimators=20, learning_rate=0.1, random_state=42, verbosity=0)
+}
+ROWS = 60
+
+
+@pytest.mark.parametrize("sparse", [False, True], ids=["dense", "sparse"])
+@pytest.mark.parametrize("name", list(REGRESSORS))
+def test_compiled_matches_sklearn_exactly(X, y, name, sparse):
+    if name == "xgboost" and XGBRegressor is None:
+        pytest.skip("xgboost is not installed")
+    preprocessor = build_preprocessor(sparse=sparse).fit(X)
+    regressor = REGRESSORS[name]().fit(preprocessor.transform(X), y)
+    compiled = compile_model(preprocessor, regressor)
+    assert compiled is not None
+
+    sample = X.tail(ROWS).copy()
+    # Unknown categories are ignored by the encoder, missing values imputed.
+    sample.iloc[0, sample.columns.get_loc("agglomeration")] = "Nowhere"
+    sample.iloc[1, sample.columns.get_loc("surface")] = np.nan
+    sample.iloc[2, sample.columns.get_loc("type_habitat")] = np.nan
+
+    expected = np.array([regressor.predict(preprocessor.transform(sample.iloc[[i]]))[0]
+                         for i in range(len(sample))])
+    records = sample.to_dict(orient="records")
+    np.testing.assert_array_equal([compiled.predict_one(row) for row in records], expected)
+    # A batch goes through one matrix product, like the pipeline on the same batch.
+    batch = regressor.predict(preprocessor.transform(sample))
+    np.testing.assert_array_equal(compiled.predict_rows(records), batch)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from featurize import NUMERICAL_FEATURES, build_preprocessor
+from grid import PredictionGrid
+from prediction_grid import HELD_COLUMNS, build_grid, imputed_values
+
+ROWS = 200
+
+
+@pytest.fixture(scope="module")
+def model(X, y):
+    preprocessor = build_preprocessor().fit(X)
+    regressor = RandomForestRegressor(n_estimators=10, max_depth=10, random_state=42)
+    regressor.fit(preprocessor.transform(X), y)
+    return lambda df: regressor.predict(preprocessor.transform(df)), preprocessor
+
+
+@pytest.fixture(scope="module")
+def grid(X, model, tmp_path_factory):
+    predict, preprocessor = model
+    directory = tmp_path_factory.mktemp("grids")
+    build_grid(predict, X, "v1", imputed_values(preprocessor), directory=str(directory), surface_points=12)
+    return PredictionGrid.open(str(directory), "v1")
+
+
+def grid_rows(X, grid):
+    """Observed category combinations at grid surfaces, with the counts missing."""
+    rows = X.dropna().head(ROWS).copy()
+    rows["surface"] = np.resize(grid.surfaces, len(rows))
+    rows[HELD_COLUMNS] = np.nan
+    return rows
+
+
+def test_held_values_are_the_imputed_ones(grid, model):
+    _, preprocessor = model
+    means = preprocessor.named_transformers_["num"].named_steps["imputer"].statistics_
+    expected = {col: mean for col, mean in zip(NUMERICAL_FEATURES, means) if col in HELD_COLUMNS}
+    assert grid.held == pytest.approx(expected)
+
+
+def test_grid_agrees_with_the_model_when_counts_are_missing(X, grid, model):
+    predict, _ = model
+    rows = grid_rows(X, grid)
+    expected = predict(rows).astype(np.float32)
+    looked_up = [grid.lookup(row) for row in rows.to_dict(orient="records")]
+    np.testing.assert_allclose(looked_up, expected, rtol=1e-6)
+
+
+def test_grid_agrees_with_the_model_at_the_held_counts(X, grid, model):
+    predict, _ = model
+    rows = grid_rows(X, grid).assign(**grid.held)
+    looked_up = [grid.lookup(row) for row in rows.to_dict(orient="records")]
+    np.testing.assert_allclose(looked_up, predict(rows).astype(np.float32), rtol=1e-6)
+
+
+def test_rows_off_the_grid_are_not_looked_up(X, grid):
+    row = grid_rows(X, grid).iloc[0].to_dict()
+    assert grid.lookup({**row, "nombre_observations": grid.held["nombre_observations"] + 1}) is None
+    assert grid.lookup({**row, "agglomeration": "Nowhere"}) is None
+    assert grid.lookup({**row, "surface": grid.surfaces[-1] * 2}) is None
+    assert grid.lookup(row) is not None
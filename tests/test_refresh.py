@@ -0,0 +1,29 @@
+import pandas as pd
+
+from loyers_refresh import assemble
+from loyers_store import dataset_columns, load_dataset, write_dataset
+
+
+def partition(tmp_path, name, rows):
+    """A scrubbed partition of `rows` (data_annee, agglomeration, loyer) and its manifest entry."""
+    path = str(tmp_path / f"{name}.parquet")
+    df = pd.DataFrame(rows, columns=["data_annee", "agglomeration", "loyer"])
+    write_dataset(df.assign(data_annee=df["data_annee"].astype("Int64"), type_habitat="appartement"), path)
+    return {"partition": path, "columns": dataset_columns(path)}
+
+
+def test_assemble_keeps_every_year_and_drops_only_true_repeats(tmp_path):
+    entries = [
+        partition(tmp_path, "2021", [(2021, "Paris", 900.0), (2021, "Lyon", 600.0)]),
+        # Same segments a year later, plus a corrected 2021 Lyon row.
+        partition(tmp_path, "2022", [(2022, "Paris", 950.0), (2022, "Lyon", 620.0), (2021, "Lyon", 610.0)])
+    ]
+    output = str(tmp_path / "clean.parquet")
+    rows, duplicates = assemble(entries, output)
+
+    clean = load_dataset(output)
+    assert (rows, duplicates) == (4, 1)
+    found = {(int(year), str(agglomeration)): loyer
+             for year, agglomeration, loyer in clean[["data_annee", "agglomeration", "loyer"]].itertuples(index=False)}
+    assert found == {(2021, "Paris"): 900.0, (2022, "Paris"): 950.0,
+                     (2022, "Lyon"): 620.0, (2021, "Lyon"): 610.0}
@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+
+from loyers_scrub import scrub_file
+
+HEADER = ("agglomeration,Zone_complementaire,Type_habitat,epoque_construction_homogene,"
+          "nombre_pieces_homogene,surface_moyenne,loyer_median,nombre_observations,nombre_logements,Data_annee")
+RAW_ROWS = [
+    "A,Z1,appartement,1. Avant 1946,Appart 1P,30,600,10,100,2021",
+    "A,Z1,maison,2. Entre 1991-2005,Maison 4P et +,120,1200,5,40,2022",  # mislabelled epoque
+    "A,Z2,appartement, 3. Entre 1971-1990 ,Appart 2P,45.5,800.5,7,70,2021",  # padded epoque
+    "B,Z3,appartement,5. Après 2005,Appart 3P,,700,1,1,2021",  # missing surface
+    "B,Z3,appartement,5. Après 2005,Appart 3P,abc,700,1,1,2021",  # non-numeric surface
+    "B,Z3,appartement,5. Après 2005,Studio,30,700,1,1,2021",  # no room count
+    "B,Z3,appartement,5. Après 2005,Appart 2P,600,700,1,1,2021",  # surface outlier
+    "B,Z3,appartement,5. Après 2005,Appart 2P,50,4,1,1,2021",  # rent outlier
+    "B,Z3,appartement,6. Inconnue,Appart 2P,50,700,1,1,2021",  # unknown epoque
+    "B,Z4,maison,4. Entre 1991-2005,3,80,900,,,2020",  # bare room count, missing counts
+]
+
+
+def baseline_scrub(raw_file):
+    """The original whole-file, row-by-row scrub, kept as the reference."""
+    df = pd.read_csv(raw_file, delimiter=",", encoding="ISO-8859-1", low_memory=False)
+    df = df.rename(columns={"loyer_median": "loyer", "surface_moyenne": "surface",
+                            "nombre_pieces_homogene": "nombre_pieces"})
+
+    def extract_number_of_rooms(val):
+        if isinstance(val, str):
+            for part in val.split():
+                try:
+                    return float(part.replace("P", ""))
+                except ValueError:
+                    continue
+        try:
+            return float(val)
+        except (TypeError, ValueError):
+            return None
+
+    df["nombre_pieces"] = df["nombre_pieces"].apply(extract_number_of_rooms)
+    required_columns = ["loyer", "surface", "nombre_pieces"]
+    df = df.dropna(subset=required_columns)
+    for col in required_columns:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = df.dropna(subset=required_columns)
+    df = df[(df["loyer"] > 5) & (df["loyer"] < 10000)]
+    df = df[(df["surface"] > 5) & (df["surface"] < 500)]
+    df["epoque_construction_homogene"] = df["epoque_construction_homogene"].str.strip().replace({
+        "2. Entre 1991-2005": "4. Entre 1991-2005"
+    })
+    valid = ["1. Avant 1946", "2. Entre 1946-1970", "3. Entre 1971-1990", "4. Entre 1991-2005", "5. Après 2005"]
+    df = df[df["epoque_construction_homogene"].isin(valid)]
+    df["loyer_m2"] = df["loyer"] / df["surface"]
+    return df
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    path = tmp_path / "loyers_raw.csv"
+    path.write_text("\n".join([HEADER] + RAW_ROWS * 3) + "\n", encoding="ISO-8859-1")
+    return str(path)
+
+
+def read_csv(path):
+    return pd.read_csv(path, encoding="ISO-8859-1")
+
+
+def test_scrub_matches_the_original_row_by_row_rules(raw_file, tmp_path):
+    expected_path = str(tmp_path / "expected.csv")
+    expected = baseline_scrub(raw_file)
+    expected.columns = expected.columns.str.lower()
+    expected.to_csv(expected_path, index=False, encoding="ISO-8859-1")
+
+    counts = scrub_file(raw_file, str(tmp_path / "clean.csv"))
+    assert counts["final"] == len(expected) == 12
+    pd.testing.assert_frame_equal(read_csv(tmp_path / "clean.csv"), read_csv(expected_path))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_chunked_scrub_matches_whole_file(raw_file, tmp_path, suffix):
+    whole_counts = scrub_file(raw_file, str(tmp_path / f"whole{suffix}"))
+    chunked_counts = scrub_file(raw_file, str(tmp_path / f"chunked{suffix}"), chunksize=4)
+    assert chunked_counts == whole_counts
+    read = read_csv if suffix == ".csv" else pd.read_parquet
+    pd.testing.assert_frame_equal(read(tmp_path / f"chunked{suffix}"), read(tmp_path / f"whole{suffix}"))
+
+
+def test_non_model_numeric_columns_stay_numeric(raw_file, tmp_path):
+    scrub_file(raw_file, str(tmp_path / "clean.parquet"), chunksize=4)
+    clean = pd.read_parquet(tmp_path / "clean.parquet")
+    assert clean["data_annee"].dtype == "Int64"
+    assert clean["nombre_observations"].dtype == "float64"
+    assert clean["data_annee"].tolist() == [2021, 2022, 2021, 2020] * 3
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression, Lasso
+
+from featurize import build_preprocessor
+from script.loyers_store import write_dataset
+from streaming import iter_split, train_streaming
+
+CHUNKSIZE = 700
+
+
+@pytest.fixture(scope="module")
+def dataset(rents, tmp_path_factory):
+    """The synthetic rows as a stored dataset (nombre_pieces numeric, as loyers_clean has it)."""
+    path = str(tmp_path_factory.mktemp("data") / "rents.parquet")
+    write_dataset(rents.assign(nombre_pieces=pd.to_numeric(rents["nombre_pieces"])), path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def split(dataset):
+    """The streamed train and test rows, gathered in memory."""
+    train = [pd.concat(parts) for parts in zip(*iter_split(dataset, "train", chunksize=CHUNKSIZE))]
+    test = [pd.concat(parts) for parts in zip(*iter_split(dataset, "test", chunksize=CHUNKSIZE))]
+    return train, test
+
+
+@pytest.fixture(scope="module")
+def streamed(dataset):
+    regressors = {"linear_regression": LinearRegression(), "lasso": Lasso(alpha=0.01)}
+    return train_streaming(dataset, regressors, chunksize=CHUNKSIZE, sample_rows=500)
+
+
+def test_streamed_preprocessor_matches_in_memory_fit(split, streamed):
+    (X_train, _), (X_test, _) = split
+    preprocessor = streamed[0]
+    reference = build_preprocessor(sparse=True).fit(X_train)
+    np.testing.assert_allclose(preprocessor.transform(X_test).toarray(), reference.transform(X_test).toarray(),
+                               rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("name, regressor", [("linear_regression", LinearRegression()),
+                                             ("lasso", Lasso(alpha=0.01))])
+def test_streamed_linear_models_match_in_memory_fit(split, streamed, name, regressor):
+    (X_train, y_train), (X_test, _) = split
+    preprocessor, fitted, metrics, _ = streamed
+    reference = build_preprocessor(sparse=True).fit(X_train)
+    regressor.fit(reference.transform(X_train), y_train)
+    expected = regressor.predict(reference.transform(X_test))
+    # Different solvers (lsqr / sklearn's coordinate descent) stop at different points within their tolerance.
+    np.testing.assert_allclose(fitted[name].predict(preprocessor.transform(X_test)), expected, atol=5e-3)
+
+
+def test_holdout_metrics_cover_the_streamed_test_rows(split, streamed):
+    _, (X_test, y_test) = split
+    preprocessor, fitted, metrics, sample = streamed
+    assert (metrics["test_rows"] == len(X_test)).all()
+    rmse = np.sqrt(np.mean((y_test - fitted["lasso"].predict(preprocessor.transform(X_test))) ** 2))
+    assert metrics.set_index("model").loc["lasso", "RMSE"] == pytest.approx(rmse)
+    assert len(sample) == 500
+
+
+def test_fit_memory_is_measured_per_model(dataset, streamed):
+    assert streamed[2]["fit_peak_mb"].isna().all()
+
+    class Meter:
+        """Reports 10, 20, 30... MB for successive measured blocks."""
+        blocks = 0
+
+        def __enter__(self):
+            Meter.blocks += 1
+            self.peak_mb = 10.0 * Meter.blocks
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+    regressors = {"linear_regression": LinearRegression(), "lasso": Lasso(alpha=0.01)}
+    metrics = train_streaming(dataset, regressors, chunksize=CHUNKSIZE, sample_rows=500, memory=Meter)[2]
+    # Pass 2 is block 1, then one block per solve.
+    assert metrics.set_index("model")["fit_peak_mb"].to_dict() == {"linear_regression": 20.0, "lasso": 30.0}